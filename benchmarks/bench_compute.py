@@ -0,0 +1,467 @@
+"""
+計算パスのベンチマーク（回帰チェック付き）
+
+タブ1の複数手法算定・DCF予測・感度分析グリッド・タブ3のシミュレーターと売却時の分配・
+タブ4のシナリオ比較とスイープ・レポート作成・グラフの間引きを、企業数（1 / 1,000 / 100,000社）や
+グリッドの大きさを変えて計測する。結果は JSON に保存でき、ベースラインの
+JSON と比べて閾値を超えて遅くなったケースがあれば終了コード1で終わる。
+
+AI呼び出しはスタブのクライアントに置き換えるため、ネットワークなしで動き、
+応答待ちの時間は計測に含まれない。
+
+使い方:
+    python benchmarks/bench_compute.py -o baseline.json
+    python benchmarks/bench_compute.py --baseline baseline.json --threshold 0.25
+    python benchmarks/bench_compute.py -k dcf -k sensitivity
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capital_app.admission import AdmissionController  # noqa: E402
+from capital_app.llm import generate_all  # noqa: E402
+from capital_app.prompts import (  # noqa: E402
+    analysis_prompt,
+    company_profile,
+    interpretation_prompt,
+    system_prompt,
+    valuation_prompt,
+)
+from capital_core import (  # noqa: E402
+    METHODS,
+    compare_funding_options,
+    compare_scenarios,
+    dcf_kernel,
+    implied_wacc,
+    industry_table,
+    monte_carlo,
+    project_paths,
+    run_scenarios,
+    sensitivity_axes,
+    sensitivity_surface,
+    sweep_frontier,
+    sweep_scenarios,
+    top_scenarios,
+    value_companies,
+)
+from capital_core.captable import build_cap_table, exit_waterfall  # noqa: E402
+from capital_core.comparison import FUNDING_SCENARIOS  # noqa: E402
+from capital_core.simulation import simulate  # noqa: E402
+
+SCALES = (1, 1_000, 100_000)
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEAT = 7
+DEFAULT_MIN_TIME = 0.05
+
+
+class StubAnthropic:
+    """messages.stream だけを持つ、即座に固定の応答を返すクライアント。"""
+
+    class _Usage:
+        input_tokens = 1000
+        output_tokens = 200
+        cache_creation_input_tokens = 0
+        cache_read_input_tokens = 0
+
+    class _Message:
+        def __init__(self, usage):
+            self.usage = usage
+
+    class _Stream:
+        def __init__(self, text):
+            self.text_stream = iter(text[i:i + 16] for i in range(0, len(text), 16))
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def get_final_message(self):
+            return StubAnthropic._Message(StubAnthropic._Usage())
+
+    class _Messages:
+        def stream(self, **params):
+            return StubAnthropic._Stream("## 回答\n" + "分析コメント。" * 100)
+
+    def __init__(self):
+        self.messages = self._Messages()
+
+
+class NullCache:
+    """何も保存しない応答キャッシュ（毎回スタブに問い合わせる）。"""
+
+    def get(self, key):
+        return None
+
+    def put(self, key, text, model=None):
+        pass
+
+
+def _companies(n, seed=0):
+    """ベンチマーク用の企業データ（再現性のある乱数）。"""
+    rng = np.random.default_rng(seed)
+    revenue = rng.uniform(50, 5000, n).round()
+    return {
+        "revenue": revenue,
+        "profit": (revenue * rng.uniform(-0.05, 0.2, n)).round(),
+        "total_assets": (revenue * rng.uniform(0.5, 2.0, n)).round(),
+        "total_liabilities": (revenue * rng.uniform(0.1, 1.0, n)).round(),
+        "depreciation": (revenue * rng.uniform(0.01, 0.1, n)).round(),
+        "industry": rng.integers(0, len(industry_table()), n),
+        "growth_rate": rng.uniform(-20, 60, n).round(),
+    }
+
+
+# ----------------------------------------
+# ケース定義（各関数は計測対象の引数なし関数を返す）
+# ----------------------------------------
+
+def case_valuation(n):
+    c = _companies(n)
+    return lambda: value_companies(
+        c["revenue"], c["profit"], c["total_assets"], c["total_liabilities"], c["depreciation"],
+        industry=c["industry"], growth_rate=c["growth_rate"],
+    )
+
+
+def case_industry_codes(n):
+    """業種名の文字列 n 件を整数コードにして、標準倍率とベータを引く。"""
+    table = industry_table()
+    names = np.asarray(table.names)[_companies(n)["industry"]]
+
+    def run():
+        codes = table.codes(names)
+        return table.per[codes], table.beta[codes]
+
+    return run
+
+
+def case_dcf(n, years):
+    c = _companies(n)
+    wacc = np.full(n, 7.5)
+    net_debt = c["total_liabilities"] * 0.5
+    return lambda: dcf_kernel(
+        c["revenue"], c["profit"], c["depreciation"], c["growth_rate"], wacc, net_debt, years=years
+    )
+
+
+def case_implied_wacc(n):
+    """n社それぞれの目標価格を正当化するWACCを一括で逆算する。"""
+    c = _companies(n)
+    net_debt = c["total_liabilities"] * 0.5
+    dcf = dcf_kernel(c["revenue"], c["profit"], c["depreciation"], c["growth_rate"], 7.5, net_debt)
+    target = np.abs(dcf["equity_value"]) * 1.2
+    return lambda: implied_wacc(dcf["fcf"], net_debt, dcf["perpetual_growth"], target)
+
+
+def case_sensitivity(resolution):
+    wacc, growth = sensitivity_axes(7.5, 2.0, resolution=resolution)
+    return lambda: sensitivity_surface(120.0, 400.0, 250.0, wacc, growth)
+
+
+def case_scenarios(n, steps_per_year):
+    """n本のシナリオの10年推移（株式調達3回・融資と返済あり、希薄化の1回は企業価値から決める）。"""
+    rng = np.random.default_rng(0)
+    growth = rng.uniform(0, 50, (n, 10))
+    events = [
+        {"kind": "loan", "year": 0, "amount": 100, "rate": 2.0},
+        {"kind": "equity", "year": 1, "amount": 100, "dilution": 15},
+        {"kind": "repayment", "year": 2, "amount": 50},
+        {"kind": "equity", "year": 3, "amount": rng.uniform(200, 500, n)},
+        {"kind": "equity", "year": 5, "amount": 1000, "dilution": 20},
+    ]
+    return lambda: run_scenarios(500, 50, growth, 1, 15, events=events, steps_per_year=steps_per_year)
+
+
+def case_waterfall(n, per_scenario=False):
+    """n点の売却額での株主別の分配（3ラウンド・プール・参加型の上限あり。per_scenario ならシナリオごとのキャップテーブル）。"""
+    rng = np.random.default_rng(0)
+    pre_money = rng.uniform(300, 3000, n) if per_scenario else 2500
+    rounds = [
+        {"name": "シリーズA", "amount": 100, "dilution": 20, "preference": 1.0, "option_pool": 10},
+        {"name": "シリーズB", "amount": 300, "dilution": 15, "preference": 1.5, "participating": True, "cap": 3.0},
+        {"name": "シリーズC", "amount": 500, "pre_money": pre_money, "preference": 1.0, "participating": True},
+    ]
+    exit_values = rng.uniform(0, 20_000, n) if per_scenario else np.linspace(0, 20_000, n)
+    return lambda: exit_waterfall(build_cap_table(rounds), exit_values)
+
+
+def case_simulator():
+    return lambda: simulate(500, 50, [22, 19, 18], 1, 15, equity_dilution=20)
+
+
+def case_simulator_paths(n):
+    rng = np.random.default_rng(0)
+    growth = rng.normal(15, 10, (n, 3))
+    return lambda: project_paths(500, 50, growth, 1, 15, np.array([100.0, 80.0, 80.0, 80.0]))
+
+
+def case_monte_carlo(n):
+    return lambda: monte_carlo(500, 50, [22, 19, 18], 1, 15, equity_dilution=20, n_paths=n)
+
+
+def case_compare_scenarios():
+    growth = [[g * s["growth_multiplier"] for g in (22, 19, 18)] for s in FUNDING_SCENARIOS]
+    dilution = [s["dilution"] for s in FUNDING_SCENARIOS]
+    return lambda: compare_scenarios(500, 50, growth, dilution, 15)
+
+
+def case_compare_funding(n):
+    c = _companies(n)
+    year_growth = c["growth_rate"][:, None] * np.array([1.0, 0.9, 0.8])
+    pe_multiple = np.full(n, 15.0)
+    return lambda: compare_funding_options(c["revenue"], c["profit"], year_growth, pe_multiple)
+
+
+def case_sweep(points):
+    """タブ4のスイープ：評価・パレートフロンティア・上位10件（組み合わせ数は points の4乗）。"""
+    axes = (np.linspace(0, 1000, points), np.unique(np.linspace(0, 49, points).round()),
+            np.linspace(0.5, 1.5, points), np.linspace(10, 20, points))
+
+    def run():
+        result = sweep_scenarios(500, 50, [22, 19, 18], *axes)
+        return sweep_frontier(result), top_scenarios(result, k=10, min_equity=51)
+
+    return run
+
+
+def case_report():
+    """タブ5：数値計算 → プロンプト作成 → 3つのAI分析（スタブ）までの一連の処理。"""
+    client = StubAnthropic()
+    cache = NullCache()
+    # 流量制御の待ちは計測に含めない（制限なしの窓口を通す）
+    controller = AdmissionController(rpm=0, tpm=0)
+
+    def run():
+        result = value_companies(500, 50, 600, 250, 25, industry="製造業", growth_rate=15)
+        values = result["values"][0]
+        sim = simulate(500, 50, [22, 19, 18], 1, 15, equity_dilution=20)
+        initial = {key: v[0] for key, v in sim.items()}
+        final = {key: v[-1] for key, v in sim.items()}
+        system = system_prompt(company_profile(
+            500, 50, 15, 8, 30, "製造業", "東京都", 5, False, False, False,
+            "必要（急ぎ）", 100, "受け入れ可能", "3ヶ月以内", [],
+        ))
+        prompts = {
+            "valuation": valuation_prompt(
+                350, result["min"][0], METHODS[np.nanargmin(values)], result["median"][0],
+                result["max"][0], METHODS[np.nanargmax(values)],
+            ),
+            "analysis": analysis_prompt(),
+            "interpretation": interpretation_prompt(
+                "シナリオ1: VC調達（株式20%希薄化）", "楽観的", initial, final,
+                (final["revenue"] - initial["revenue"]) / initial["revenue"] * 100,
+            ),
+        }
+        return list(generate_all(client, cache, prompts, system=system, controller=controller))
+
+    return run
+
+
+def case_batch(n):
+    """一括評価のチャンク処理（pandas が必要）。"""
+    import pandas as pd
+
+    from capital_app.batch import evaluate_frame
+
+    c = _companies(n)
+    c["industry"] = np.asarray(industry_table().names)[c["industry"]]
+    frame = pd.DataFrame(c)
+    return lambda: evaluate_frame(frame)
+
+
+def case_report_zip(n):
+    """一括評価の結果から企業ごとの Markdown レポートを ZIP（メモリ上）に書き込む。pandas が必要。"""
+    import io
+
+    import pandas as pd
+
+    from capital_app.batch import evaluate_frame
+    from capital_app.report import ReportZipWriter
+
+    c = _companies(n)
+    c["industry"] = np.asarray(industry_table().names)[c["industry"]]
+    frame = evaluate_frame(pd.DataFrame(c))
+    scenarios = [s["name"] for s in FUNDING_SCENARIOS]
+
+    def run():
+        writer = ReportZipWriter(io.BytesIO(), formats=("md",))
+        writer.write(frame, 0, METHODS, scenarios)
+        writer.close()
+
+    return run
+
+
+def case_lttb(n):
+    """グラフの間引き（LTTB で5,000点に）。plotly が必要。"""
+    from capital_app.charts import MAX_POINTS, lttb
+
+    rng = np.random.default_rng(0)
+    x = np.arange(n, dtype=float)
+    y = np.cumsum(rng.normal(0, 1, n))
+    return lambda: lttb(x, y, MAX_POINTS)
+
+
+def cases():
+    """{ケース名: 準備関数}。準備関数は計測対象の関数を返す。"""
+    registry = {}
+    for n in SCALES:
+        registry[f"valuation/n={n}"] = lambda n=n: case_valuation(n)
+        registry[f"industry_codes/n={n}"] = lambda n=n: case_industry_codes(n)
+        for years in (5, 30):
+            registry[f"dcf/n={n}/years={years}"] = lambda n=n, years=years: case_dcf(n, years)
+        registry[f"compare_funding/n={n}"] = lambda n=n: case_compare_funding(n)
+        registry[f"implied_wacc/n={n}"] = lambda n=n: case_implied_wacc(n)
+    for resolution in (5, 200, 1000):
+        registry[f"sensitivity/grid={resolution}x{resolution}"] = lambda r=resolution: case_sensitivity(r)
+    registry["simulator/n=1"] = case_simulator
+    for n in (10_000, 1_000_000):
+        registry[f"waterfall/exits={n}"] = lambda n=n: case_waterfall(n)
+    registry["waterfall_paths/n=100000"] = lambda: case_waterfall(100_000, per_scenario=True)
+    for n in SCALES[1:]:
+        for steps_per_year in (1, 12):
+            registry[f"scenarios/n={n}/steps={steps_per_year}"] = (
+                lambda n=n, steps_per_year=steps_per_year: case_scenarios(n, steps_per_year)
+            )
+    for n in SCALES[1:]:
+        registry[f"simulator_paths/n={n}"] = lambda n=n: case_simulator_paths(n)
+        registry[f"monte_carlo/n={n}"] = lambda n=n: case_monte_carlo(n)
+    registry["compare_scenarios/n=3"] = case_compare_scenarios
+    for points in (10, 20, 36):
+        registry[f"sweep/n={points ** 4}"] = lambda p=points: case_sweep(p)
+    registry["report/n=1"] = case_report
+    for n in (100_000, 1_000_000):
+        registry[f"lttb/n={n}"] = lambda n=n: case_lttb(n)
+    for n in SCALES[1:]:
+        registry[f"batch/n={n}"] = lambda n=n: case_batch(n)
+    registry["report_zip/n=1000"] = lambda: case_report_zip(1000)
+    return registry
+
+
+def measure(func, repeat=DEFAULT_REPEAT, min_time=DEFAULT_MIN_TIME):
+    """1回あたりの実行時間（秒）を repeat 回計測する。短い処理は min_time 以上になるよう繰り返す。"""
+    func()  # ウォームアップ
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started_at) / number)
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run(patterns=(), repeat=DEFAULT_REPEAT, min_time=DEFAULT_MIN_TIME, progress=sys.stderr):
+    """ベンチマークを実行し、メタ情報と結果の辞書を返す。"""
+    results = {}
+    for name, setup in cases().items():
+        if patterns and not any(p in name for p in patterns):
+            continue
+        try:
+            func = setup()
+        except ImportError as e:
+            print(f"skip {name}: {e}", file=progress)
+            continue
+        results[name] = measure(func, repeat=repeat, min_time=min_time)
+        print(f"{name:<40} {_format_seconds(results[name]['median_s']):>10}", file=progress)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, stat="min_s"):
+    """
+    ベースラインと比べ、(ケース名, 前回, 今回, 比率, 回帰か) のリストを返す。
+
+    既定では最速値（min_s）で比べる。他のプロセスの影響を受けにくく、回帰の判定が安定する。
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result[stat] / base[stat] if base[stat] > 0 else float("inf")
+        rows.append((name, base[stat], result[stat], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def _format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds * 1e6:.1f}µs"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計算パスのベンチマークと回帰チェック")
+    parser.add_argument("-o", "--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--baseline", help="比較するベースラインの JSON ファイル")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="回帰とみなす遅くなり方（0.25 = 25%%）")
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="ケース名に含まれる文字列で絞り込む（複数指定可）")
+    parser.add_argument("--stat", choices=("min_s", "median_s"), default="min_s",
+                        help="ベースラインとの比較に使う統計量")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+                        help="1サンプルあたりの最低計測時間（秒）")
+    args = parser.parse_args(argv)
+
+    current = run(args.patterns, repeat=args.repeat, min_time=args.min_time)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.threshold, args.stat)
+    regressions = [row for row in rows if row[4]]
+    print(f"\n{'ケース':<38} {'前回':>10} {'今回':>10} {'比率':>7}")
+    for name, before, after, ratio, regressed in rows:
+        mark = "  NG" if regressed else ""
+        print(f"{name:<40} {_format_seconds(before):>10} {_format_seconds(after):>10} {ratio:>6.2f}x{mark}")
+    if regressions:
+        print(f"\n{len(regressions)}件のケースが {args.threshold:.0%} を超えて遅くなりました", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
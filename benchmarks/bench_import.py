@@ -0,0 +1,97 @@
+"""
+計算コア（capital_core）のインポート時間ベンチマーク
+
+新しいインタプリタで `import capital_core` を繰り返し計測し、
+  - Streamlit / Plotly / pandas / Anthropic を読み込んでいないこと
+  - コア自体のインポート時間（NumPy を除く）が予算内であること
+  - NumPy を含む合計が予算内であること
+を確認する。予算を超えると終了コード1で終わる。
+
+使い方:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --core-budget-ms 30 --total-budget-ms 250 --repeat 7
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULE = "capital_core"
+FORBIDDEN_MODULES = ("streamlit", "plotly", "pandas", "anthropic")
+
+CORE_BUDGET_MS = 30.0
+TOTAL_BUDGET_MS = 250.0
+
+
+def _cumulative_us(stderr, module):
+    """-X importtime の出力から、指定モジュールの累積インポート時間（μs）を取り出す。"""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        if name == module:
+            return int(cumulative_us)
+    return 0
+
+
+def measure_once(module=MODULE):
+    code = (
+        f"import {module}, sys, json; "
+        f"print(json.dumps(sorted(m for m in {FORBIDDEN_MODULES!r} if m in sys.modules)))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    total_ms = _cumulative_us(proc.stderr, module) / 1000
+    numpy_ms = _cumulative_us(proc.stderr, "numpy") / 1000
+    return {
+        "total_ms": total_ms,
+        "numpy_ms": numpy_ms,
+        "core_ms": total_ms - numpy_ms,
+        "forbidden": json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+
+def run(repeat=5, module=MODULE):
+    """repeat 回計測し、最速値（ノイズの少ない値）を返す。"""
+    runs = [measure_once(module) for _ in range(repeat)]
+    return {
+        "module": module,
+        "repeat": repeat,
+        "total_ms": min(r["total_ms"] for r in runs),
+        "numpy_ms": min(r["numpy_ms"] for r in runs),
+        "core_ms": min(r["core_ms"] for r in runs),
+        "forbidden": sorted({m for r in runs for m in r["forbidden"]}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="capital_core のインポート時間を計測する")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--core-budget-ms", type=float, default=CORE_BUDGET_MS)
+    parser.add_argument("--total-budget-ms", type=float, default=TOTAL_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    result = run(args.repeat)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    failures = []
+    if result["forbidden"]:
+        failures.append(f"重い依存を読み込んでいます: {', '.join(result['forbidden'])}")
+    if result["core_ms"] > args.core_budget_ms:
+        failures.append(f"コアのインポート時間 {result['core_ms']:.1f}ms > 予算 {args.core_budget_ms:.0f}ms")
+    if result["total_ms"] > args.total_budget_ms:
+        failures.append(f"合計インポート時間 {result['total_ms']:.1f}ms > 予算 {args.total_budget_ms:.0f}ms")
+
+    for failure in failures:
+        print(f"NG: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
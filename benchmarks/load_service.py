@@ -0,0 +1,176 @@
+"""
+評価サービス（capital_app.service）の負荷試験
+
+複数のスレッドから keep-alive の接続で同じエンドポイントに繰り返しリクエストを送り、
+スループット（リクエスト/秒・企業/秒）、ステータスごとの件数、クライアント側の
+レイテンシ p50 / p95 / p99 を表示する。--start を付けるとサービスを子プロセスで起動してから試験する。
+
+使い方:
+    python benchmarks/load_service.py --start --workers 4 -c 32 -d 10
+    python benchmarks/load_service.py --url http://127.0.0.1:8765 --endpoint comparison --batch 1000
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INDUSTRIES = ("製造業", "IT・ソフトウェア", "医療・ヘルスケア", "環境・エネルギー", "小売・サービス", "建設・不動産", "その他")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def sample_companies(n, seed=0):
+    """ランダムな企業 n 社分のリクエスト（bench_compute の _companies と同じ分布）。"""
+    rng = np.random.default_rng(seed)
+    revenue = rng.uniform(10, 10_000, n)
+    total_assets = revenue * rng.uniform(0.3, 2.0, n)
+    return [
+        {
+            "revenue": round(float(revenue[i]), 1),
+            "profit": round(float(revenue[i] * rng.uniform(-0.1, 0.3)), 1),
+            "total_assets": round(float(total_assets[i]), 1),
+            "total_liabilities": round(float(total_assets[i] * rng.uniform(0.1, 0.9)), 1),
+            "depreciation": round(float(revenue[i] * rng.uniform(0.01, 0.08)), 1),
+            "industry": INDUSTRIES[int(rng.integers(len(INDUSTRIES)))],
+            "growth_rate": round(float(rng.uniform(-10, 60)), 1),
+            "funding_amount": 100,
+        }
+        for i in range(n)
+    ]
+
+
+def _quantile(sorted_values, q):
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def load_test(url, endpoint, bodies, concurrency, duration):
+    """concurrency 本の接続から duration 秒間リクエストを送り続け、集計結果を返す。"""
+    parts = urlsplit(url)
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        local, counts = [], {}
+        i = offset
+        while time.perf_counter() < deadline:
+            body = bodies[i % len(bodies)]
+            i += 1
+            started_at = time.perf_counter()
+            try:
+                conn.request("POST", f"/v1/{endpoint}", body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+                status = "error"
+            local.append(time.perf_counter() - started_at)
+            counts[status] = counts.get(status, 0) + 1
+            if status == 503:
+                time.sleep(0.01)  # Retry-After を待たずに少しだけ間を空ける
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            for status, count in counts.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    ok = statuses.get(200, 0)
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": ok / elapsed,
+        "statuses": statuses,
+        **{f"p{int(q * 100)}_ms": _quantile(latencies, q) * 1e3 for q in QUANTILES if latencies},
+        "max_ms": latencies[-1] * 1e3 if latencies else None,
+    }
+
+
+def _wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/healthz", timeout=1) as response:
+                return json.load(response)
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"サービスが起動しませんでした: {url}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="評価サービスの負荷試験")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="サービスのURL")
+    parser.add_argument("--endpoint", default="valuation", choices=("valuation", "dcf", "simulation", "comparison"))
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="同時接続数")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="試験時間（秒）")
+    parser.add_argument("--batch", type=int, default=1, help="1リクエストあたりの企業数（1なら単一リクエスト）")
+    parser.add_argument("--start", action="store_true", help="サービスを子プロセスで起動してから試験する")
+    parser.add_argument("--workers", type=int, default=None, help="--start で起動するサービスのワーカー数")
+    parser.add_argument("--max-pending", type=int, default=None, help="--start で起動するサービスの受け付け上限")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.start:
+        command = [sys.executable, "-m", "capital_app.service", "--port", str(urlsplit(args.url).port or 8765)]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        if args.max_pending:
+            command += ["--max-pending", str(args.max_pending)]
+        server = subprocess.Popen(command, cwd=REPO_ROOT)
+    try:
+        stats = _wait_ready(args.url)
+        companies = sample_companies(max(args.batch, 1) * 64)
+        if args.batch > 1:
+            bodies = [json.dumps(companies[i:i + args.batch]).encode("utf-8")
+                      for i in range(0, len(companies), args.batch)]
+        else:
+            bodies = [json.dumps(company).encode("utf-8") for company in companies]
+
+        result = load_test(args.url, args.endpoint, bodies, args.concurrency, args.duration)
+        with urllib.request.urlopen(f"{args.url}/metrics", timeout=5) as response:
+            server_stats = json.load(response)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.endpoint}: ワーカー{stats['workers']}、同時接続{args.concurrency}、"
+          f"1リクエスト{args.batch}社、{result['seconds']:.1f}秒")
+    print(f"  成功 {result['requests_per_second']:,.0f}リクエスト/秒（{result['requests_per_second'] * args.batch:,.0f}社/秒）"
+          f"  ステータス {result['statuses']}")
+    if result["requests"]:
+        print("  クライアント側 " + "  ".join(f"p{int(q * 100)} {result[f'p{int(q * 100)}_ms']:.1f}ms" for q in QUANTILES)
+              + f"  max {result['max_ms']:.1f}ms")
+    for name in (f"service.{args.endpoint}", f"service.{args.endpoint}.compute"):
+        s = server_stats["spans"].get(name)
+        if s:
+            print(f"  {name:<28} " + "  ".join(f"p{int(q * 100)} {s[f'p{int(q * 100)}'] * 1e3:.1f}ms" for q in QUANTILES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
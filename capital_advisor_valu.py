@@ -3,12 +3,502 @@
 """
 
 import streamlit as st
-import anthropic
 import plotly.graph_objects as go
-import plotly.express as px
 import pandas as pd
 import numpy as np
-from datetime import datetime
+import time
+from functools import partial
+
+from capital_app.admission import AdmissionError, default_controller as llm_admission
+from capital_app.charts import band_traces, cached_figure, downsample_grid, scatter_trace
+from capital_app.client import get_client
+from capital_app.jobs import default_manager as default_job_manager
+from capital_app.llm import cached_stream, describe_usage, prefetch, usage_stats
+from capital_app.prompts import (
+    TASK_SETTINGS,
+    analysis_prompt as build_analysis_prompt,
+    company_profile,
+    interpretation_prompt as build_interpretation_prompt,
+    system_prompt,
+    valuation_prompt as build_valuation_prompt,
+)
+from capital_app.llm_cache import default_cache
+from capital_app.metrics import span, summary as metrics_summary, timed, to_jsonl, to_prometheus
+from capital_app.report import FORMATS as REPORT_FORMATS, parquet_available, render, text_sections, valuation_sections
+from capital_core import (
+    METHODS,
+    PERCENTILES,
+    break_even_dilution,
+    build_cap_table,
+    exit_waterfall,
+    implied_perpetual_growth,
+    implied_wacc,
+    industry_table,
+    monte_carlo,
+    sensitivity_axes,
+    sensitivity_surface,
+    sweep_frontier,
+    sweep_scenarios,
+    top_scenarios,
+    value_companies,
+)
+from capital_core.comparison import FUNDING_SCENARIOS, compare_scenarios
+from capital_core.dcf import COST_OF_DEBT, DCF_YEARS, MAX_DCF_YEARS, MIN_DCF_YEARS
+from capital_core.goalseek import MAX_WACC
+from capital_core.memo import cache_stats, memoize
+from capital_core.montecarlo import correlation_matrix
+from capital_core.simulation import STEPS_PER_YEAR, simulate
+
+# 計算結果のメモ化（入力が同じなら再実行・他セッションでも結果を再利用）
+cached_value_companies = memoize(maxsize=256, ttl=3600)(value_companies)
+cached_sensitivity_surface = memoize(maxsize=256, ttl=3600)(sensitivity_surface)
+cached_monte_carlo = memoize(maxsize=32, ttl=3600)(monte_carlo)
+cached_compare_scenarios = memoize(maxsize=256, ttl=3600)(compare_scenarios)
+cached_sweep_scenarios = memoize(maxsize=8, ttl=3600)(sweep_scenarios)
+
+# AI応答の永続キャッシュ（同じプロンプトなら再生成しない）
+llm_cache = default_cache()
+ai_jobs = default_job_manager()
+
+# 感度分析ヒートマップの解像度（WACC × 永続成長率の各軸の点数）
+SENSITIVITY_RESOLUTION = 200
+
+# タブをまたいで保持する入力値のキーの接頭辞
+INPUT_PREFIX = "input:"
+
+
+def input_key(name, *depends):
+    """入力値のキー。依存する値（売上・業種など）が変わると別のキーになり、既定値に戻る"""
+    return INPUT_PREFIX + "|".join(str(v) for v in (name,) + depends)
+
+
+def seed(key, default):
+    """ウィジェットの既定値を Session State に置いてキーを返す（value 引数の代わり）"""
+    st.session_state.setdefault(key, default)
+    return key
+
+
+def read_inputs(spec):
+    """{名前: (キー, 既定値)} から現在の入力値を読む（そのタブを開いていなければ既定値）"""
+    return {name: st.session_state.get(key, default) for name, (key, default) in spec.items()}
+
+
+def keep_inputs():
+    """表示していないタブのウィジェットの値が破棄されないよう、Session State に残す"""
+    for key in list(st.session_state):
+        if isinstance(key, str) and key.startswith(INPUT_PREFIX):
+            st.session_state[key] = st.session_state[key]
+
+
+def industry_defaults(industry):
+    """業種別の標準倍率（スライダーの刻みに丸めたもの）とパラメータの版"""
+    table = industry_table()
+    row = table.row(industry)
+    return {
+        'per': round(row['per']),
+        'pbr': round(row['pbr'], 1),
+        'ebitda': round(row['ebitda']),
+        'year_buy': round(row['year_buy']),
+        'version': table.version,
+    }
+
+
+def valuation_spec(revenue, industry):
+    """タブ1（企業価値算定）の入力項目。業種別パラメータが更新されると倍率は新しい既定値に戻る"""
+    multiples = industry_defaults(industry)
+    version = multiples['version']
+    return {
+        'total_assets': (input_key('total_assets', revenue), int(revenue * 1.2)),
+        'total_liabilities': (input_key('total_liabilities', revenue), int(revenue * 0.5)),
+        'depreciation': (input_key('depreciation', revenue), int(revenue * 0.05)),
+        'per_multiple': (input_key('per_multiple', industry, version), multiples['per']),
+        'pbr_multiple': (input_key('pbr_multiple', industry, version), multiples['pbr']),
+        'ebitda_multiple': (input_key('ebitda_multiple', industry, version), multiples['ebitda']),
+        'year_buy_multiple': (input_key('year_buy_multiple', industry, version), multiples['year_buy']),
+        'discount_rate': (input_key('discount_rate'), 8),
+        'dcf_years': (input_key('dcf_years'), DCF_YEARS),
+        'target_price': (input_key('target_price', revenue), 0),
+    }
+
+
+# タブ3のシナリオと成長見通し
+SIMULATION_SCENARIOS = [
+    "シナリオ1: VC調達（株式20%希薄化）",
+    "シナリオ2: 銀行融資（無希薄化）",
+    "シナリオ3: 自己資金で成長（調達なし）",
+    "シナリオ4: 上場準備（複数回調達）",
+    "カスタムシナリオ"
+]
+RISK_SCENARIOS = ["楽観的", "基本", "悲観的"]
+
+# 成長見通しごとの年別成長率（前年比成長率に掛ける係数）と入力範囲
+GROWTH_FACTORS = {
+    "楽観的": ((1.5, 1.3, 1.2), (0, 200)),
+    "基本": ((1.0, 0.9, 0.8), (-50, 200)),
+    "悲観的": ((0.5, 0.6, 0.7), (-50, 100)),
+}
+
+# シミュレーション期間（年）の範囲と既定値（上場準備は複数回の調達を見るため長め）
+HORIZON_RANGE = (3, 10)
+DEFAULT_HORIZON = 3
+IPO_HORIZON = 5
+
+# 上場準備の調達ラウンド（名前、時期（年目）、調達額（サイドバーの調達額に対する倍率）、希薄化%）
+IPO_ROUNDS = (
+    ("シリーズA", 1, 1, 15),
+    ("シリーズB", 3, 3, 15),
+    ("上場（IPO）", 5, 10, 20),
+)
+
+# 優先株の優先順位（後のラウンドが先に受け取るか、全ラウンドが同順位で按分か）
+SENIORITY_OPTIONS = ("後のラウンドが優先", "同順位（按分）")
+
+# 売却額ごとの分配（ウォーターフォール）を計算する売却額の点数
+EXIT_GRID_POINTS = 10_000
+
+
+def scenario_spec():
+    """タブ3のシナリオ選択"""
+    return {
+        'scenario': (input_key('scenario'), SIMULATION_SCENARIOS[0]),
+        'risk_scenario': (input_key('risk_scenario'), RISK_SCENARIOS[0]),
+    }
+
+
+def simulation_spec(scenario, risk_scenario, growth_rate, funding_amount, industry):
+    """タブ3（シミュレーター）の入力項目。シナリオと成長見通しによって項目と既定値が変わる"""
+    spec = {}
+    if "VC調達" in scenario or "カスタム" in scenario:
+        spec['funding_sim'] = (input_key('funding_sim', funding_amount), funding_amount)
+        spec['equity_dilution'] = (input_key('equity_dilution'), 20)
+    elif "銀行融資" in scenario:
+        spec['funding_sim'] = (input_key('loan_amount', funding_amount), funding_amount)
+        spec['interest_rate'] = (input_key('interest_rate'), 2.0)
+        spec['repayment_years'] = (input_key('repayment_years'), 0)
+    elif "上場準備" in scenario:
+        for i, (_, year, multiple, dilution) in enumerate(IPO_ROUNDS):
+            spec[f'round{i + 1}_year'] = (input_key(f'round{i + 1}_year'), year)
+            spec[f'round{i + 1}_amount'] = (input_key(f'round{i + 1}_amount', funding_amount), funding_amount * multiple)
+            spec[f'round{i + 1}_dilution'] = (input_key(f'round{i + 1}_dilution'), dilution)
+    spec['horizon'] = (
+        input_key('horizon', scenario), IPO_HORIZON if "上場準備" in scenario else DEFAULT_HORIZON
+    )
+    spec['steps'] = (input_key('steps'), next(iter(STEPS_PER_YEAR)))
+    factors, _ = GROWTH_FACTORS[risk_scenario]
+    for i, factor in enumerate(factors):
+        spec[f'year{i + 1}_growth'] = (
+            input_key(f'year{i + 1}_growth', risk_scenario, growth_rate), int(growth_rate * factor)
+        )
+    spec['later_growth'] = (input_key('later_growth', risk_scenario, growth_rate), int(growth_rate * factors[-1]))
+    spec['profit_margin_improvement'] = (input_key('profit_margin_improvement'), 1)
+    defaults = industry_defaults(industry)
+    spec['pe_multiple'] = (input_key('pe_multiple', industry, defaults['version']), defaults['per'])
+    return spec
+
+
+def cap_table_spec():
+    """タブ3の優先株の条件とストックオプション・プール（タブ4のVC調達にも使う）"""
+    return {
+        'preference': (input_key('preference'), 1.0),
+        'participating': (input_key('participating'), False),
+        'participation_cap': (input_key('participation_cap'), 0.0),
+        'option_pool': (input_key('option_pool'), 0),
+        'seniority': (input_key('seniority'), SENIORITY_OPTIONS[0]),
+    }
+
+
+def round_terms(inputs, first=True):
+    """入力値から株式調達ラウンドの優先株の条件を作る（ストックオプション・プールは最初のラウンドで設ける）"""
+    terms = {
+        'preference': inputs['preference'],
+        'participating': inputs['participating'],
+        'cap': max(inputs['participation_cap'], inputs['preference']) if inputs['participation_cap'] else None,
+        'option_pool': inputs['option_pool'] if first else 0,
+    }
+    if inputs['seniority'] != SENIORITY_OPTIONS[0]:
+        terms['seniority'] = 1
+    return terms
+
+
+def simulation_inputs(growth_rate, funding_amount, industry):
+    """タブ3の入力値を計算に使う形で読む（タブ4・タブ5から参照する）"""
+    inputs = read_inputs(scenario_spec())
+    inputs.update(read_inputs(simulation_spec(
+        inputs['scenario'], inputs['risk_scenario'], growth_rate, funding_amount, industry
+    )))
+    inputs.update(read_inputs(cap_table_spec()))
+    inputs.setdefault('funding_sim', 0)
+    inputs.setdefault('equity_dilution', 0)
+    # 3年分の成長率（タブ4の比較に使う）と、シミュレーション期間の成長率（4年目以降は同じ率）
+    inputs['growth'] = [inputs['year1_growth'], inputs['year2_growth'], inputs['year3_growth']]
+    horizon = inputs['horizon']
+    inputs['path_growth'] = (inputs['growth'] + [inputs['later_growth']] * horizon)[:horizon]
+    inputs['steps_per_year'] = STEPS_PER_YEAR[inputs['steps']]
+    inputs['events'] = simulation_events(inputs)
+    return inputs
+
+
+def step_label(step, steps_per_year):
+    """推移の時点の表示名（現在・N年後・N年Mヶ月後）"""
+    if step == 0:
+        return '現在'
+    years, months = divmod(int(step) * 12 // steps_per_year, 12)
+    if not months:
+        return f'{years}年後'
+    return f'{years}年{months}ヶ月後' if years else f'{months}ヶ月後'
+
+
+def simulation_events(inputs):
+    """タブ3の入力値から資金調達イベント（株式調達・融資・返済）の一覧を作る"""
+    scenario = inputs['scenario']
+    if "銀行融資" in scenario:
+        # 返済期間が0なら期間中は返済せず、毎年の利息だけを差し引く
+        events = [{'kind': 'loan', 'year': 0, 'amount': inputs['funding_sim'], 'rate': inputs['interest_rate']}]
+        years = min(inputs['repayment_years'], inputs['horizon'])
+        if inputs['repayment_years']:
+            amount = inputs['funding_sim'] / inputs['repayment_years']
+            events += [{'kind': 'repayment', 'year': year, 'amount': amount} for year in range(1, years + 1)]
+        return events
+    if "上場準備" in scenario:
+        rounds = sorted(
+            (inputs[f'round{i + 1}_year'], i) for i in range(len(IPO_ROUNDS))
+            if inputs[f'round{i + 1}_year'] <= inputs['horizon']
+        )
+        return [
+            {
+                'kind': 'equity',
+                'name': IPO_ROUNDS[i][0],
+                'year': year,
+                'amount': inputs[f'round{i + 1}_amount'],
+                'dilution': inputs[f'round{i + 1}_dilution'],
+                **round_terms(inputs, first=n == 0),
+            }
+            for n, (year, i) in enumerate(rounds)
+        ]
+    if inputs['funding_sim'] or inputs['equity_dilution']:
+        # 希薄化は1年目に発生する
+        return [{
+            'kind': 'equity', 'name': '投資家', 'year': 1, 'amount': inputs['funding_sim'],
+            'dilution': inputs['equity_dilution'], **round_terms(inputs),
+        }]
+    return []
+
+
+def exit_payouts(events, company_value):
+    """株式調達イベントのキャップテーブルで、0〜企業価値の数倍の売却額の分配を一括計算する（タブ3）"""
+    cap_table = build_cap_table([event for event in events if event['kind'] == 'equity'])
+    preferences = sum(float(c['invested'] * c['preference']) for c in cap_table if c['kind'] == 'preferred')
+    exit_values = np.linspace(0, max(company_value * 2, preferences * 3, 1.0), EXIT_GRID_POINTS)
+    return cap_table, exit_values, exit_waterfall(cap_table, exit_values)
+
+
+def compare_funding(revenue, profit, funding_amount, industry, growth, terms):
+    """タブ4の3シナリオ比較表と、経営者の持分価値が最大のシナリオ（VC調達は優先株の条件 terms で分配）"""
+    scenarios_to_compare = [
+        {
+            'name': scenario_def['name'],
+            'funding': funding_amount if scenario_def['funded'] else 0,
+            'dilution': scenario_def['dilution'],
+            'growth': [g * scenario_def['growth_multiplier'] for g in growth]
+        }
+        for scenario_def in FUNDING_SCENARIOS
+    ]
+    
+    compared = cached_compare_scenarios(
+        revenue, profit,
+        [scenario_def['growth'] for scenario_def in scenarios_to_compare],
+        [scenario_def['dilution'] for scenario_def in scenarios_to_compare],
+        industry_defaults(industry)['per'],
+        funding=[scenario_def['funding'] for scenario_def in scenarios_to_compare],
+        terms=terms
+    )
+    
+    comparison_results = []
+    
+    for i, scenario_def in enumerate(scenarios_to_compare):
+        final_revenue = compared['final_revenue'][i]
+        company_value = compared['company_value'][i]
+        equity = compared['equity'][i]
+        owner_value = compared['owner_value'][i]
+        
+        comparison_results.append({
+            'シナリオ': scenario_def['name'],
+            '調達額': f"{scenario_def['funding']}百万円",
+            '株式希薄化': f"{scenario_def['dilution']}%",
+            '3年後売上': f"{final_revenue:.0f}百万円",
+            '3年後企業価値': f"{company_value:.0f}百万円",
+            '経営者持株': f"{equity:.0f}%",
+            '経営者持分価値': f"{owner_value:.0f}百万円",
+            '_owner_value_num': owner_value,  # ソート用
+            '_company_value_num': company_value  # 損益分岐の希薄化率の計算用
+        })
+    
+    comparison_df = pd.DataFrame(comparison_results)
+    best_scenario = comparison_df.loc[comparison_df['_owner_value_num'].idxmax(), 'シナリオ']
+    return comparison_df, best_scenario
+
+def queue_notice():
+    """AI呼び出しの待ち順を表示する欄と、流量制御から呼ばれる更新用のコールバック"""
+    placeholder = st.empty()
+    
+    def on_wait(position):
+        if position is None:
+            placeholder.empty()
+        else:
+            placeholder.info(f"⏳ AIの利用が混み合っています。順番待ち：{position}番目")
+    
+    return on_wait
+
+
+# 実行中の AI 分析ジョブの進み具合を読み直す間隔（秒）
+JOB_POLL_SECONDS = 1.0
+
+
+def job_progress(job):
+    """実行中のジョブの状況（順番待ち・受け取った文字数・経過時間）と、ここまでの応答"""
+    text = job.text()
+    if job.cancel_requested:
+        st.info("⏹ 中止しています...")
+    elif job.status == 'waiting':
+        st.info(f"⏳ AIの利用が混み合っています。順番待ち：{job.position}番目")
+    elif job.status == 'queued':
+        st.info("⏳ 開始を待っています...")
+    else:
+        st.info(f"🤖 生成中...（{len(text):,}文字 / {job.elapsed():.0f}秒）")
+    if text:
+        st.markdown(text)
+
+
+def job_result(job):
+    """終わったジョブの応答を表示して返す。失敗・中止・保存期間切れならその旨を表示して None"""
+    if job is None:
+        st.caption("結果の保存期間を過ぎました。もう一度実行してください")
+        return None
+    if job.status == 'failed':
+        if isinstance(job.error, AdmissionError):
+            st.warning(f"⏳ {str(job.error)}")
+        else:
+            st.error(f"❌ エラーが発生しました: {str(job.error)}")
+        return None
+    if job.status == 'cancelled':
+        st.warning("⏹ 中止しました")
+        if job.text():
+            with st.expander("中止までに受け取った内容"):
+                st.markdown(job.text())
+        return None
+    text = job.text()
+    st.markdown(text)
+    st.caption(describe_usage(job.usage))
+    return text
+
+
+def report_downloads(sections, title, file_stem, formats=tuple(REPORT_FORMATS)):
+    """形式ごとのダウンロードボタン（押したときに書き出し、画面は再実行しない）"""
+    formats = [fmt for fmt in formats if fmt != 'parquet' or parquet_available()]
+    for col, fmt in zip(st.columns(len(formats)), formats):
+        name, mime = REPORT_FORMATS[fmt]
+        with col:
+            st.download_button(
+                label=name,
+                data=partial(render, sections, fmt, title=title),
+                file_name=f"{file_stem}.{fmt}",
+                mime=mime,
+                key=f"download:{file_stem}.{fmt}",
+                on_click="ignore"
+            )
+
+
+@cached_figure
+def sensitivity_figure(surface_wacc, surface_growth, surface, wacc, perpetual_growth):
+    """タブ1の感度面（WACC × 永続成長率の等高線）。格子が細かすぎれば間引く"""
+    surface_wacc, surface_growth, surface = downsample_grid(surface_wacc, surface_growth, surface)
+    fig = go.Figure(go.Contour(
+        x=surface_wacc,
+        y=surface_growth,
+        z=surface,
+        colorscale='RdYlGn',
+        contours=dict(coloring='heatmap', showlabels=True),
+        colorbar=dict(title='株式価値<br>（百万円）'),
+        hovertemplate='WACC %{x:.2f}%<br>永続成長率 %{y:.2f}%<br>株式価値 %{z:.0f}百万円<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=[wacc],
+        y=[perpetual_growth],
+        mode='markers',
+        marker=dict(color='black', size=10, symbol='x'),
+        name='現在の前提',
+        hoverinfo='skip'
+    ))
+    fig.update_layout(
+        title="感度分析（空白部分は WACC ≤ 永続成長率）",
+        xaxis_title="WACC（%）",
+        yaxis_title="永続成長率（%）",
+        showlegend=False,
+        height=450
+    )
+    return fig
+
+
+@cached_figure
+def fan_figure(year_labels, company_value_bands, owner_value_bands, n_paths):
+    """タブ3のモンテカルロのファンチャート（パーセンタイルの帯と中央値）"""
+    fig = go.Figure()
+    median_idx = PERCENTILES.index(50)
+    for bands, name, rgb in [(company_value_bands, '企業価値', '46, 134, 171'),
+                             (owner_value_bands, 'あなたの持分価値', '46, 160, 90')]:
+        fig.add_traces(band_traces(year_labels, bands, PERCENTILES, name, rgb, median_idx))
+    fig.update_layout(
+        title=f"企業価値と持分価値の分布（{n_paths:,}パス）",
+        xaxis_title="",
+        yaxis_title="金額（百万円）",
+        height=450
+    )
+    return fig
+
+
+@cached_figure
+def frontier_figure(equity, owner_value, funding, dilution):
+    """タブ4のパレートフロンティア（点が多ければ WebGL で描き、間引く）"""
+    fig = go.Figure(scatter_trace(
+        equity,
+        owner_value,
+        mode='lines+markers',
+        marker=dict(
+            size=10,
+            color=funding,
+            colorscale='Viridis',
+            colorbar=dict(title='調達額<br>（百万円）')
+        ),
+        customdata=np.column_stack([funding, dilution]),
+        hovertemplate='持株 %{x:.0f}%<br>持分価値 %{y:.0f}百万円<br>調達額 %{customdata[0]:.0f}百万円<extra></extra>'
+    ))
+    fig.update_layout(
+        title="パレートフロンティア（経営者持株 × 持分価値 × 調達額）",
+        xaxis_title="経営者持株（%）",
+        yaxis_title="経営者持分価値（百万円）",
+        height=450
+    )
+    return fig
+
+
+@cached_figure
+def waterfall_figure(exit_values, names, payouts, exit_value, exit_label):
+    """タブ3の売却額ごとの株主別の受取額（点が多ければ WebGL で描き、間引く）"""
+    fig = go.Figure([
+        scatter_trace(exit_values, payout, name=name,
+                      hovertemplate=f'{name}<br>売却額 %{{x:,.0f}}百万円<br>受取額 %{{y:,.0f}}百万円<extra></extra>')
+        for name, payout in zip(names, payouts)
+    ])
+    if exit_value > 0:
+        fig.add_vline(x=exit_value, line_dash='dash', line_color='gray', annotation_text=exit_label)
+    fig.update_layout(
+        title="売却額ごとの株主別の受取額",
+        xaxis_title="売却額（百万円）",
+        yaxis_title="受取額（百万円）",
+        height=450
+    )
+    return fig
+
 
 # ページ設定
 st.set_page_config(
@@ -20,7 +510,7 @@ st.set_page_config(
 # タイトル
 st.title("💼 企業資本市場選択肢分析ツール（日本版）")
 st.markdown("""
-> **新機能追加！** 📈 各選択肢の3年後をシミュレーションできます
+> **新機能追加！** 📈 各選択肢の数年後（最長10年・月次も可）をシミュレーションできます
 """)
 
 # サイドバー：企業情報入力
@@ -36,11 +526,7 @@ with st.sidebar:
     years = st.number_input("設立年数", min_value=1, max_value=100, value=8)
     employees = st.number_input("従業員数", min_value=1, value=30, step=5)
     
-    industry = st.selectbox(
-        "業種",
-        ["製造業", "IT・ソフトウェア", "医療・ヘルスケア", "環境・エネルギー", 
-         "小売・サービス", "建設・不動産", "その他"]
-    )
+    industry = st.selectbox("業種", industry_table().names)
     
     location = st.selectbox(
         "本社所在地",
@@ -77,14 +563,26 @@ with st.sidebar:
         ["資金調達", "経営権維持", "ブランド価値向上", "事業提携先獲得", 
          "経営体制強化", "将来的な上場準備", "事業承継"]
     )
+    
+    st.subheader("AI設定")
+    regenerate_ai = st.checkbox(
+        "AIの回答を再生成する",
+        help="オンにすると保存済みの回答を使わず、新しく生成し直します"
+    )
 
-# メイン画面：タブで機能を分割
-tab1, tab2, tab3, tab4 = st.tabs(["💰 企業価値算定", "📋 選択肢分析", "📈 シミュレーター", "📊 比較表"])
+# AIへの共通プレフィックス（3つの分析で同じ企業プロフィールを再利用）
+ai_system = system_prompt(company_profile(
+    revenue, profit, growth_rate, years, employees, industry, location,
+    rd_ratio, has_patent, is_hightech, has_export, need_money,
+    funding_amount, accept_dilution, timeline, priority
+))
 
 # ========================================
 # タブ1: 企業価値算定（新機能！）
 # ========================================
-with tab1:
+@st.fragment
+@timed("tab1")
+def valuation_tab(revenue, profit, growth_rate, industry, ai_system, regenerate_ai):
     st.header("💰 あなたの会社は今いくら？")
     st.markdown("""
     複数の算定方法で、御社の企業価値を簡易的に評価します。
@@ -92,6 +590,7 @@ with tab1:
     """)
     
     # 算定に必要な追加情報
+    spec = valuation_spec(revenue, industry)
     col1, col2 = st.columns(2)
     
     with col1:
@@ -106,9 +605,9 @@ with tab1:
         """)
         
         # 追加情報
-        total_assets = st.number_input("総資産（百万円）", min_value=0, value=int(revenue * 1.2), step=10)
-        total_liabilities = st.number_input("総負債（百万円）", min_value=0, value=int(revenue * 0.5), step=10)
-        depreciation = st.number_input("減価償却費（百万円/年）", min_value=0, value=int(revenue * 0.05), step=1)
+        total_assets = st.number_input("総資産（百万円）", min_value=0, step=10, key=seed(*spec['total_assets']))
+        total_liabilities = st.number_input("総負債（百万円）", min_value=0, step=10, key=seed(*spec['total_liabilities']))
+        depreciation = st.number_input("減価償却費（百万円/年）", min_value=0, step=1, key=seed(*spec['depreciation']))
         
         # 純資産の計算
         net_assets = total_assets - total_liabilities
@@ -117,36 +616,32 @@ with tab1:
         # EBITDA計算
         ebitda = profit + depreciation
         st.metric("EBITDA", f"{ebitda}百万円", help="利益 + 減価償却費")
+        
+        # 逆算したい価格（売り手の希望額・買い手の提示額など）
+        target_price = st.number_input(
+            "目標価格（百万円）", min_value=0, step=10,
+            key=seed(*spec['target_price']),
+            help="入力すると、DCF法でこの株式価値になるWACC・永続成長率を逆算します（0なら逆算しない）"
+        )
     
     with col2:
         st.subheader("⚙️ 算定パラメータ")
         
         # 業種別の標準倍率
-        industry_multiples = {
-            "製造業": {"per": 15, "pbr": 1.2, "ebitda": 5, "year_buy": 3},
-            "IT・ソフトウェア": {"per": 25, "pbr": 3.0, "ebitda": 8, "year_buy": 5},
-            "医療・ヘルスケア": {"per": 20, "pbr": 2.0, "ebitda": 7, "year_buy": 4},
-            "環境・エネルギー": {"per": 18, "pbr": 1.5, "ebitda": 6, "year_buy": 4},
-            "小売・サービス": {"per": 12, "pbr": 1.0, "ebitda": 4, "year_buy": 3},
-            "建設・不動産": {"per": 10, "pbr": 0.8, "ebitda": 5, "year_buy": 3},
-            "その他": {"per": 15, "pbr": 1.2, "ebitda": 5, "year_buy": 3}
-        }
-        
-        default_multiples = industry_multiples.get(industry, industry_multiples["その他"])
-        
         st.markdown(f"**{industry}の標準倍率**")
+        st.caption(f"業種別パラメータ：{industry_table().version}版")
         
         per_multiple = st.slider(
             "PER（株価収益率）",
             min_value=5, max_value=50, 
-            value=default_multiples["per"],
+            key=seed(*spec['per_multiple']),
             help="利益の何倍で評価するか"
         )
         
         pbr_multiple = st.slider(
             "PBR（株価純資産倍率）",
             min_value=0.5, max_value=5.0, 
-            value=default_multiples["pbr"],
+            key=seed(*spec['pbr_multiple']),
             step=0.1,
             help="純資産の何倍で評価するか"
         )
@@ -154,37 +649,91 @@ with tab1:
         ebitda_multiple = st.slider(
             "EBITDA倍率",
             min_value=3, max_value=15,
-            value=default_multiples["ebitda"],
+            key=seed(*spec['ebitda_multiple']),
             help="M&Aでよく使われる"
         )
         
         year_buy_multiple = st.slider(
             "年買法（営業利益の年数）",
             min_value=2, max_value=7,
-            value=default_multiples["year_buy"],
+            key=seed(*spec['year_buy_multiple']),
             help="中小企業M&Aの実務で一般的"
         )
         
         discount_rate = st.slider(
             "割引率（%）",
             min_value=3, max_value=15,
-            value=8,
+            key=seed(*spec['discount_rate']),
             help="DCF法で使用"
         )
+        
+        dcf_years = st.slider(
+            "DCF予測期間（年）",
+            min_value=MIN_DCF_YEARS, max_value=MAX_DCF_YEARS,
+            key=seed(*spec['dcf_years']),
+            help="FCFを個別に予測する年数。以降は継続価値で評価"
+        )
     
-    # 算定実行ボタン
-    if st.button("🧮 企業価値を算定する", type="primary", use_container_width=True):
+    # 算定実行ボタン。押したときの入力値を保存し、エキスパンダーの開閉などで再実行しても
+    # その値での結果を表示し続ける（AIコメントは押したときだけ作成する）
+    current_inputs = {
+        'revenue': revenue, 'profit': profit, 'industry': industry, 'growth_rate': growth_rate,
+        'total_assets': total_assets, 'total_liabilities': total_liabilities, 'depreciation': depreciation,
+        'target_price': target_price, 'per_multiple': per_multiple, 'pbr_multiple': pbr_multiple,
+        'ebitda_multiple': ebitda_multiple, 'year_buy_multiple': year_buy_multiple, 'dcf_years': dcf_years,
+    }
+    clicked = st.button("🧮 企業価値を算定する", type="primary", use_container_width=True)
+    if clicked:
+        st.session_state['valuation_inputs'] = current_inputs
+        st.session_state.pop('valuation_comment', None)
+    
+    if 'valuation_inputs' in st.session_state:
         
         st.markdown("---")
-        st.success("✅ 算定完了！")
+        inputs = st.session_state['valuation_inputs']
+        if inputs != current_inputs:
+            st.warning("⚠️ 入力値が算定時から変わっています。下の結果は算定時の値によるものです。"
+                       "「企業価値を算定する」を押すと再計算します")
+        else:
+            st.success("✅ 算定完了！")
+        # 以降は算定時の値で計算する
+        revenue = inputs['revenue']
+        profit = inputs['profit']
+        industry = inputs['industry']
+        growth_rate = inputs['growth_rate']
+        total_assets = inputs['total_assets']
+        total_liabilities = inputs['total_liabilities']
+        depreciation = inputs['depreciation']
+        target_price = inputs['target_price']
+        per_multiple = inputs['per_multiple']
+        pbr_multiple = inputs['pbr_multiple']
+        ebitda_multiple = inputs['ebitda_multiple']
+        year_buy_multiple = inputs['year_buy_multiple']
+        dcf_years = inputs['dcf_years']
+        net_assets = total_assets - total_liabilities
+        ebitda = profit + depreciation
+        
+        # 各手法で算定（計算は capital_core の一括算定エンジンに委譲）
+        with span("tab1.valuation"):
+            result = cached_value_companies(
+                revenue, profit, total_assets, total_liabilities, depreciation,
+                industry=industry,
+                growth_rate=growth_rate,
+                per_multiple=per_multiple,
+                pbr_multiple=pbr_multiple,
+                ebitda_multiple=ebitda_multiple,
+                year_buy_multiple=year_buy_multiple,
+                dcf_years=dcf_years,
+                parameters=industry_table(),
+            )
+        dcf = {k: v[0] for k, v in result['dcf'].items()}
         
-        # 各手法で算定
         valuations = {}
         
         # 1. PER法（株価収益率法）
         if profit > 0:
             valuations['PER法'] = {
-                'value': profit * per_multiple,
+                'value': result['PER法'][0],
                 'formula': f'{profit}百万円 × {per_multiple}倍',
                 'description': '利益ベースの評価。成長企業向け。',
                 'suitable': '✅' if profit > 0 and growth_rate > 10 else '△'
@@ -193,7 +742,7 @@ with tab1:
         # 2. PBR法（株価純資産倍率法）
         if net_assets > 0:
             valuations['PBR法'] = {
-                'value': net_assets * pbr_multiple,
+                'value': result['PBR法'][0],
                 'formula': f'{net_assets}百万円 × {pbr_multiple}倍',
                 'description': '純資産ベースの評価。安定企業向け。',
                 'suitable': '✅' if net_assets > 0 else '△'
@@ -202,7 +751,7 @@ with tab1:
         # 3. EBITDA倍率法
         if ebitda > 0:
             valuations['EBITDA倍率法'] = {
-                'value': ebitda * ebitda_multiple,
+                'value': result['EBITDA倍率法'][0],
                 'formula': f'{ebitda}百万円 × {ebitda_multiple}倍',
                 'description': 'M&Aで最も一般的。キャッシュフロー重視。',
                 'suitable': '✅'
@@ -211,140 +760,44 @@ with tab1:
         # 4. 年買法（中小企業M&Aの実務）
         time_net_assets = net_assets  # 時価純資産（簡易的には帳簿価額）
         valuations['年買法'] = {
-            'value': time_net_assets + (profit * year_buy_multiple),
+            'value': result['年買法'][0],
             'formula': f'{time_net_assets}百万円 + ({profit}百万円 × {year_buy_multiple}年)',
             'description': '日本の中小企業M&Aで実際に使われる方法。',
             'suitable': '✅'
         }
         
         # 5. DCF法（詳細版）
-        # ===== WACC（加重平均資本コスト）の計算 =====
-        
-        # 株主資本コスト（CAPM簡易版）
-        risk_free_rate = 0.5  # 日本国債利回り
-        market_risk_premium = 6.0  # 株式リスクプレミアム
-        
-        # ベータ（業種別）
-        industry_beta = {
-            "製造業": 1.0,
-            "IT・ソフトウェア": 1.3,
-            "医療・ヘルスケア": 0.9,
-            "環境・エネルギー": 1.1,
-            "小売・サービス": 0.8,
-            "建設・不動産": 1.2,
-            "その他": 1.0
-        }
-        
-        beta = industry_beta.get(industry, 1.0)
-        cost_of_equity = risk_free_rate + beta * market_risk_premium  # CAPM
-        
-        # 負債コスト
-        cost_of_debt = 2.0  # 簡易的に2%
-        tax_rate = 30  # 法人税率30%
-        
-        # 資本構成（簡易的に負債比率を計算）
-        if total_assets > 0:
-            debt_ratio = total_liabilities / total_assets
-            equity_ratio = 1 - debt_ratio
-        else:
-            debt_ratio = 0.3
-            equity_ratio = 0.7
-        
-        # WACC計算
-        wacc = (cost_of_equity * equity_ratio) + (cost_of_debt * (1 - tax_rate/100) * debt_ratio)
-        
-        # ===== フリーキャッシュフロー（FCF）の詳細計算 =====
-        
-        # 初年度のFCF
-        ebit = profit  # 簡易的に営業利益≒経常利益
-        nopat = ebit * (1 - tax_rate/100)  # 税引後営業利益
-        
-        # 運転資本の増減（簡易的に売上の2%）
-        delta_working_capital = revenue * 0.02
-        
-        # 設備投資（簡易的に減価償却費の1.2倍）
-        capex = depreciation * 1.2
-        
-        # 初年度FCF
-        base_fcf = nopat + depreciation - delta_working_capital - capex
-        
-        # ===== 5年間の詳細予測 =====
-        fcf_projections = []
-        pv_fcf_total = 0
-        
-        for year in range(1, 6):
-            # 成長率の逓減（毎年10%ずつ低下）
-            year_growth = growth_rate * (0.9 ** (year - 1))
-            
-            # その年の予測売上
-            projected_revenue = revenue * ((1 + year_growth/100) ** year)
-            
-            # その年の予測利益（利益率は徐々に改善）
-            profit_margin = (profit / revenue) if revenue > 0 else 0.1
-            improved_margin = profit_margin + (0.01 * year)  # 年1%ポイント改善
-            projected_profit = projected_revenue * improved_margin
-            
-            # その年のFCF
-            year_ebit = projected_profit
-            year_nopat = year_ebit * (1 - tax_rate/100)
-            year_depreciation = depreciation * ((1 + year_growth/100) ** year)
-            year_wc_change = projected_revenue * 0.02 * (year_growth/100)
-            year_capex = year_depreciation * 1.2
-            
-            year_fcf = year_nopat + year_depreciation - year_wc_change - year_capex
-            
-            # 現在価値に割引
-            discount_factor = (1 + wacc/100) ** year
-            pv_fcf = year_fcf / discount_factor
-            
-            pv_fcf_total += pv_fcf
-            
-            fcf_projections.append({
+        beta_value = dcf['beta']
+        cost_of_equity = dcf['cost_of_equity']
+        cost_of_debt = COST_OF_DEBT
+        debt_ratio = dcf['debt_ratio']
+        equity_ratio = dcf['equity_ratio']
+        wacc = dcf['wacc']
+        final_year_fcf = dcf['final_year_fcf']
+        dcf_equity_value = dcf['equity_value']
+        fcf_projections = [
+            {
                 'year': year,
-                'revenue': projected_revenue,
-                'fcf': year_fcf,
-                'pv_fcf': pv_fcf
-            })
-        
-        # ===== ターミナルバリュー（継続価値）の計算 =====
-        
-        # 永続成長率（通常2-3%）
-        perpetual_growth_rate = min(2.5, growth_rate * 0.3)  # 成長率の30%、最大2.5%
-        
-        # 最終年のFCF
-        final_year_fcf = fcf_projections[-1]['fcf']
-        
-        # ゴードン成長モデル
-        if wacc > perpetual_growth_rate:
-            terminal_value = (final_year_fcf * (1 + perpetual_growth_rate/100)) / ((wacc - perpetual_growth_rate) / 100)
-            
-            # ターミナルバリューの現在価値
-            pv_terminal_value = terminal_value / ((1 + wacc/100) ** 5)
-        else:
-            # WACCが永続成長率以下の場合はExit倍率法
-            pv_terminal_value = final_year_fcf * ebitda_multiple / ((1 + wacc/100) ** 5)
-        
-        # ===== 企業価値 =====
-        dcf_enterprise_value = pv_fcf_total + pv_terminal_value
-        
-        # 株式価値 = 企業価値 - 純有利子負債
-        # 簡易的に純有利子負債 = 総負債 × 50%
-        net_debt = total_liabilities * 0.5
-        dcf_equity_value = dcf_enterprise_value - net_debt
+                'revenue': dcf['revenue'][year - 1],
+                'fcf': dcf['fcf'][year - 1],
+                'pv_fcf': dcf['pv_fcf'][year - 1]
+            }
+            for year in range(1, len(dcf['fcf']) + 1)
+        ]
         
         if dcf_equity_value > 0:
             valuations['DCF法（詳細版）'] = {
                 'value': dcf_equity_value,
-                'formula': f'PV(5年間FCF) + PV(継続価値) - 純負債',
+                'formula': f'PV({dcf_years}年間FCF) + PV(継続価値) - 純負債',
                 'description': f'WACC {wacc:.1f}%で割引。理論的に最も正確。',
                 'suitable': '✅' if growth_rate > 0 else '△',
                 'details': {
                     'wacc': wacc,
-                    'fcf_pv': pv_fcf_total,
-                    'terminal_pv': pv_terminal_value,
-                    'enterprise_value': dcf_enterprise_value,
-                    'net_debt': net_debt,
-                    'perpetual_growth': perpetual_growth_rate,
+                    'fcf_pv': dcf['fcf_pv'],
+                    'terminal_pv': dcf['terminal_pv'],
+                    'enterprise_value': dcf['enterprise_value'],
+                    'net_debt': dcf['net_debt'],
+                    'perpetual_growth': dcf['perpetual_growth'],
                     'projections': fcf_projections
                 }
             }
@@ -366,251 +819,320 @@ with tab1:
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            median_value = sorted([v['value'] for v in valuations.values()])[len(valuations)//2]
+            median_value = result['median'][0]
             st.metric("中央値", f"{median_value:.0f}百万円", help="最も信頼できる目安")
         
         with col2:
-            max_value = max([v['value'] for v in valuations.values()])
+            max_value = result['max'][0]
             st.metric("最高値", f"{max_value:.0f}百万円", help="最も楽観的な評価")
         
         with col3:
-            min_value = min([v['value'] for v in valuations.values()])
+            min_value = result['min'][0]
             st.metric("最低値", f"{min_value:.0f}百万円", help="最も保守的な評価")
         
         with col4:
-            avg_value = sum([v['value'] for v in valuations.values()]) / len(valuations)
+            avg_value = result['mean'][0]
             st.metric("平均値", f"{avg_value:.0f}百万円", help="参考値")
         
         # 詳細な比較表
         st.subheader("📋 手法別詳細")
         
-        comparison_data = []
-        for method, data in valuations_list:
-            comparison_data.append({
-                '算定方法': method,
-                '企業価値': f"{data['value']:.0f}百万円",
-                '計算式': data['formula'],
-                '説明': data['description'],
-                '適用性': data['suitable']
-            })
+        with span("tab1.table"):
+            comparison_data = []
+            for method, data in valuations_list:
+                comparison_data.append({
+                    '算定方法': method,
+                    '企業価値': f"{data['value']:.0f}百万円",
+                    '計算式': data['formula'],
+                    '説明': data['description'],
+                    '適用性': data['suitable']
+                })
         
-        comparison_df = pd.DataFrame(comparison_data)
-        st.dataframe(comparison_df, use_container_width=True, hide_index=True)
+            comparison_df = pd.DataFrame(comparison_data)
+            st.dataframe(comparison_df, use_container_width=True, hide_index=True)
         
         # グラフで可視化
         st.subheader("📊 手法別比較（棒グラフ）")
         
-        fig = go.Figure()
+        with span("tab1.fig_methods"):
+            fig = go.Figure()
         
-        methods = [item[0] for item in valuations_list]
-        values = [item[1]['value'] for item in valuations_list]
-        colors = ['#2E86AB' if v == median_value else '#A23B72' if v == max_value else '#F18F01' if v == min_value else '#C6CACC' 
-                  for v in values]
+            methods = [item[0] for item in valuations_list]
+            values = [item[1]['value'] for item in valuations_list]
+            colors = ['#2E86AB' if v == median_value else '#A23B72' if v == max_value else '#F18F01' if v == min_value else '#C6CACC' 
+                      for v in values]
         
-        fig.add_trace(go.Bar(
-            x=methods,
-            y=values,
-            marker_color=colors,
-            text=[f"{v:.0f}百万円" for v in values],
-            textposition='outside'
-        ))
+            fig.add_trace(go.Bar(
+                x=methods,
+                y=values,
+                marker_color=colors,
+                text=[f"{v:.0f}百万円" for v in values],
+                textposition='outside'
+            ))
         
-        fig.update_layout(
-            xaxis_title="算定方法",
-            yaxis_title="企業価値（百万円）",
-            height=400,
-            showlegend=False
-        )
+            fig.update_layout(
+                xaxis_title="算定方法",
+                yaxis_title="企業価値（百万円）",
+                height=400,
+                showlegend=False
+            )
         
-        # 中央値のラインを追加
-        fig.add_hline(y=median_value, line_dash="dash", line_color="red", 
-                      annotation_text=f"中央値: {median_value:.0f}百万円")
+            # 中央値のラインを追加
+            fig.add_hline(y=median_value, line_dash="dash", line_color="red", 
+                          annotation_text=f"中央値: {median_value:.0f}百万円")
         
-        st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True)
         
         # DCF法の詳細内訳（エキスパンダー内）
         if 'DCF法（詳細版）' in valuations:
             st.subheader("🔬 DCF法の詳細内訳")
             
-            with st.expander("📊 DCF計算の詳細を表示", expanded=False):
-                dcf_details = valuations['DCF法（詳細版）']['details']
-                
-                # パラメータ表示
-                st.markdown("### 📋 主要パラメータ")
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    st.metric("WACC", f"{dcf_details['wacc']:.2f}%", help="加重平均資本コスト")
-                
-                with col2:
-                    st.metric("永続成長率", f"{dcf_details['perpetual_growth']:.2f}%", help="6年目以降の成長率")
-                
-                with col3:
-                    beta_value = industry_beta.get(industry, 1.0)
-                    st.metric("ベータ", f"{beta_value:.2f}", help="市場リスクとの相関")
-                
-                with col4:
-                    st.metric("負債比率", f"{debt_ratio*100:.1f}%", help="総資産に占める負債")
-                
-                # 5年間のFCF予測テーブル
-                st.markdown("### 📅 5年間のキャッシュフロー予測")
-                
-                fcf_df = pd.DataFrame(dcf_details['projections'])
-                fcf_df['revenue'] = fcf_df['revenue'].apply(lambda x: f"{x:.0f}百万円")
-                fcf_df['fcf'] = fcf_df['fcf'].apply(lambda x: f"{x:.0f}百万円")
-                fcf_df['pv_fcf'] = fcf_df['pv_fcf'].apply(lambda x: f"{x:.0f}百万円")
-                fcf_df.columns = ['年', '予測売上', 'FCF', 'FCF現在価値']
-                
-                st.dataframe(fcf_df, use_container_width=True, hide_index=True)
-                
-                # FCF推移グラフ
-                fig_fcf = go.Figure()
-                
-                fcf_years = [f"{p['year']}年目" for p in dcf_details['projections']]
-                fcf_values = [p['fcf'] for p in dcf_details['projections']]
-                pv_fcf_values = [p['pv_fcf'] for p in dcf_details['projections']]
-                
-                fig_fcf.add_trace(go.Bar(
-                    name='FCF（額面）',
-                    x=fcf_years,
-                    y=fcf_values,
-                    marker_color='lightblue'
-                ))
-                
-                fig_fcf.add_trace(go.Bar(
-                    name='FCF（現在価値）',
-                    x=fcf_years,
-                    y=pv_fcf_values,
-                    marker_color='darkblue'
-                ))
-                
-                fig_fcf.update_layout(
-                    title="フリーキャッシュフロー（FCF）の推移",
-                    xaxis_title="",
-                    yaxis_title="金額（百万円）",
-                    barmode='group',
-                    height=400
-                )
-                
-                st.plotly_chart(fig_fcf, use_container_width=True)
-                
-                # 価値の内訳（ウォーターフォール）
-                st.markdown("### 💧 企業価値の内訳（ウォーターフォール）")
-                
-                fig_waterfall = go.Figure(go.Waterfall(
-                    name="企業価値",
-                    orientation="v",
-                    measure=["relative", "relative", "total", "relative", "total"],
-                    x=["5年間FCF<br>現在価値", "継続価値<br>現在価値", "企業価値", "純有利子負債<br>（控除）", "株式価値"],
-                    y=[dcf_details['fcf_pv'], dcf_details['terminal_pv'], 0, -dcf_details['net_debt'], 0],
-                    text=[f"{dcf_details['fcf_pv']:.0f}", 
-                          f"{dcf_details['terminal_pv']:.0f}", 
-                          f"{dcf_details['enterprise_value']:.0f}",
-                          f"-{dcf_details['net_debt']:.0f}",
-                          f"{dcf_equity_value:.0f}"],
-                    textposition="outside",
-                    connector={"line": {"color": "rgb(63, 63, 63)"}},
-                ))
-                
-                fig_waterfall.update_layout(
-                    title="DCF法による企業価値の算定プロセス",
-                    showlegend=False,
-                    height=400
-                )
-                
-                st.plotly_chart(fig_waterfall, use_container_width=True)
-                
-                # 計算式の説明
-                st.markdown("### 📐 計算式の詳細")
-                
-                st.markdown(f"""
-                **1. WACC（加重平均資本コスト）の計算**
-                ```
-                株主資本コスト = リスクフリーレート + ベータ × マーケットリスクプレミアム
-                                = 0.5% + {beta_value:.2f} × 6.0%
-                                = {cost_of_equity:.2f}%
-                
-                負債コスト（税引後） = 2.0% × (1 - 30%)
-                                      = {cost_of_debt * 0.7:.2f}%
-                
-                WACC = {cost_of_equity:.2f}% × {equity_ratio:.1%} + {cost_of_debt * 0.7:.2f}% × {debt_ratio:.1%}
-                     = {dcf_details['wacc']:.2f}%
-                ```
-                
-                **2. フリーキャッシュフロー（FCF）の計算**
-                ```
-                各年のFCF = 税引後営業利益（NOPAT）
-                          + 減価償却費
-                          - 運転資本増加
-                          - 設備投資（CAPEX）
-                ```
-                
-                **3. ターミナルバリュー（継続価値）**
-                ```
-                継続価値 = 最終年FCF × (1 + 永続成長率) / (WACC - 永続成長率)
-                         = {final_year_fcf:.0f}百万円 × 1.{int(dcf_details['perpetual_growth']*10):02d} / ({dcf_details['wacc']:.1f}% - {dcf_details['perpetual_growth']:.1f}%)
-                         = {dcf_details['terminal_pv'] * ((1 + dcf_details['wacc']/100) ** 5):.0f}百万円
-                
-                現在価値 = {dcf_details['terminal_pv'] * ((1 + dcf_details['wacc']/100) ** 5):.0f}百万円 / (1 + {dcf_details['wacc']:.1f}%)^5
-                         = {dcf_details['terminal_pv']:.0f}百万円
-                ```
-                
-                **4. 株式価値の算定**
-                ```
-                企業価値（EV） = 5年間FCF現在価値 + 継続価値現在価値
-                               = {dcf_details['fcf_pv']:.0f}百万円 + {dcf_details['terminal_pv']:.0f}百万円
-                               = {dcf_details['enterprise_value']:.0f}百万円
-                
-                株式価値 = 企業価値 - 純有利子負債
-                         = {dcf_details['enterprise_value']:.0f}百万円 - {dcf_details['net_debt']:.0f}百万円
-                         = {dcf_equity_value:.0f}百万円
-                ```
-                """)
-                
-                # 感度分析
-                st.markdown("### 🎚️ 感度分析")
-                
-                st.markdown("WACCと永続成長率が変わった場合の企業価値の変化：")
-                
-                # 感度分析の計算
-                wacc_range = [dcf_details['wacc'] - 2, dcf_details['wacc'] - 1, dcf_details['wacc'], 
-                              dcf_details['wacc'] + 1, dcf_details['wacc'] + 2]
-                growth_range = [max(0, dcf_details['perpetual_growth'] - 1), 
-                               dcf_details['perpetual_growth'], 
-                               min(5, dcf_details['perpetual_growth'] + 1)]
-                
-                sensitivity_data = []
-                
-                for g in growth_range:
-                    row = {'永続成長率': f"{g:.1f}%"}
-                    for w in wacc_range:
-                        if w > g:
-                            # 簡易的な再計算
-                            tv = (final_year_fcf * (1 + g/100)) / ((w - g) / 100)
-                            pv_tv = tv / ((1 + w/100) ** 5)
-                            ev = dcf_details['fcf_pv'] + pv_tv
-                            equity = ev - dcf_details['net_debt']
-                            row[f'WACC {w:.1f}%'] = f"{equity:.0f}"
-                        else:
-                            row[f'WACC {w:.1f}%'] = "N/A"
-                    sensitivity_data.append(row)
-                
-                sensitivity_df = pd.DataFrame(sensitivity_data)
-                
-                # 現在の値をハイライト
-                st.dataframe(
-                    sensitivity_df,
-                    use_container_width=True,
-                    hide_index=True
-                )
-                
-                st.info(f"""
-                💡 **感度分析の読み方**
-                - 中央の値（{dcf_equity_value:.0f}百万円）が現在の前提条件での企業価値
-                - WACCが1%上がると企業価値は下がる（割引率が高い = 将来価値が低い）
-                - 永続成長率が1%上がると企業価値は上がる（将来の成長期待）
-                - 通常、±2%の範囲で企業価値がどう変わるかを見る
-                """)
+            # 開いたときだけ中身（FCF予測・内訳のグラフ・感度分析）を作る
+            dcf_expander = st.expander("📊 DCF計算の詳細を表示", expanded=False, key="dcf_details", on_change="rerun")
+            with dcf_expander:
+                if dcf_expander.open:
+                    dcf_details = valuations['DCF法（詳細版）']['details']
+                    
+                    # パラメータ表示
+                    st.markdown("### 📋 主要パラメータ")
+                    col1, col2, col3, col4 = st.columns(4)
+                    
+                    with col1:
+                        st.metric("WACC", f"{dcf_details['wacc']:.2f}%", help="加重平均資本コスト")
+                    
+                    with col2:
+                        st.metric("永続成長率", f"{dcf_details['perpetual_growth']:.2f}%", help=f"{dcf_years + 1}年目以降の成長率")
+                    
+                    with col3:
+                        st.metric("ベータ", f"{beta_value:.2f}", help="市場リスクとの相関")
+                    
+                    with col4:
+                        st.metric("負債比率", f"{debt_ratio*100:.1f}%", help="総資産に占める負債")
+                    
+                    # 予測期間のFCF予測テーブル
+                    st.markdown(f"### 📅 {dcf_years}年間のキャッシュフロー予測")
+                    
+                    with span("tab1.fcf_table"):
+                        fcf_df = pd.DataFrame(dcf_details['projections'])
+                        fcf_df['revenue'] = fcf_df['revenue'].apply(lambda x: f"{x:.0f}百万円")
+                        fcf_df['fcf'] = fcf_df['fcf'].apply(lambda x: f"{x:.0f}百万円")
+                        fcf_df['pv_fcf'] = fcf_df['pv_fcf'].apply(lambda x: f"{x:.0f}百万円")
+                        fcf_df.columns = ['年', '予測売上', 'FCF', 'FCF現在価値']
+                    
+                        st.dataframe(fcf_df, use_container_width=True, hide_index=True)
+                    
+                    # FCF推移グラフ
+                    with span("tab1.fig_fcf"):
+                        fig_fcf = go.Figure()
+                    
+                        fcf_years = [f"{p['year']}年目" for p in dcf_details['projections']]
+                        fcf_values = [p['fcf'] for p in dcf_details['projections']]
+                        pv_fcf_values = [p['pv_fcf'] for p in dcf_details['projections']]
+                    
+                        fig_fcf.add_trace(go.Bar(
+                            name='FCF（額面）',
+                            x=fcf_years,
+                            y=fcf_values,
+                            marker_color='lightblue'
+                        ))
+                    
+                        fig_fcf.add_trace(go.Bar(
+                            name='FCF（現在価値）',
+                            x=fcf_years,
+                            y=pv_fcf_values,
+                            marker_color='darkblue'
+                        ))
+                    
+                        fig_fcf.update_layout(
+                            title="フリーキャッシュフロー（FCF）の推移",
+                            xaxis_title="",
+                            yaxis_title="金額（百万円）",
+                            barmode='group',
+                            height=400
+                        )
+                    
+                        st.plotly_chart(fig_fcf, use_container_width=True)
+                    
+                    # 価値の内訳（ウォーターフォール）
+                    st.markdown("### 💧 企業価値の内訳（ウォーターフォール）")
+                    
+                    with span("tab1.fig_waterfall"):
+                        fig_waterfall = go.Figure(go.Waterfall(
+                            name="企業価値",
+                            orientation="v",
+                            measure=["relative", "relative", "total", "relative", "total"],
+                            x=[f"{dcf_years}年間FCF<br>現在価値", "継続価値<br>現在価値", "企業価値", "純有利子負債<br>（控除）", "株式価値"],
+                            y=[dcf_details['fcf_pv'], dcf_details['terminal_pv'], 0, -dcf_details['net_debt'], 0],
+                            text=[f"{dcf_details['fcf_pv']:.0f}", 
+                                  f"{dcf_details['terminal_pv']:.0f}", 
+                                  f"{dcf_details['enterprise_value']:.0f}",
+                                  f"-{dcf_details['net_debt']:.0f}",
+                                  f"{dcf_equity_value:.0f}"],
+                            textposition="outside",
+                            connector={"line": {"color": "rgb(63, 63, 63)"}},
+                        ))
+                    
+                        fig_waterfall.update_layout(
+                            title="DCF法による企業価値の算定プロセス",
+                            showlegend=False,
+                            height=400
+                        )
+                    
+                        st.plotly_chart(fig_waterfall, use_container_width=True)
+                    
+                    # 計算式の説明
+                    st.markdown("### 📐 計算式の詳細")
+                    
+                    st.markdown(f"""
+                    **1. WACC（加重平均資本コスト）の計算**
+                    ```
+                    株主資本コスト = リスクフリーレート + ベータ × マーケットリスクプレミアム
+                                    = 0.5% + {beta_value:.2f} × 6.0%
+                                    = {cost_of_equity:.2f}%
+                    
+                    負債コスト（税引後） = 2.0% × (1 - 30%)
+                                          = {cost_of_debt * 0.7:.2f}%
+                    
+                    WACC = {cost_of_equity:.2f}% × {equity_ratio:.1%} + {cost_of_debt * 0.7:.2f}% × {debt_ratio:.1%}
+                         = {dcf_details['wacc']:.2f}%
+                    ```
+                    
+                    **2. フリーキャッシュフロー（FCF）の計算**
+                    ```
+                    各年のFCF = 税引後営業利益（NOPAT）
+                              + 減価償却費
+                              - 運転資本増加
+                              - 設備投資（CAPEX）
+                    ```
+                    
+                    **3. ターミナルバリュー（継続価値）**
+                    ```
+                    継続価値 = 最終年FCF × (1 + 永続成長率) / (WACC - 永続成長率)
+                             = {final_year_fcf:.0f}百万円 × 1.{int(dcf_details['perpetual_growth']*10):02d} / ({dcf_details['wacc']:.1f}% - {dcf_details['perpetual_growth']:.1f}%)
+                             = {dcf_details['terminal_pv'] * ((1 + dcf_details['wacc']/100) ** dcf_years):.0f}百万円
+                    
+                    現在価値 = {dcf_details['terminal_pv'] * ((1 + dcf_details['wacc']/100) ** dcf_years):.0f}百万円 / (1 + {dcf_details['wacc']:.1f}%)^{dcf_years}
+                             = {dcf_details['terminal_pv']:.0f}百万円
+                    ```
+                    
+                    **4. 株式価値の算定**
+                    ```
+                    企業価値（EV） = {dcf_years}年間FCF現在価値 + 継続価値現在価値
+                                   = {dcf_details['fcf_pv']:.0f}百万円 + {dcf_details['terminal_pv']:.0f}百万円
+                                   = {dcf_details['enterprise_value']:.0f}百万円
+                    
+                    株式価値 = 企業価値 - 純有利子負債
+                             = {dcf_details['enterprise_value']:.0f}百万円 - {dcf_details['net_debt']:.0f}百万円
+                             = {dcf_equity_value:.0f}百万円
+                    ```
+                    """)
+                    
+                    # 感度分析
+                    st.markdown("### 🎚️ 感度分析")
+                    
+                    st.markdown("WACCと永続成長率が変わった場合の企業価値の変化：")
+                    
+                    # 感度分析の計算（グリッド全体を一括計算、WACC ≤ 永続成長率は NaN）
+                    with span("tab1.sensitivity"):
+                        wacc_range = np.array([dcf_details['wacc'] - 2, dcf_details['wacc'] - 1, dcf_details['wacc'], 
+                                               dcf_details['wacc'] + 1, dcf_details['wacc'] + 2])
+                        growth_range = np.array([max(0, dcf_details['perpetual_growth'] - 1), 
+                                                 dcf_details['perpetual_growth'], 
+                                                 min(5, dcf_details['perpetual_growth'] + 1)])
+                    
+                        sensitivity_values = cached_sensitivity_surface(
+                            final_year_fcf, dcf_details['fcf_pv'], dcf_details['net_debt'],
+                            wacc_range, growth_range, years=dcf_years
+                        )
+                    
+                        sensitivity_df = pd.DataFrame(
+                            sensitivity_values,
+                            columns=[f'WACC {w:.1f}%' for w in wacc_range]
+                        )
+                        sensitivity_df.insert(0, '永続成長率', [f"{g:.1f}%" for g in growth_range])
+                    
+                        # 現在の値をハイライト
+                        st.dataframe(
+                            sensitivity_df.style.format("{:.0f}", subset=sensitivity_df.columns[1:], na_rep="N/A"),
+                            use_container_width=True,
+                            hide_index=True
+                        )
+                    
+                        # 高解像度の感度面（ヒートマップ＋等高線）
+                        surface_wacc, surface_growth = sensitivity_axes(
+                            dcf_details['wacc'], dcf_details['perpetual_growth'],
+                            resolution=SENSITIVITY_RESOLUTION
+                        )
+                        surface = cached_sensitivity_surface(
+                            final_year_fcf, dcf_details['fcf_pv'], dcf_details['net_debt'],
+                            surface_wacc, surface_growth, years=dcf_years
+                        )
+                    
+                        fig_sensitivity = sensitivity_figure(
+                            surface_wacc, surface_growth, surface,
+                            dcf_details['wacc'], dcf_details['perpetual_growth']
+                        )
+                    
+                        st.plotly_chart(fig_sensitivity, use_container_width=True)
+                    
+                    st.info(f"""
+                    💡 **感度分析の読み方**
+                    - 中央の値（{dcf_equity_value:.0f}百万円）が現在の前提条件での企業価値
+                    - WACCが1%上がると企業価値は下がる（割引率が高い = 将来価値が低い）
+                    - 永続成長率が1%上がると企業価値は上がる（将来の成長期待）
+                    - 通常、±2%の範囲で企業価値がどう変わるかを見る
+                    """)
+                    
+                    # 目標価格からの逆算（複数の価格をまとめて解く）
+                    if target_price > 0:
+                        st.markdown("### 🎯 目標価格からの逆算")
+                        
+                        with span("tab1.goal_seek"):
+                            target_prices = target_price * np.array([0.8, 0.9, 1.0, 1.1, 1.2])
+                            solved_wacc = implied_wacc(
+                                dcf['fcf'], dcf_details['net_debt'], dcf_details['perpetual_growth'], target_prices
+                            )
+                            solved_growth = implied_perpetual_growth(
+                                dcf['fcf'], dcf_details['net_debt'], dcf_details['wacc'], target_prices
+                            )
+                        
+                        target_wacc = solved_wacc['root'][2]
+                        target_growth = solved_growth[2]
+                        col1, col2 = st.columns(2)
+                        
+                        with col1:
+                            if np.isnan(target_wacc):
+                                st.metric("必要なWACC", "解なし", help=f"永続成長率〜{MAX_WACC:.0f}%の範囲に解がありません")
+                            else:
+                                st.metric(
+                                    "必要なWACC", f"{target_wacc:.2f}%",
+                                    delta=f"{target_wacc - dcf_details['wacc']:+.2f}%pt", delta_color="off",
+                                    help=f"永続成長率 {dcf_details['perpetual_growth']:.2f}% のまま、株式価値が{target_price:,}百万円になるWACC"
+                                )
+                        
+                        with col2:
+                            if np.isnan(target_growth):
+                                st.metric("必要な永続成長率", "解なし", help="継続価値がマイナスになる価格です")
+                            else:
+                                st.metric(
+                                    "必要な永続成長率", f"{target_growth:.2f}%",
+                                    delta=f"{target_growth - dcf_details['perpetual_growth']:+.2f}%pt", delta_color="off",
+                                    help=f"WACC {dcf_details['wacc']:.2f}% のまま、株式価値が{target_price:,}百万円になる永続成長率"
+                                )
+                        
+                        goal_seek_df = pd.DataFrame({
+                            '目標価格': [f"{p:,.0f}百万円" for p in target_prices],
+                            '必要なWACC': solved_wacc['root'],
+                            '必要な永続成長率': solved_growth,
+                            '反復回数': solved_wacc['iterations'],
+                            '収束': np.where(solved_wacc['converged'], '✅', '—'),
+                        })
+                        st.dataframe(
+                            goal_seek_df.style.format("{:.2f}%", subset=['必要なWACC', '必要な永続成長率'], na_rep="解なし"),
+                            use_container_width=True,
+                            hide_index=True
+                        )
+                        st.caption("予測期間のFCFは固定し、継続価値はゴードン成長モデルで計算しています（WACCを変えると予測期間のFCFも割り引き直します）")
         
         # レンジ表示（レーダーチャート風）
         st.subheader("🎯 妥当価格レンジ")
@@ -619,32 +1141,33 @@ with tab1:
         
         with col1:
             # 価格レンジをビジュアル化
-            fig_range = go.Figure()
+            with span("tab1.fig_gauge"):
+                fig_range = go.Figure()
             
-            fig_range.add_trace(go.Indicator(
-                mode = "gauge+number+delta",
-                value = median_value,
-                domain = {'x': [0, 1], 'y': [0, 1]},
-                title = {'text': "企業価値（中央値）"},
-                delta = {'reference': net_assets},
-                gauge = {
-                    'axis': {'range': [None, max_value * 1.2]},
-                    'bar': {'color': "#2E86AB"},
-                    'steps': [
-                        {'range': [0, min_value], 'color': "lightgray"},
-                        {'range': [min_value, median_value], 'color': "lightyellow"},
-                        {'range': [median_value, max_value], 'color': "lightgreen"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "red", 'width': 4},
-                        'thickness': 0.75,
-                        'value': median_value
+                fig_range.add_trace(go.Indicator(
+                    mode = "gauge+number+delta",
+                    value = median_value,
+                    domain = {'x': [0, 1], 'y': [0, 1]},
+                    title = {'text': "企業価値（中央値）"},
+                    delta = {'reference': net_assets},
+                    gauge = {
+                        'axis': {'range': [None, max_value * 1.2]},
+                        'bar': {'color': "#2E86AB"},
+                        'steps': [
+                            {'range': [0, min_value], 'color': "lightgray"},
+                            {'range': [min_value, median_value], 'color': "lightyellow"},
+                            {'range': [median_value, max_value], 'color': "lightgreen"}
+                        ],
+                        'threshold': {
+                            'line': {'color': "red", 'width': 4},
+                            'thickness': 0.75,
+                            'value': median_value
+                        }
                     }
-                }
-            ))
+                ))
             
-            fig_range.update_layout(height=300)
-            st.plotly_chart(fig_range, use_container_width=True)
+                fig_range.update_layout(height=300)
+                st.plotly_chart(fig_range, use_container_width=True)
         
         with col2:
             st.markdown("**💡 解釈ガイド**")
@@ -662,267 +1185,267 @@ with tab1:
         # AIによる総合評価
         st.subheader("🤖 AIによる評価コメント")
         
-        with st.spinner("AIが算定結果を分析中..."):
-            valuation_prompt = f"""
-あなたは企業評価の専門家です。以下の算定結果について、経営者向けに分かりやすくコメントしてください。
-
-企業情報:
-- 業種: {industry}
-- 売上: {revenue}百万円
-- 利益: {profit}百万円
-- 純資産: {net_assets}百万円
-- 成長率: {growth_rate}%
-
-算定結果:
-- 最低値: {min_value:.0f}百万円（{list(valuations.keys())[list([v['value'] for v in valuations.values()]).index(min_value)]}）
-- 中央値: {median_value:.0f}百万円
-- 最高値: {max_value:.0f}百万円（{list(valuations.keys())[list([v['value'] for v in valuations.values()]).index(max_value)]}）
-
-以下の観点でコメントしてください（各80-120文字）：
-
-1. **総合評価**: この企業価値は妥当か
-2. **推奨価格**: M&Aの場合、どの価格が現実的か
-3. **注意点**: 算定結果を解釈する上での留意点
-4. **価値向上のヒント**: 企業価値を高めるために何をすべきか
-
-簡潔に、実践的に。
-"""
+        comment = st.session_state.get('valuation_comment')
+        if not clicked:
+            # 再実行では AI を呼ばず、算定時に作成したコメントを表示する
+            if comment is not None:
+                st.markdown(comment['text'])
+                st.caption(describe_usage(comment['usage']))
+            else:
+                st.caption("AIコメントは「企業価値を算定する」を押したときに作成します")
+        else:
+            valuation_prompt = build_valuation_prompt(
+                net_assets,
+                min_value, METHODS[np.nanargmin(result['values'][0])],
+                median_value,
+                max_value, METHODS[np.nanargmax(result['values'][0])]
+            )
             
             try:
-                client = anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
-                valuation_comment = client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=1500,
-                    temperature=0.5,
-                    messages=[{"role": "user", "content": valuation_prompt}]
-                )
+                client = get_client(st.secrets["ANTHROPIC_API_KEY"])
+                on_wait = queue_notice()
+                with st.spinner("AIが算定結果を分析中..."):
+                    valuation_usage = {}
+                    valuation_stream = prefetch(cached_stream(
+                        client, llm_cache, valuation_prompt, **TASK_SETTINGS['valuation'],
+                        system=ai_system, task='valuation', usage=valuation_usage,
+                        refresh=regenerate_ai, on_wait=on_wait
+                    ))
                 
-                st.markdown(valuation_comment.content[0].text)
+                valuation_text = st.write_stream(valuation_stream)
+                st.caption(describe_usage(valuation_usage))
+                st.session_state['valuation_comment'] = {'text': valuation_text, 'usage': valuation_usage}
                 
+            except AdmissionError as e:
+                st.warning(f"⏳ {str(e)}")
             except Exception as e:
                 st.error(f"AI分析でエラー: {str(e)}")
         
         # ダウンロードボタン
         st.markdown("---")
         
-        # レポート作成
-        report = f"""# 企業価値算定レポート
-
-## 企業情報
-- 業種: {industry}
-- 年間売上: {revenue}百万円
-- 経常利益: {profit}百万円
-- 純資産: {net_assets}百万円
-- EBITDA: {ebitda}百万円
-
-## 算定結果サマリー
-- 最低値: {min_value:.0f}百万円
-- 中央値: {median_value:.0f}百万円（推奨）
-- 最高値: {max_value:.0f}百万円
-- 平均値: {avg_value:.0f}百万円
-
-## 手法別詳細
-
-"""
-        for method, data in valuations.items():
-            report += f"""
-### {method}
-- 企業価値: {data['value']:.0f}百万円
-- 計算式: {data['formula']}
-- 説明: {data['description']}
-- 適用性: {data['suitable']}
-"""
-        
-        report += f"""
-
-## 推奨価格レンジ
-{median_value*0.8:.0f}〜{median_value*1.2:.0f}百万円
-
-## 注意事項
-本レポートは簡易的な算定であり、実際のM&Aや資金調達の際は、
-専門家（公認会計士、M&Aアドバイザー等）による詳細なデューデリジェンスが必要です。
-
-作成日: {datetime.now().strftime('%Y年%m月%d日')}
-"""
-        
-        st.download_button(
-            label="📥 算定レポートをダウンロード",
-            data=report,
-            file_name=f"企業価値算定_{industry}_{revenue}百万円売上.md",
-            mime="text/markdown"
-        )
+        # レポート作成（形式ごとのボタンを押したときに書き出す）
+        report_sections = list(valuation_sections(
+            industry, revenue, profit, net_assets, ebitda,
+            {'min': min_value, 'median': median_value, 'max': max_value, 'mean': avg_value},
+            valuations
+        ))
+        st.markdown("**📥 算定レポートをダウンロード**")
+        report_downloads(report_sections, "企業価値算定レポート", f"企業価値算定_{industry}_{revenue}百万円売上")
 
 # ========================================
 # タブ2: 選択肢分析（既存機能）
 # ========================================
-with tab2:
+@st.fragment
+@timed("tab2")
+def analysis_tab(revenue, industry, ai_system, regenerate_ai):
     st.markdown("---")
     
-    if st.button("🔍 選択肢を分析する", type="primary", use_container_width=True):
+    # 分析はバックグラウンドのジョブで実行し、ジョブIDをセッションに持って再実行後もつなぎ直す
+    job = ai_jobs.get(st.session_state.get('analysis_job'))
+    running = job is not None and not job.finished
+    
+    if st.button("🔍 選択肢を分析する", type="primary", use_container_width=True, disabled=running):
         
         if "ANTHROPIC_API_KEY" not in st.secrets:
             st.error("⚠️ `.streamlit/secrets.toml` にAPIキーを設定してください")
             st.stop()
         
-        analysis_prompt = f"""
-あなたは日本の企業金融・資本市場に精通したコンサルタントです。日本の中小企業経営者に対して、利用可能な資本市場の選択肢を提案してください。
-
-# 企業情報
-- 年間売上高: {revenue}百万円
-- 経常利益: {profit}百万円（利益率: {profit/revenue*100 if revenue > 0 else 0:.1f}%）
-- 売上成長率: {growth_rate}%
-- 設立: {years}年
-- 従業員数: {employees}名
-- 業種: {industry}
-- 所在地: {location}
-- 研究開発比率: {rd_ratio}%
-- 特許保有: {'あり' if has_patent else 'なし'}
-- 高度技術企業: {'認定済' if is_hightech else '未認定'}
-- 輸出実績: {'あり' if has_export else 'なし'}
-
-# 経営者のニーズ
-- 資金調達ニーズ: {need_money}
-- 希望調達額: {funding_amount}百万円
-- 株式希薄化: {accept_dilution}
-- 希望期間: {timeline}
-- 優先事項: {', '.join(priority) if priority else '特になし'}
-
-## 🎯 御社に最適な選択肢 TOP 3
-
-各選択肢について：
-1. 概要と適している理由
-2. 想定スケジュール
-3. 概算コスト
-4. メリット・デメリット
-5. 次のアクション
-
-を提供してください。
-
-日本市場特有の選択肢（東証グロース、日本政策金融公庫、ものづくり補助金、JAFCO等のVC、事業承継支援等）を優先的に。
-"""
+        client = get_client(st.secrets["ANTHROPIC_API_KEY"])
+        job = ai_jobs.submit_generation(
+            client, llm_cache, build_analysis_prompt(), 'analysis',
+            system=ai_system, refresh=regenerate_ai
+        )
+        st.session_state['analysis_job'] = job.id
+    
+    if 'analysis_job' not in st.session_state:
+        return
+    
+    if job is not None and not job.finished:
+        analysis_progress(job.id)
+        return
+    
+    if job is None and st.session_state.get('analysis_result_job') == st.session_state['analysis_job']:
+        # ジョブの保存期間が過ぎても、受け取り済みの結果はセッションから表示する
+        analysis_text = st.session_state['analysis_result']
+        st.markdown(analysis_text)
+    else:
+        analysis_text = job_result(job)
+        if analysis_text is None:
+            return
+    
+    st.success("✅ 分析完了！")
+    
+    # 分析結果を保存（シミュレーターで使用）。どのジョブの結果かも残し、期限切れ後の表示に使う
+    st.session_state['analysis_result'] = analysis_text
+    st.session_state['analysis_result_job'] = st.session_state['analysis_job']
+    
+    st.markdown("**📥 レポートをダウンロード**")
+    report_downloads(
+        list(text_sections({"資本市場の選択肢": analysis_text})), "資本市場分析レポート",
+        f"資本市場分析_{industry}_{revenue}百万円売上", formats=('md', 'json')
+    )
 
-        try:
-            with st.spinner("🤖 AIが御社の状況を分析中です..."):
-                client = anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
-                
-                response = client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=8000,
-                    temperature=0.3,
-                    messages=[{"role": "user", "content": analysis_prompt}]
-                )
-                
-                st.success("✅ 分析完了！")
-                
-                # 分析結果を保存（シミュレーターで使用）
-                st.session_state['analysis_result'] = response.content[0].text
-                
-                st.markdown(response.content[0].text)
-                
-                st.download_button(
-                    label="📥 レポートをダウンロード",
-                    data=response.content[0].text,
-                    file_name=f"資本市場分析_{industry}_{revenue}百万円売上.md",
-                    mime="text/markdown"
-                )
-                
-        except Exception as e:
-            st.error(f"❌ エラーが発生しました: {str(e)}")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def analysis_progress(job_id):
+    """タブ2の実行中の分析。一定間隔で進み具合を表示し直し、終わったら画面全体を更新する"""
+    job = ai_jobs.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    job_progress(job)
+    st.button("⏹ 分析を中止", key=f"cancel:{job_id}", on_click=ai_jobs.cancel, args=(job_id,))
 
 # ========================================
 # タブ3: シミュレーター
 # ========================================
-with tab3:
-    st.header("📈 3年後のシミュレーション")
-    st.markdown("異なる選択肢を選んだ場合の3年後をシミュレーションします")
+@st.fragment
+@timed("tab3")
+def simulation_tab(revenue, profit, growth_rate, industry, funding_amount, ai_system, regenerate_ai):
+    st.header("📈 将来のシミュレーション")
+    st.markdown("異なる選択肢を選んだ場合の数年後（3〜10年）を、年次または月次でシミュレーションします")
     
     # シナリオ選択
+    scenarios = scenario_spec()
     col1, col2 = st.columns([2, 1])
     
     with col1:
         scenario = st.selectbox(
             "シナリオを選択",
-            [
-                "シナリオ1: VC調達（株式20%希薄化）",
-                "シナリオ2: 銀行融資（無希薄化）",
-                "シナリオ3: 自己資金で成長（調達なし）",
-                "シナリオ4: 上場準備（複数回調達）",
-                "カスタムシナリオ"
-            ]
+            SIMULATION_SCENARIOS,
+            key=seed(*scenarios['scenario'])
         )
     
     with col2:
         risk_scenario = st.radio(
             "成長見通し",
-            ["楽観的", "基本", "悲観的"]
+            RISK_SCENARIOS,
+            key=seed(*scenarios['risk_scenario'])
         )
     
     # パラメータ設定
     st.subheader("📊 シミュレーションパラメータ")
     
+    spec = simulation_spec(scenario, risk_scenario, growth_rate, funding_amount, industry)
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if "VC調達" in scenario or "カスタム" in scenario:
-            funding_sim = st.slider("調達額（百万円）", 0, 1000, funding_amount, 10)
-            equity_dilution = st.slider("株式希薄化（%）", 0, 49, 20, 1)
+            funding_sim = st.slider("調達額（百万円）", 0, 1000, step=10, key=seed(*spec['funding_sim']))
+            st.slider("株式希薄化（%）", 0, 49, step=1, key=seed(*spec['equity_dilution']))
         elif "銀行融資" in scenario:
-            funding_sim = st.slider("融資額（百万円）", 0, 500, funding_amount, 10)
-            interest_rate = st.slider("金利（%）", 0.5, 5.0, 2.0, 0.1)
-            equity_dilution = 0
+            funding_sim = st.slider("融資額（百万円）", 0, 500, step=10, key=seed(*spec['funding_sim']))
+            st.slider("金利（%）", 0.5, 5.0, step=0.1, key=seed(*spec['interest_rate']))
+            st.slider(
+                "返済期間（年）", 0, HORIZON_RANGE[1], step=1, key=seed(*spec['repayment_years']),
+                help="1年目から毎年均等に返済します（0なら期間中は返済せず、利息だけを払います）"
+            )
         else:
             funding_sim = 0
-            equity_dilution = 0
+        
+        horizon = st.slider("シミュレーション期間（年）", *HORIZON_RANGE, step=1, key=seed(*spec['horizon']))
+        st.radio("計算の刻み", list(STEPS_PER_YEAR), horizontal=True, key=seed(*spec['steps']))
     
     with col2:
         # 成長率の設定（リスクシナリオに応じて）
-        base_growth = growth_rate
-        if risk_scenario == "楽観的":
-            year1_growth = st.slider("1年目成長率（%）", 0, 200, int(base_growth * 1.5), 5)
-            year2_growth = st.slider("2年目成長率（%）", 0, 200, int(base_growth * 1.3), 5)
-            year3_growth = st.slider("3年目成長率（%）", 0, 200, int(base_growth * 1.2), 5)
-        elif risk_scenario == "悲観的":
-            year1_growth = st.slider("1年目成長率（%）", -50, 100, int(base_growth * 0.5), 5)
-            year2_growth = st.slider("2年目成長率（%）", -50, 100, int(base_growth * 0.6), 5)
-            year3_growth = st.slider("3年目成長率（%）", -50, 100, int(base_growth * 0.7), 5)
-        else:  # 基本
-            year1_growth = st.slider("1年目成長率（%）", -50, 200, base_growth, 5)
-            year2_growth = st.slider("2年目成長率（%）", -50, 200, int(base_growth * 0.9), 5)
-            year3_growth = st.slider("3年目成長率（%）", -50, 200, int(base_growth * 0.8), 5)
+        _, (min_growth, max_growth) = GROWTH_FACTORS[risk_scenario]
+        st.slider("1年目成長率（%）", min_growth, max_growth, step=5, key=seed(*spec['year1_growth']))
+        st.slider("2年目成長率（%）", min_growth, max_growth, step=5, key=seed(*spec['year2_growth']))
+        st.slider("3年目成長率（%）", min_growth, max_growth, step=5, key=seed(*spec['year3_growth']))
+        st.slider(
+            "4年目以降の成長率（%）", min_growth, max_growth, step=5, key=seed(*spec['later_growth']),
+            disabled=horizon <= 3
+        )
     
     with col3:
         profit_margin_improvement = st.slider(
             "利益率改善（%ポイント/年）", 
-            -5, 10, 1, 1
+            -5, 10, step=1, key=seed(*spec['profit_margin_improvement'])
         )
         
-        # 業界別のPE倍率
-        industry_pe = {
-            "製造業": 15,
-            "IT・ソフトウェア": 25,
-            "医療・ヘルスケア": 20,
-            "環境・エネルギー": 18,
-            "小売・サービス": 12,
-            "建設・不動産": 10,
-            "その他": 15
-        }
-        
         pe_multiple = st.slider(
             "想定PER（倍）",
-            5, 50, industry_pe.get(industry, 15), 1
+            5, 50, step=1, key=seed(*spec['pe_multiple'])
         )
     
+    if "上場準備" in scenario:
+        st.markdown("**調達ラウンド**（期間より後のラウンドは計算に含めません）")
+        round_cols = st.columns(len(IPO_ROUNDS))
+        for i, (name, *_) in enumerate(IPO_ROUNDS):
+            with round_cols[i]:
+                st.markdown(f"*{name}*")
+                st.slider("時期（年目）", 0, HORIZON_RANGE[1], step=1, key=seed(*spec[f'round{i + 1}_year']))
+                st.number_input("調達額（百万円）", min_value=0, step=10, key=seed(*spec[f'round{i + 1}_amount']))
+                st.slider("株式希薄化（%）", 0, 49, step=1, key=seed(*spec[f'round{i + 1}_dilution']))
+    
+    # 資本政策（株式で調達するシナリオとタブ4のVC調達に使う）
+    terms_spec = cap_table_spec()
+    with st.expander("🧾 資本政策（優先株の条件・ストックオプション）"):
+        st.caption("株式で調達するシナリオと、タブ4のVC調達に使います。持分価値は企業価値で売却したときの"
+                   "優先分配後の受取額です")
+        terms_col1, terms_col2, terms_col3 = st.columns(3)
+        
+        with terms_col1:
+            st.slider(
+                "残余財産の優先分配（投資額の倍率）", 0.0, 3.0, step=0.5, key=seed(*terms_spec['preference']),
+                help="売却時に投資家が普通株より先に受け取る額。0なら優先分配なし（持株比率どおりの按分）"
+            )
+            st.radio("優先株の優先順位", SENIORITY_OPTIONS, key=seed(*terms_spec['seniority']))
+        
+        with terms_col2:
+            participating = st.toggle(
+                "参加型", key=seed(*terms_spec['participating']),
+                help="優先分配を受けたうえで、残りも普通株と一緒に持株比率で受け取ります"
+            )
+            st.slider(
+                "参加の上限（投資額の倍率、0で上限なし）", 0.0, 5.0, step=0.5,
+                key=seed(*terms_spec['participation_cap']), disabled=not participating
+            )
+        
+        with terms_col3:
+            st.slider(
+                "ストックオプション・プール（%）", 0, 20, step=1, key=seed(*terms_spec['option_pool']),
+                help="最初の調達の前に、投資後の持分でこの割合になるよう設けます（全て付与・行使済みとみなします）"
+            )
+    
+    # 資金調達イベント（株式調達・融資・返済）と期間の成長率は入力値からまとめて作る
+    sim_inputs = simulation_inputs(growth_rate, funding_amount, industry)
+    steps_per_year = sim_inputs['steps_per_year']
+    
+    # モンテカルロ設定
+    with st.expander("🎲 モンテカルロ・シミュレーション設定"):
+        monte_carlo_mode = st.toggle(
+            "モンテカルロ・モードで実行",
+            key=seed(input_key('monte_carlo_mode'), False),
+            help="成長率・利益率改善・PERのばらつきを考慮して多数の推移を同時に試算します"
+        )
+        
+        mc_col1, mc_col2, mc_col3 = st.columns(3)
+        
+        with mc_col1:
+            mc_paths = st.select_slider(
+                "試行回数",
+                options=[10_000, 100_000, 300_000, 1_000_000],
+                key=seed(input_key('mc_paths'), 100_000)
+            )
+            mc_seed = st.number_input("乱数シード", min_value=0, step=1, key=seed(input_key('mc_seed'), 42))
+        
+        with mc_col2:
+            mc_growth_vol = st.slider("成長率のばらつき（標準偏差、%）", 0, 50, step=1, key=seed(input_key('mc_growth_vol'), 10))
+            mc_margin_vol = st.slider("利益率改善のばらつき（%ポイント）", 0.0, 5.0, step=0.5, key=seed(input_key('mc_margin_vol'), 1.0))
+        
+        with mc_col3:
+            mc_pe_vol = st.slider("PERのばらつき（倍）", 0, 15, step=1, key=seed(input_key('mc_pe_vol'), 3))
+            mc_correlation = st.slider(
+                "相関の強さ",
+                0.0, 1.0, step=0.1, key=seed(input_key('mc_correlation'), 1.0),
+                help="0で成長率・利益率・PERが独立、1で「好調な年は利益率もPERも上がる」標準の相関"
+            )
+    
     # シミュレーション実行ボタン
     if st.button("🚀 シミュレーション実行", type="primary", use_container_width=True):
         
         # 計算ロジック
-        current_profit_margin = profit / revenue if revenue > 0 else 0
-        
-        # 年次推移の計算
-        years_data = []
-        current_revenue = revenue
-        current_equity = 100  # 初期持株比率100%
-        
         # 初期費用の計算
         if "VC調達" in scenario:
             initial_cost = funding_sim * 0.05  # 調達コスト5%
@@ -931,55 +1454,40 @@ with tab3:
         else:
             initial_cost = 0
         
-        for year, growth in enumerate([0, year1_growth, year2_growth, year3_growth], start=0):
-            if year == 0:
-                # 現在
-                year_revenue = current_revenue
-                year_profit = profit
-                year_equity = current_equity
-            else:
-                # 未来
-                year_revenue = current_revenue * (1 + growth / 100)
-                year_profit_margin = current_profit_margin + (profit_margin_improvement * year / 100)
-                year_profit = year_revenue * year_profit_margin
-                
-                # 銀行融資の場合は利息を引く
-                if "銀行融資" in scenario and year <= 3:
-                    interest_payment = funding_sim * (interest_rate / 100)
-                    year_profit -= interest_payment
-                
-                year_equity = current_equity
-                current_revenue = year_revenue
-            
-            # 企業価値 = 利益 × PER
-            company_value = year_profit * pe_multiple
-            
-            # 株式希薄化の反映
-            if year == 1 and equity_dilution > 0:
-                year_equity = current_equity * (1 - equity_dilution / 100)
-                current_equity = year_equity
-            
-            # 経営者の持分価値
-            owner_value = company_value * (year_equity / 100)
-            
-            years_data.append({
-                'year': f'{year}年後' if year > 0 else '現在',
-                'year_num': year,
-                'revenue': year_revenue,
-                'profit': year_profit,
-                'profit_margin': year_profit / year_revenue * 100 if year_revenue > 0 else 0,
-                'company_value': company_value,
-                'equity': year_equity,
-                'owner_value': owner_value
+        # 推移の計算
+        with span("tab3.simulate"):
+            sim = simulate(
+                revenue, profit,
+                sim_inputs['path_growth'],
+                profit_margin_improvement, pe_multiple,
+                events=sim_inputs['events'],
+                steps_per_year=steps_per_year
+            )
+        
+            df = pd.DataFrame({
+                'year': [step_label(step, steps_per_year) for step in sim['year_num']],
+                'year_num': sim['year_num'],
+                'revenue': sim['revenue'],
+                'profit': sim['profit'],
+                'profit_margin': sim['profit_margin'],
+                'company_value': sim['company_value'],
+                'equity': sim['equity'],
+                'owner_value': sim['owner_value']
             })
         
-        df = pd.DataFrame(years_data)
+        # 最終時点のキャップテーブルで、売却額ごとの分配をまとめて計算する
+        equity_events = [event for event in sim_inputs['events'] if event['kind'] == 'equity']
+        if equity_events:
+            with span("tab3.waterfall"):
+                final_value = float(sim['company_value'][-1])
+                cap_table, exit_values, payouts = exit_payouts(equity_events, final_value)
+                final_payouts = exit_waterfall(cap_table, max(final_value, 0.0))
         
         # 結果の表示
         st.success("✅ シミュレーション完了！")
         
         # メトリクス表示
-        st.subheader("📊 3年後の予測")
+        st.subheader(f"📊 {horizon}年後の予測")
         
         col1, col2, col3, col4 = st.columns(4)
         
@@ -1018,60 +1526,62 @@ with tab3:
         # グラフ1: 企業価値と持分価値の推移
         st.subheader("📈 企業価値と持分価値の推移")
         
-        fig1 = go.Figure()
+        with span("tab3.fig_values"):
+            fig1 = go.Figure()
         
-        fig1.add_trace(go.Scatter(
-            x=df['year'],
-            y=df['company_value'],
-            name='企業価値',
-            line=dict(color='blue', width=3),
-            mode='lines+markers'
-        ))
+            fig1.add_trace(go.Scatter(
+                x=df['year'],
+                y=df['company_value'],
+                name='企業価値',
+                line=dict(color='blue', width=3),
+                mode='lines+markers'
+            ))
         
-        fig1.add_trace(go.Scatter(
-            x=df['year'],
-            y=df['owner_value'],
-            name='あなたの持分価値',
-            line=dict(color='green', width=3),
-            mode='lines+markers'
-        ))
+            fig1.add_trace(go.Scatter(
+                x=df['year'],
+                y=df['owner_value'],
+                name='あなたの持分価値',
+                line=dict(color='green', width=3),
+                mode='lines+markers'
+            ))
         
-        fig1.update_layout(
-            xaxis_title="",
-            yaxis_title="金額（百万円）",
-            hovermode='x unified',
-            height=400
-        )
+            fig1.update_layout(
+                xaxis_title="",
+                yaxis_title="金額（百万円）",
+                hovermode='x unified',
+                height=400
+            )
         
-        st.plotly_chart(fig1, use_container_width=True)
+            st.plotly_chart(fig1, use_container_width=True)
         
         # グラフ2: 売上と利益の推移
         st.subheader("💰 売上と利益の推移")
         
-        fig2 = go.Figure()
+        with span("tab3.fig_revenue"):
+            fig2 = go.Figure()
         
-        fig2.add_trace(go.Bar(
-            x=df['year'],
-            y=df['revenue'],
-            name='売上高',
-            marker_color='lightblue'
-        ))
+            fig2.add_trace(go.Bar(
+                x=df['year'],
+                y=df['revenue'],
+                name='売上高',
+                marker_color='lightblue'
+            ))
         
-        fig2.add_trace(go.Bar(
-            x=df['year'],
-            y=df['profit'],
-            name='経常利益',
-            marker_color='lightgreen'
-        ))
+            fig2.add_trace(go.Bar(
+                x=df['year'],
+                y=df['profit'],
+                name='経常利益',
+                marker_color='lightgreen'
+            ))
         
-        fig2.update_layout(
-            barmode='group',
-            xaxis_title="",
-            yaxis_title="金額（百万円）",
-            height=400
-        )
+            fig2.update_layout(
+                barmode='group',
+                xaxis_title="",
+                yaxis_title="金額（百万円）",
+                height=400
+            )
         
-        st.plotly_chart(fig2, use_container_width=True)
+            st.plotly_chart(fig2, use_container_width=True)
         
         # グラフ3: 株式構造の変化（円グラフ）
         st.subheader("🥧 株式構造の変化")
@@ -1090,171 +1600,616 @@ with tab3:
             st.plotly_chart(fig3_before, use_container_width=True)
         
         with col2:
-            st.markdown("**3年後**")
+            st.markdown(f"**{horizon}年後**")
             final_equity = df.iloc[-1]['equity']
-            fig3_after = go.Figure(data=[go.Pie(
-                labels=['経営者', '投資家'],
-                values=[final_equity, 100 - final_equity],
-                hole=.3,
-                marker_colors=['#2E86AB', '#F18F01']
-            )])
+            if equity_events:
+                # 株式の種類（創業者・ストックオプション・各ラウンド）ごとの完全希薄化ベースの持株比率
+                fig3_after = go.Figure(data=[go.Pie(
+                    labels=['経営者', *payouts['names'][1:]],
+                    values=payouts['ownership'],
+                    hole=.3,
+                    sort=False
+                )])
+            else:
+                fig3_after = go.Figure(data=[go.Pie(
+                    labels=['経営者', '投資家'],
+                    values=[final_equity, 100 - final_equity],
+                    hole=.3,
+                    marker_colors=['#2E86AB', '#F18F01']
+                )])
             fig3_after.update_layout(height=300, showlegend=True)
             st.plotly_chart(fig3_after, use_container_width=True)
         
+        # グラフ4: 売却額ごとの分配（優先株の条件・ストックオプションを反映）
+        if equity_events:
+            st.subheader("🧾 売却額ごとの分配（ウォーターフォール）")
+            
+            with span("tab3.fig_waterfall"):
+                fig_waterfall = waterfall_figure(
+                    exit_values, payouts['names'], payouts['payout'], final_value, f"{horizon}年後の企業価値"
+                )
+                st.plotly_chart(fig_waterfall, use_container_width=True)
+            
+            cap_table_df = pd.DataFrame({
+                '株式の種類': payouts['names'],
+                '持株比率': [f"{v:.1f}%" for v in payouts['ownership']],
+                '投資額': [f"{float(c.get('invested', 0)):.0f}百万円" for c in cap_table],
+                '優先分配': [
+                    f"{float(c['invested'] * c['preference']):.0f}百万円"
+                    + ('（参加型）' if c['participating'] else '') if c['kind'] == 'preferred' else '－'
+                    for c in cap_table
+                ],
+                f'{horizon}年後の企業価値で売却したときの受取額': [f"{v:.0f}百万円" for v in final_payouts['payout']],
+            })
+            st.dataframe(cap_table_df, use_container_width=True, hide_index=True)
+        
         # 詳細データテーブル
         with st.expander("📋 詳細データを表示"):
-            display_df = df.copy()
-            display_df['revenue'] = display_df['revenue'].apply(lambda x: f"{x:.0f}百万円")
-            display_df['profit'] = display_df['profit'].apply(lambda x: f"{x:.0f}百万円")
-            display_df['profit_margin'] = display_df['profit_margin'].apply(lambda x: f"{x:.1f}%")
-            display_df['company_value'] = display_df['company_value'].apply(lambda x: f"{x:.0f}百万円")
-            display_df['equity'] = display_df['equity'].apply(lambda x: f"{x:.1f}%")
-            display_df['owner_value'] = display_df['owner_value'].apply(lambda x: f"{x:.0f}百万円")
+            with span("tab3.table"):
+                display_df = df.copy()
+                display_df['revenue'] = display_df['revenue'].apply(lambda x: f"{x:.0f}百万円")
+                display_df['profit'] = display_df['profit'].apply(lambda x: f"{x:.0f}百万円")
+                display_df['profit_margin'] = display_df['profit_margin'].apply(lambda x: f"{x:.1f}%")
+                display_df['company_value'] = display_df['company_value'].apply(lambda x: f"{x:.0f}百万円")
+                display_df['equity'] = display_df['equity'].apply(lambda x: f"{x:.1f}%")
+                display_df['owner_value'] = display_df['owner_value'].apply(lambda x: f"{x:.0f}百万円")
+            
+                st.dataframe(
+                    display_df[['year', 'revenue', 'profit', 'profit_margin', 'company_value', 'equity', 'owner_value']],
+                    use_container_width=True
+                )
+        
+        # モンテカルロ・シミュレーション
+        if monte_carlo_mode:
+            st.subheader("🎲 モンテカルロ・シミュレーション")
+            
+            with span("tab3.monte_carlo"):
+                mc = cached_monte_carlo(
+                    revenue, profit,
+                    sim_inputs['path_growth'],
+                    profit_margin_improvement, pe_multiple,
+                    events=sim_inputs['events'],
+                    n_paths=mc_paths,
+                    growth_vol=mc_growth_vol,
+                    margin_vol=mc_margin_vol,
+                    pe_vol=mc_pe_vol,
+                    correlation=correlation_matrix(mc_correlation),
+                    seed=int(mc_seed)
+                )
+            median_idx = PERCENTILES.index(50)
             
-            st.dataframe(
-                display_df[['year', 'revenue', 'profit', 'profit_margin', 'company_value', 'equity', 'owner_value']],
-                use_container_width=True
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.metric(f"{horizon}年後の持分価値（中央値）", f"{mc['owner_value'][median_idx, -1]:.0f}百万円")
+            
+            with col2:
+                st.metric(
+                    "90%レンジ",
+                    f"{mc['owner_value'][0, -1]:.0f}〜{mc['owner_value'][-1, -1]:.0f}百万円",
+                    help="5パーセンタイル〜95パーセンタイル"
+                )
+            
+            with col3:
+                st.metric("持分価値が現在を下回る確率", f"{mc['prob_owner_value_down'] * 100:.1f}%")
+            
+            # ファンチャート
+            with span("tab3.fig_fan"):
+                year_labels = [step_label(year, 1) for year in mc['years']]
+                fig_fan = fan_figure(year_labels, mc['company_value'], mc['owner_value'], mc['n_paths'])
+            
+                st.plotly_chart(fig_fan, use_container_width=True)
+            
+            mc_df = pd.DataFrame(
+                mc['owner_value'].T,
+                columns=[f'{p}%' for p in PERCENTILES],
+                index=year_labels
             )
+            st.dataframe(mc_df.style.format("{:.0f}"), use_container_width=True)
         
         # AI による解釈
         st.subheader("🤖 AIによる分析コメント")
         
-        with st.spinner("AIがシミュレーション結果を分析中..."):
-            interpretation_prompt = f"""
-以下のシミュレーション結果について、経営者向けに分かりやすくコメントしてください：
-
-シナリオ: {scenario}
-リスクケース: {risk_scenario}
-
-現在の状況:
-- 売上: {initial_data['revenue']:.0f}百万円
-- 利益: {initial_data['profit']:.0f}百万円
-- 企業価値: {initial_data['company_value']:.0f}百万円
-
-3年後の予測:
-- 売上: {final_data['revenue']:.0f}百万円（{revenue_change:+.1f}%）
-- 利益: {final_data['profit']:.0f}百万円
-- 企業価値: {final_data['company_value']:.0f}百万円
-- 経営者持株比率: {final_data['equity']:.1f}%
-- 経営者持分価値: {final_data['owner_value']:.0f}百万円
-
-以下の観点でコメントしてください（各50-100文字程度）：
-
-1. **全体評価**: このシナリオの妥当性
-2. **ポジティブな点**: 何が良いか
-3. **リスクと注意点**: 何に気をつけるべきか
-4. **推奨アクション**: 次に何をすべきか
-
-簡潔で実践的に。
-"""
+        interpretation_prompt = build_interpretation_prompt(
+            scenario, risk_scenario, initial_data, final_data, revenue_change, horizon=horizon
+        )
+        
+        try:
+            client = get_client(st.secrets["ANTHROPIC_API_KEY"])
+            on_wait = queue_notice()
+            with st.spinner("AIがシミュレーション結果を分析中..."):
+                interpretation_usage = {}
+                interpretation_stream = prefetch(cached_stream(
+                    client, llm_cache, interpretation_prompt, **TASK_SETTINGS['interpretation'],
+                    system=ai_system, task='interpretation', usage=interpretation_usage,
+                    refresh=regenerate_ai, on_wait=on_wait
+                ))
             
-            try:
-                client = anthropic.Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
-                interpretation = client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=1500,
-                    temperature=0.5,
-                    messages=[{"role": "user", "content": interpretation_prompt}]
-                )
-                
-                st.markdown(interpretation.content[0].text)
-                
-            except Exception as e:
-                st.error(f"AI分析でエラー: {str(e)}")
+            st.write_stream(interpretation_stream)
+            st.caption(describe_usage(interpretation_usage))
+            
+        except AdmissionError as e:
+            st.warning(f"⏳ {str(e)}")
+        except Exception as e:
+            st.error(f"AI分析でエラー: {str(e)}")
 
 # ========================================
 # タブ4: 比較表
 # ========================================
-with tab4:
+@st.fragment
+@timed("tab4")
+def comparison_tab(revenue, profit, growth_rate, industry, funding_amount):
     st.header("📊 複数シナリオの比較")
     st.markdown("異なる選択肢を並べて比較します")
     
-    # 3つのシナリオを事前計算
-    scenarios_to_compare = [
-        {
-            'name': 'VC調達',
-            'funding': funding_amount,
-            'dilution': 20,
-            'growth': [year1_growth, year2_growth, year3_growth]
-        },
-        {
-            'name': '銀行融資',
-            'funding': funding_amount,
-            'dilution': 0,
-            'growth': [year1_growth * 0.8, year2_growth * 0.8, year3_growth * 0.8]
-        },
-        {
-            'name': '自己資金',
-            'funding': 0,
-            'dilution': 0,
-            'growth': [year1_growth * 0.5, year2_growth * 0.5, year3_growth * 0.5]
-        }
-    ]
-    
-    comparison_results = []
-    
-    for scenario_def in scenarios_to_compare:
-        # 簡易計算
-        final_revenue = revenue
-        for g in scenario_def['growth']:
-            final_revenue = final_revenue * (1 + g / 100)
-        
-        final_profit = final_revenue * (profit / revenue) if revenue > 0 else 0
-        company_value = final_profit * industry_pe.get(industry, 15)
-        equity = 100 - scenario_def['dilution']
-        owner_value = company_value * (equity / 100)
-        
-        comparison_results.append({
-            'シナリオ': scenario_def['name'],
-            '調達額': f"{scenario_def['funding']}百万円",
-            '株式希薄化': f"{scenario_def['dilution']}%",
-            '3年後売上': f"{final_revenue:.0f}百万円",
-            '3年後企業価値': f"{company_value:.0f}百万円",
-            '経営者持株': f"{equity}%",
-            '経営者持分価値': f"{owner_value:.0f}百万円",
-            '_owner_value_num': owner_value  # ソート用
-        })
-    
-    comparison_df = pd.DataFrame(comparison_results)
+    # 成長率と優先株の条件はタブ3（シミュレーター）の入力値を使う
+    with span("tab4.compare"):
+        sim_inputs = simulation_inputs(growth_rate, funding_amount, industry)
+        terms = round_terms(sim_inputs)
+        comparison_df, best_scenario = compare_funding(
+            revenue, profit, funding_amount, industry, sim_inputs['growth'], terms
+        )
+    st.caption(
+        f"VC調達の持分価値は、3年後の企業価値で売却したときの優先分配（{terms['preference']:.1f}倍・"
+        f"{'参加型' if terms['participating'] else '非参加型'}）後の受取額です。条件はタブ3の資本政策で変更できます"
+    )
     
     # 表示
     st.dataframe(
-        comparison_df.drop('_owner_value_num', axis=1),
+        comparison_df.drop(['_owner_value_num', '_company_value_num'], axis=1),
         use_container_width=True,
         hide_index=True
     )
     
     # 推奨の表示
-    best_scenario = comparison_df.loc[comparison_df['_owner_value_num'].idxmax(), 'シナリオ']
-    
     st.info(f"💡 **経営者の持分価値が最大になるのは：{best_scenario}**")
     
+    # VC調達の持分価値（優先分配後の受取額）が自己資金と並ぶ希薄化率と、そのためにVCへ求める評価額
+    st.markdown("**⚖️ VC調達の損益分岐**")
+    scenario_values = comparison_df.set_index('シナリオ')
+    even_dilution = float(break_even_dilution(
+        scenario_values.loc['VC調達', '_company_value_num'],
+        scenario_values.loc['自己資金', '_owner_value_num'],
+        funding=funding_amount,
+        terms=terms
+    ))
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if np.isnan(even_dilution) or even_dilution <= 0:
+            st.metric("損益分岐の希薄化率", "なし", help="希薄化なしでもVC調達の持分価値が自己資金を下回ります")
+        else:
+            st.metric("損益分岐の希薄化率", f"{even_dilution:.1f}%",
+                      help="これより希薄化が小さければ、VC調達の持分価値（優先分配後の受取額）が自己資金を上回ります")
+    
+    with col2:
+        if funding_amount > 0 and 0 < even_dilution < 100:
+            # 希薄化率 = 調達額 ÷ (プレマネー評価額 + 調達額)
+            even_pre_money = funding_amount * (100 - even_dilution) / even_dilution
+            st.metric("最低限必要なプレマネー評価額", f"{even_pre_money:,.0f}百万円",
+                      help=f"{funding_amount}百万円を調達するとき、これ以上の評価額なら自己資金より有利です")
+    
+    with col3:
+        offered_pre_money = st.number_input(
+            "VCの提示評価額（プレマネー・百万円）", min_value=0, step=10,
+            key=seed(input_key('offered_pre_money', funding_amount), 0),
+            help="提示された評価額での希薄化率と持分価値を、自己資金と比べます（0なら比べない）"
+        )
+    
+    if offered_pre_money > 0 and funding_amount > 0:
+        offered_dilution = funding_amount / (offered_pre_money + funding_amount) * 100
+        offered_cap_table = build_cap_table([
+            {'name': 'VC', 'amount': funding_amount, 'pre_money': offered_pre_money, **terms}
+        ])
+        offered_owner_value = float(exit_waterfall(
+            offered_cap_table, scenario_values.loc['VC調達', '_company_value_num']
+        )['payout'][0])
+        self_owner_value = scenario_values.loc['自己資金', '_owner_value_num']
+        if offered_owner_value >= self_owner_value:
+            st.success(f"提示評価額では希薄化 {offered_dilution:.1f}%、経営者持分価値 {offered_owner_value:,.0f}百万円で、"
+                       f"自己資金（{self_owner_value:,.0f}百万円）を上回ります")
+        else:
+            st.warning(f"提示評価額では希薄化 {offered_dilution:.1f}%、経営者持分価値 {offered_owner_value:,.0f}百万円で、"
+                       f"自己資金（{self_owner_value:,.0f}百万円）を下回ります")
+    
     # 比較チャート
-    fig_compare = go.Figure()
+    with span("tab4.fig_compare"):
+        fig_compare = go.Figure()
     
-    fig_compare.add_trace(go.Bar(
-        name='企業価値',
-        x=comparison_df['シナリオ'],
-        y=[float(v.replace('百万円', '').replace(',', '')) for v in comparison_df['3年後企業価値']],
-        marker_color='lightblue'
-    ))
+        fig_compare.add_trace(go.Bar(
+            name='企業価値',
+            x=comparison_df['シナリオ'],
+            y=[float(v.replace('百万円', '').replace(',', '')) for v in comparison_df['3年後企業価値']],
+            marker_color='lightblue'
+        ))
     
-    fig_compare.add_trace(go.Bar(
-        name='経営者持分価値',
-        x=comparison_df['シナリオ'],
-        y=[float(v.replace('百万円', '').replace(',', '')) for v in comparison_df['経営者持分価値']],
-        marker_color='lightgreen'
-    ))
+        fig_compare.add_trace(go.Bar(
+            name='経営者持分価値',
+            x=comparison_df['シナリオ'],
+            y=[float(v.replace('百万円', '').replace(',', '')) for v in comparison_df['経営者持分価値']],
+            marker_color='lightgreen'
+        ))
     
-    fig_compare.update_layout(
-        barmode='group',
-        title="シナリオ別の企業価値比較",
-        xaxis_title="",
-        yaxis_title="金額（百万円）",
-        height=400
+        fig_compare.update_layout(
+            barmode='group',
+            title="シナリオ別の企業価値比較",
+            xaxis_title="",
+            yaxis_title="金額（百万円）",
+            height=400
+        )
+    
+        st.plotly_chart(fig_compare, use_container_width=True)
+    
+    # スイープモード：調達額 × 希薄化 × 成長率の倍率 × PER の全組み合わせを評価
+    st.subheader("🔭 シナリオスイープ")
+    sweep_mode = st.toggle(
+        "スイープモードで探索する",
+        key=seed(input_key('sweep_mode'), False),
+        help="3つの標準シナリオの代わりに、条件の全組み合わせから持分価値・持株比率・調達額のバランスを探します"
+    )
+    if not sweep_mode:
+        return
+    
+    defaults = industry_defaults(industry)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        sweep_funding = st.slider(
+            "調達額の範囲（百万円）", 0, 3000, step=10,
+            key=seed(input_key('sweep_funding', funding_amount), (0, min(max(funding_amount * 5, 100), 3000)))
+        )
+        sweep_dilution = st.slider(
+            "株式希薄化の範囲（%）", 0, 49, step=1,
+            key=seed(input_key('sweep_dilution'), (0, 49))
+        )
+        sweep_growth = st.slider(
+            "成長率の倍率の範囲（タブ3の成長率に対する倍率）", 0.0, 3.0, step=0.1,
+            key=seed(input_key('sweep_growth'), (0.5, 1.5))
+        )
+        sweep_pe = st.slider(
+            "PERの範囲（倍）", 5, 50, step=1,
+            key=seed(input_key('sweep_pe', industry, defaults['version']), (max(defaults['per'] - 5, 5), defaults['per'] + 5))
+        )
+    
+    with col2:
+        sweep_points = st.slider(
+            "各軸の分割数", 5, 40, step=1,
+            key=seed(input_key('sweep_points'), 20),
+            help="組み合わせ数は 分割数の4乗（40なら約256万通り）"
+        )
+        valuation_cap = st.slider(
+            "投資家が認める評価額（現在の企業価値の倍率）", 0.5, 5.0, step=0.1,
+            key=seed(input_key('sweep_valuation_cap'), 1.0),
+            help="希薄化ありの調達は、調達額 ÷ 希薄化率 で決まる評価額がこの上限以下のものだけを実現可能とみなします"
+        )
+        max_debt_years = st.slider(
+            "融資の上限（経常利益の何年分）", 0, 20, step=1,
+            key=seed(input_key('sweep_max_debt_years'), 10),
+            help="希薄化なしの調達は融資（金利2%）とみなし、この上限までを実現可能とみなします"
+        )
+        min_equity = st.slider(
+            "経営者持株の下限（%）", 0, 100, step=1,
+            key=seed(input_key('sweep_min_equity'), 51),
+            help="上位の組み合わせを絞り込む条件"
+        )
+    
+    with span("tab4.sweep") as sweep_span:
+        started_at = time.perf_counter()
+        sweep = cached_sweep_scenarios(
+            revenue, profit, sim_inputs['growth'],
+            np.linspace(*sweep_funding, sweep_points),
+            np.unique(np.linspace(*sweep_dilution, sweep_points).round()),
+            np.linspace(*sweep_growth, sweep_points),
+            np.linspace(*sweep_pe, sweep_points),
+            valuation_cap=valuation_cap,
+            max_debt_years=max_debt_years,
+            terms=terms
+        )
+        frontier = sweep_frontier(sweep)
+        top = top_scenarios(sweep, k=10, min_equity=min_equity)
+        elapsed = time.perf_counter() - started_at
+        sweep_span['combinations'] = sweep['count']
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("組み合わせ数", f"{sweep['count']:,}")
+    
+    with col2:
+        st.metric("実現可能な組み合わせ", f"{int(sweep['feasible'].sum()):,}")
+    
+    with col3:
+        st.metric("計算時間", f"{elapsed * 1000:.0f}ミリ秒")
+    
+    if len(frontier) == 0:
+        st.warning("条件を満たす組み合わせがありません。範囲や上限を広げてください")
+        return
+    
+    st.caption("株式調達の持分価値は、上の比較と同じく優先株の条件で売却したときの受取額、持株は完全希薄化ベースです")
+    
+    def sweep_table(index):
+        return pd.DataFrame({
+            '調達額': [f"{v:.0f}百万円" for v in sweep['funding'][index]],
+            '調達方法': ['融資' if d == 0 else '株式' for d in sweep['dilution'][index]],
+            '株式希薄化': [f"{v:.0f}%" for v in sweep['dilution'][index]],
+            '成長率の倍率': [f"{v:.2f}倍" for v in sweep['growth_multiplier'][index]],
+            'PER': [f"{v:.1f}倍" for v in sweep['pe_multiple'][index]],
+            '3年後企業価値': [f"{v:.0f}百万円" for v in sweep['company_value'][index]],
+            '経営者持株': [f"{v:.0f}%" for v in sweep['equity'][index]],
+            '経営者持分価値': [f"{v:.0f}百万円" for v in sweep['owner_value'][index]],
+        })
+    
+    # パレートフロンティア（持分価値・持株比率・調達額のどれかを良くすると他が悪くなる組み合わせ）
+    fig_frontier = frontier_figure(
+        sweep['equity'][frontier], sweep['owner_value'][frontier],
+        sweep['funding'][frontier], sweep['dilution'][frontier]
+    )
+    st.plotly_chart(fig_frontier, use_container_width=True)
+    
+    with st.expander(f"📋 フロンティア上の組み合わせ（{len(frontier)}件）"):
+        st.dataframe(sweep_table(frontier), use_container_width=True, hide_index=True)
+    
+    st.markdown(f"**持株{min_equity}%以上で持分価値が大きい組み合わせ（上位{len(top)}件）**")
+    st.dataframe(sweep_table(top), use_container_width=True, hide_index=True)
+
+# ========================================
+# タブ5: 一括レポート
+# ========================================
+REPORT_TITLES = {
+    'valuation': "🤖 企業価値の評価コメント",
+    'analysis': "📋 資本市場の選択肢",
+    'interpretation': "📈 シミュレーションの解釈"
+}
+
+
+@st.fragment
+@timed("tab5")
+def report_tab(revenue, profit, growth_rate, industry, funding_amount, ai_system, regenerate_ai):
+    st.header("📑 一括レポート")
+    st.markdown("企業価値算定・選択肢分析・シミュレーションのAI分析をまとめて作成します（3つのAI分析は同時に実行）")
+    
+    # AI分析はバックグラウンドのジョブで実行し、ジョブIDと数値の結果をセッションに持つ
+    state = st.session_state.get('report_jobs')
+    jobs = {name: ai_jobs.get(job_id) for name, job_id in state['jobs'].items()} if state else {}
+    running = any(job is not None and not job.finished for job in jobs.values())
+    
+    if st.button("⚡ すべて生成する", type="primary", use_container_width=True, disabled=running):
+        
+        if "ANTHROPIC_API_KEY" not in st.secrets:
+            st.error("⚠️ `.streamlit/secrets.toml` にAPIキーを設定してください")
+            st.stop()
+        
+        # 1. 数値計算（AI分析の前にすべて済ませる。入力値はタブ1・タブ3のもの）
+        with span("tab5.numeric"):
+            val_inputs = read_inputs(valuation_spec(revenue, industry))
+            sim_inputs = simulation_inputs(growth_rate, funding_amount, industry)
+            scenario = sim_inputs['scenario']
+            net_assets = val_inputs['total_assets'] - val_inputs['total_liabilities']
+        
+            full_valuation = cached_value_companies(
+                revenue, profit, val_inputs['total_assets'], val_inputs['total_liabilities'], val_inputs['depreciation'],
+                industry=industry,
+                growth_rate=growth_rate,
+                per_multiple=val_inputs['per_multiple'],
+                pbr_multiple=val_inputs['pbr_multiple'],
+                ebitda_multiple=val_inputs['ebitda_multiple'],
+                year_buy_multiple=val_inputs['year_buy_multiple'],
+                dcf_years=val_inputs['dcf_years'],
+                parameters=industry_table(),
+            )
+            full_values = full_valuation['values'][0]
+            full_sim = simulate(
+                revenue, profit,
+                sim_inputs['path_growth'],
+                sim_inputs['profit_margin_improvement'], sim_inputs['pe_multiple'],
+                events=sim_inputs['events']
+            )
+            _, best_scenario = compare_funding(
+                revenue, profit, funding_amount, industry, sim_inputs['growth'], round_terms(sim_inputs)
+            )
+            full_initial = {key: values[0] for key, values in full_sim.items()}
+            full_final = {key: values[-1] for key, values in full_sim.items()}
+            full_revenue_change = (full_final['revenue'] - full_initial['revenue']) / full_initial['revenue'] * 100
+        
+        # 2. プロンプト作成
+        full_requests = {
+            'valuation': build_valuation_prompt(
+                net_assets,
+                full_valuation['min'][0], METHODS[np.nanargmin(full_values)],
+                full_valuation['median'][0],
+                full_valuation['max'][0], METHODS[np.nanargmax(full_values)]
+            ),
+            'analysis': build_analysis_prompt(),
+            'interpretation': build_interpretation_prompt(
+                scenario, sim_inputs['risk_scenario'], full_initial, full_final, full_revenue_change,
+                horizon=sim_inputs['horizon']
+            )
+        }
+        # 3. AI分析を同時に開始する（終わったものから表示）
+        client = get_client(st.secrets["ANTHROPIC_API_KEY"])
+        state = st.session_state['report_jobs'] = {
+            'summary': {
+                'median': full_valuation['median'][0],
+                'owner_value': full_final['owner_value'],
+                'horizon': sim_inputs['horizon'],
+                'scenario': scenario,
+                'best_scenario': best_scenario,
+            },
+            'jobs': {
+                name: ai_jobs.submit_generation(
+                    client, llm_cache, prompt, name, system=ai_system, refresh=regenerate_ai
+                ).id
+                for name, prompt in full_requests.items()
+            },
+            'file_stem': f"一括レポート_{industry}_{revenue}百万円売上",
+        }
+        jobs = {name: ai_jobs.get(job_id) for name, job_id in state['jobs'].items()}
+        running = True
+    
+    if state is None:
+        return
+    
+    summary = state['summary']
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("企業価値（中央値）", f"{summary['median']:.0f}百万円")
+    
+    with col2:
+        st.metric(f"{summary['horizon']}年後のあなたの株式価値", f"{summary['owner_value']:.0f}百万円", help=summary['scenario'])
+    
+    with col3:
+        st.metric("持分価値が最大のシナリオ", summary['best_scenario'])
+    
+    if running:
+        report_progress(state['jobs'])
+        return
+    
+    full_texts = {}
+    for name, title in REPORT_TITLES.items():
+        st.subheader(title)
+        text = job_result(jobs[name])
+        if text is not None:
+            full_texts[name] = text
+    
+    if 'analysis' in full_texts:
+        # 分析結果を保存（シミュレーターで使用）
+        st.session_state['analysis_result'] = full_texts['analysis']
+    
+    finished = [job for job in jobs.values() if job is not None]
+    if finished:
+        elapsed = max(job.finished_at for job in finished) - min(job.created_at for job in finished)
+        st.caption(f"所要時間：{elapsed:.1f}秒")
+    
+    if full_texts:
+        full_sections = [{"title": "主要な数値", "items": [
+            ("企業価値（中央値）", summary['median'], "百万円"),
+            (f"{summary['horizon']}年後のあなたの株式価値", summary['owner_value'], "百万円"),
+            ("持分価値が最大のシナリオ", summary['best_scenario'], ""),
+        ]}]
+        full_sections += text_sections({
+            REPORT_TITLES[name]: full_texts[name] for name in REPORT_TITLES if name in full_texts
+        })
+        st.markdown("**📥 一括レポートをダウンロード**")
+        report_downloads(full_sections, "一括レポート", state['file_stem'])
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def report_progress(job_ids):
+    """タブ5の実行中の AI 分析。一定間隔で進み具合を表示し直し、すべて終わったら画面全体を更新する"""
+    jobs = {name: ai_jobs.get(job_id) for name, job_id in job_ids.items()}
+    if all(job is None or job.finished for job in jobs.values()):
+        st.rerun()
+    for name, title in REPORT_TITLES.items():
+        st.subheader(title)
+        job = jobs[name]
+        if job is not None and not job.finished:
+            job_progress(job)
+        else:
+            job_result(job)
+    
+    def cancel_all():
+        for job_id in job_ids.values():
+            ai_jobs.cancel(job_id)
+    
+    st.button("⏹ すべて中止", key="cancel:report_jobs", on_click=cancel_all)
+
+# メイン画面：タブで機能を分割（選択中のタブだけを実行し、各タブはフラグメントとして個別に再実行する）
+keep_inputs()
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["💰 企業価値算定", "📋 選択肢分析", "📈 シミュレーター", "📊 比較表", "📑 一括レポート"],
+    key="active_tab",
+    on_change="rerun"
+)
+
+if tab1.open:
+    with tab1:
+        valuation_tab(revenue, profit, growth_rate, industry, ai_system, regenerate_ai)
+
+if tab2.open:
+    with tab2:
+        analysis_tab(revenue, industry, ai_system, regenerate_ai)
+
+if tab3.open:
+    with tab3:
+        simulation_tab(revenue, profit, growth_rate, industry, funding_amount, ai_system, regenerate_ai)
+
+if tab4.open:
+    with tab4:
+        comparison_tab(revenue, profit, growth_rate, industry, funding_amount)
+
+if tab5.open:
+    with tab5:
+        report_tab(revenue, profit, growth_rate, industry, funding_amount, ai_system, regenerate_ai)
+
+# キャッシュの状況
+with st.expander("⚙️ キャッシュの状況"):
+    stats = cache_stats()
+    if stats:
+        st.dataframe(
+            pd.DataFrame.from_dict(stats, orient='index'),
+            use_container_width=True
+        )
+    
+    llm_stats = llm_cache.stats()
+    st.markdown(
+        f"**AI応答キャッシュ**：{llm_stats['entries']}件 / "
+        f"{llm_stats['bytes'] / 1024:.1f}KB（上限 {llm_stats['max_bytes'] / 1024 / 1024:.0f}MB）、"
+        f"ヒット率 {llm_stats['hit_ratio'] * 100:.1f}%"
+        f"（ヒット {llm_stats['hits']} / ミス {llm_stats['misses']}）"
+    )
+    
+    admission = llm_admission().stats()
+    st.markdown(
+        f"**AI呼び出しの流量制御**：実行中 {admission['running']}件 / 順番待ち {admission['queued']}件"
+        f"（累計 受付 {admission['admitted']} / 混雑で不可 {admission['rejected']} / 時間切れ {admission['timeouts']}）"
     )
     
-    st.plotly_chart(fig_compare, use_container_width=True)
+    job_stats = ai_jobs.stats()
+    if job_stats:
+        st.markdown("**AI分析のジョブ**：" + " / ".join(f"{status} {count}件" for status, count in job_stats.items()))
+    
+    token_stats = usage_stats()
+    if token_stats:
+        st.markdown("**AIのトークン使用量（タスク別累計）**")
+        st.dataframe(
+            pd.DataFrame.from_dict(token_stats, orient='index'),
+            use_container_width=True
+        )
+
+# 処理時間の内訳（デバッグ用）
+@st.fragment
+def metrics_panel():
+    with st.expander("⏱️ 処理時間の内訳"):
+        st.button("🔄 更新", key="refresh_metrics")
+        timings = metrics_summary()
+        if not timings:
+            st.caption("まだ記録がありません")
+            return
+        st.caption("直近の処理時間（秒）とAI呼び出しのトークン数。p50/p95/p99 は直近15分間の値から集計")
+        st.dataframe(
+            pd.DataFrame.from_dict(timings, orient='index'),
+            use_container_width=True
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="📥 JSONL",
+                data=to_jsonl,
+                file_name="metrics.jsonl",
+                mime="application/x-ndjson"
+            )
+        with col2:
+            st.download_button(
+                label="📥 Prometheus形式",
+                data=to_prometheus,
+                file_name="metrics.prom",
+                mime="text/plain"
+            )
+
+
+metrics_panel()
 
 # フッター
 st.markdown("---")
@@ -0,0 +1,3 @@
+"""
+画面・バッチ・サービスから共通で使う周辺機能（AI呼び出しなど）
+"""
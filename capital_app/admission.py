@@ -0,0 +1,225 @@
+"""
+AI呼び出しの流量制御（プロセス内の全セッションで共有）
+
+全タブ・全セッションの AI 呼び出しを1つの窓口で受け付け、プロバイダーのレート制限を
+超えないように順に送り出す。
+  - 1分あたりのリクエスト数・トークン数のトークンバケット。トークンは
+    入力の見積もり + max_tokens で予約し、終わったら実際の使用量との差を戻す
+  - 同時実行数の上限
+  - 長さに上限のある待ち行列。あふれたら待たせずに AdmissionError にする
+待ち行列は見積もりトークン数の少ない依頼（評価コメントなど）を先に通し、
+待った時間に応じて順番を繰り上げるので、長い依頼（選択肢分析）もいずれ通る。
+待っている間は on_wait(順番) で呼び出し側に知らせ、通ったら on_wait(None) を呼ぶ。
+
+各値は環境変数で上書きできる：
+  CAPITAL_ADVISOR_LLM_RPM            1分あたりのリクエスト数の上限（0で無制限）
+  CAPITAL_ADVISOR_LLM_TPM            1分あたりのトークン数（入力 + 出力）の上限（0で無制限）
+  CAPITAL_ADVISOR_LLM_CONCURRENCY    同時実行数の上限
+  CAPITAL_ADVISOR_LLM_QUEUE          待ち行列の長さの上限
+  CAPITAL_ADVISOR_LLM_QUEUE_TIMEOUT  待ち行列で待つ時間の上限（秒）
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from . import metrics
+
+RPM = int(os.environ.get("CAPITAL_ADVISOR_LLM_RPM", 50))
+TPM = int(os.environ.get("CAPITAL_ADVISOR_LLM_TPM", 80_000))
+CONCURRENCY = int(os.environ.get("CAPITAL_ADVISOR_LLM_CONCURRENCY", 8))
+MAX_QUEUE = int(os.environ.get("CAPITAL_ADVISOR_LLM_QUEUE", 100))
+QUEUE_TIMEOUT = float(os.environ.get("CAPITAL_ADVISOR_LLM_QUEUE_TIMEOUT", 120.0))
+
+# 待ち時間1秒あたりに相当するトークン数。順番は「到着時刻 + 見積もりトークン数 / AGING」の小さい順
+AGING_TOKENS_PER_SECOND = 500
+
+# 中止の依頼（cancel）を確かめる間隔（秒）
+CANCEL_POLL_INTERVAL = 0.2
+
+
+class AdmissionError(RuntimeError):
+    """混雑で AI 呼び出しを受け付けられなかった（待ち行列が満杯・待ち時間切れ）。"""
+
+
+class Cancelled(Exception):
+    """順番待ち・生成中に呼び出し側から中止された。"""
+
+
+def estimate_tokens(prompt, max_tokens, system=None):
+    """
+    1回の呼び出しで使うトークン数の見積もり（入力の文字数 + max_tokens）。
+
+    日本語はおおむね1文字1トークン以下なので、入力は文字数で多めに見積もる。
+    """
+    chars = len(prompt)
+    if isinstance(system, str):
+        chars += len(system)
+    elif system:
+        chars += sum(len(block.get("text", "")) for block in system)
+    return chars + max_tokens
+
+
+class TokenBucket:
+    """1分あたり per_minute 個の割合で補充され、capacity 個までためられるバケット（排他は呼び出し側）。"""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """amount 個を取り出せるまでの秒数（0なら今すぐ）。容量を超える量は満杯になれば取り出せる。"""
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount):
+        self.tokens -= amount
+
+    def give(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdmissionController:
+    """
+    トークンバケット・同時実行数・優先度付きの待ち行列で AI 呼び出しを受け付ける。
+
+    rpm / tpm に 0 か None を渡すとその制限を付けない。
+    """
+
+    def __init__(self, rpm=RPM, tpm=TPM, concurrency=CONCURRENCY, max_queue=MAX_QUEUE,
+                 queue_timeout=QUEUE_TIMEOUT, aging=AGING_TOKENS_PER_SECOND):
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.aging = aging
+        self._cond = threading.Condition()
+        self._queue = []  # (順番のキー, 通し番号, チケット) のヒープ
+        self._seq = itertools.count()
+        self._running = 0
+        self._counts = {"admitted": 0, "rejected": 0, "timeouts": 0}
+
+    def _wait_time(self, ticket, now):
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.wait_time(ticket["tokens"], now))
+        return wait
+
+    def _position(self, ticket):
+        """待ち行列での順番（1が先頭）。"""
+        return 1 + sum(1 for entry in self._queue if entry[:2] < (ticket["key"], ticket["seq"]))
+
+    def _remove(self, ticket):
+        self._queue = [entry for entry in self._queue if entry[2] is not ticket]
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def acquire(self, task, tokens, on_wait=None, timeout=None, cancel=None):
+        """
+        順番が来るまで待ってチケット（辞書）を返す。使い終わったら release に渡すこと。
+
+        待ち行列が満杯なら待たずに、timeout（既定 queue_timeout）秒待っても通らなければ
+        AdmissionError を送出する。cancel（threading.Event）がセットされたら待ち行列から外して
+        Cancelled を送出する。
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        enqueued_at = time.monotonic()
+        ticket = {"task": task, "tokens": tokens, "key": enqueued_at + tokens / self.aging,
+                  "seq": next(self._seq), "enqueued_at": enqueued_at}
+        notified = None
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._counts["rejected"] += 1
+                metrics.record("llm.rejected", 0.0, task=task)
+                raise AdmissionError(
+                    f"AIの利用が混み合っています（待ち{len(self._queue)}件）。しばらくしてから再度お試しください"
+                )
+            heapq.heappush(self._queue, (ticket["key"], ticket["seq"], ticket))
+            self._cond.notify_all()
+            while True:
+                now = time.monotonic()
+                head = self._queue[0][2] is ticket
+                wait = self._wait_time(ticket, now) if head and self._running < self.concurrency else None
+                if wait == 0.0:
+                    heapq.heappop(self._queue)
+                    break
+                if cancel is not None and cancel.is_set():
+                    self._remove(ticket)
+                    raise Cancelled()
+                remaining = enqueued_at + timeout - now
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self._counts["timeouts"] += 1
+                    metrics.record("llm.queue_timeout", now - enqueued_at, task=task)
+                    raise AdmissionError("AIの利用が混み合っており、待ち時間の上限を超えました。再度お試しください")
+                position = self._position(ticket)
+                if on_wait is not None and position != notified:
+                    # 画面の更新は待ち行列のロックを外して行う
+                    notified = position
+                    self._cond.release()
+                    try:
+                        on_wait(position)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                if cancel is not None:
+                    remaining = min(remaining, CANCEL_POLL_INTERVAL)
+                self._cond.wait(remaining if wait is None else min(wait, remaining))
+
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+            self._running += 1
+            self._counts["admitted"] += 1
+            self._cond.notify_all()
+        waited = time.monotonic() - enqueued_at
+        metrics.record("llm.queue", waited, task=task, queued=notified is not None)
+        if notified is not None:
+            on_wait(None)
+        return ticket
+
+    def release(self, ticket, used_tokens=None):
+        """実行枠を返す。used_tokens（実際の使用量）があれば見積もりとの差をバケットに戻す。"""
+        with self._cond:
+            self._running -= 1
+            if used_tokens is not None and self._tokens is not None:
+                difference = ticket["tokens"] - used_tokens
+                if difference > 0:
+                    self._tokens.give(difference)
+                else:
+                    self._tokens.take(-difference)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, task, tokens, on_wait=None, cancel=None):
+        """acquire と release を with ブロックで行う。yield したチケットの "used_tokens" に使用量を書く。"""
+        ticket = self.acquire(task, tokens, on_wait=on_wait, cancel=cancel)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket, ticket.get("used_tokens"))
+
+    def stats(self):
+        """実行中・待ち行列の件数と、受け付け・拒否・時間切れの累計。"""
+        with self._cond:
+            return {"running": self._running, "queued": len(self._queue), **self._counts}
+
+
+@lru_cache(maxsize=None)
+def default_controller():
+    """プロセス共有の流量制御（環境変数の設定で作る）。"""
+    return AdmissionController()
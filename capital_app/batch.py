@@ -0,0 +1,343 @@
+"""
+ポートフォリオ一括評価（コマンドライン）
+
+CSV / Parquet の企業リストをチャンク単位で読み込み、タブ1の全算定手法と
+タブ4のシナリオ比較（経営者持分価値）を計算して、結果を逐次書き出す。
+チャンクはプロセスプールでCPUコアに分散し、ファイル全体をメモリに載せない。
+
+使い方:
+    python -m capital_app.batch deals.csv -o valuations.csv
+    python -m capital_app.batch deals.parquet -o valuations.parquet --workers 8
+    python -m capital_app.batch deals.csv -o valuations.csv --resume
+    python -m capital_app.batch deals.csv -o valuations.csv --reports reports.zip --report-format md,json
+
+入力列:
+    必須  revenue, profit, total_assets, total_liabilities, depreciation（百万円）
+    任意  industry, growth_rate（%）, year1_growth〜year3_growth（%）, pe_multiple,
+          funding_amount（百万円）, preference, participating, cap, option_pool（%）,
+          name（レポートのファイル名に使う）
+    funding_amount と優先株の条件（preference〜option_pool、なければタブ3の既定値）は
+    タブ4と同じく、VC調達の持分価値を優先分配後の受取額で評価するのに使う。
+
+CSV出力は1ファイルに追記、Parquet出力はチャンクごとの part ファイルを
+ディレクトリに書き出す。処理済みの行数と出力位置は <出力>.checkpoint.json に
+チャンクごとに記録され、--resume で中断したところから再開できる。
+--reports を付けると、企業ごとの算定レポート（Markdown / CSV / JSON / Parquet）を
+チャンクの順に ZIP へ逐次書き込む（ZIP は途中から再開できないので --resume とは併用不可）。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from capital_core import (
+    DEFAULT_ROUND_TERMS,
+    FUNDING_SCENARIOS,
+    METHODS,
+    compare_funding_options,
+    value_companies,
+)
+from capital_core.dcf import DCF_YEARS
+from capital_core.industry import industry_table
+
+from .report import FORMATS as REPORT_FORMATS, ReportZipWriter
+
+REQUIRED_COLUMNS = ("revenue", "profit", "total_assets", "total_liabilities", "depreciation")
+DEFAULT_CHUNKSIZE = 50_000
+
+# 年別成長率が与えられない場合の基本ケース（タブ3「基本」と同じ逓減）
+DEFAULT_GROWTH_DECAY = (1.0, 0.9, 0.8)
+
+
+def _column(frame, name, default):
+    if name in frame.columns:
+        return frame[name].to_numpy(dtype=float, na_value=default)
+    return np.full(len(frame), default, dtype=float)
+
+
+def evaluate_frame(frame, dcf_years=DCF_YEARS):
+    """1チャンク分の企業を評価し、入力列に結果列を加えた DataFrame を返す。"""
+    import pandas as pd
+
+    revenue = _column(frame, "revenue", 0.0)
+    profit = _column(frame, "profit", 0.0)
+    growth_rate = _column(frame, "growth_rate", 0.0)
+    industry = frame["industry"].fillna("その他").to_numpy(dtype=str) if "industry" in frame.columns else "その他"
+    parameters = industry_table()
+    codes = parameters.codes(industry, size=len(frame))
+
+    valuation = value_companies(
+        revenue, profit,
+        _column(frame, "total_assets", 0.0),
+        _column(frame, "total_liabilities", 0.0),
+        _column(frame, "depreciation", 0.0),
+        industry=codes,
+        growth_rate=growth_rate,
+        dcf_years=dcf_years,
+        parameters=parameters,
+    )
+
+    year_growth = np.column_stack([
+        _column(frame, f"year{i + 1}_growth", np.nan) for i in range(len(DEFAULT_GROWTH_DECAY))
+    ])
+    fallback = growth_rate[:, None] * np.array(DEFAULT_GROWTH_DECAY)
+    year_growth = np.where(np.isnan(year_growth), fallback, year_growth)
+    pe_multiple = _column(frame, "pe_multiple", np.nan)
+    pe_multiple = np.where(np.isnan(pe_multiple), parameters.per[codes], pe_multiple)
+    terms = {
+        key: _column(frame, key, np.nan if default is None else float(default))
+        for key, default in DEFAULT_ROUND_TERMS.items()
+    }
+    compared = compare_funding_options(
+        revenue, profit, year_growth, pe_multiple,
+        funding=_column(frame, "funding_amount", 0.0), terms=terms,
+    )
+
+    out = frame.reset_index(drop=True).copy()
+    for method in METHODS:
+        out[method] = valuation[method]
+    for key in ("median", "min", "max", "mean"):
+        out[f"valuation_{key}"] = valuation[key]
+    out["wacc"] = valuation["dcf"]["wacc"]
+    names = [s["name"] for s in FUNDING_SCENARIOS]
+    for i, name in enumerate(names):
+        out[f"{name}_owner_value"] = compared["owner_value"][:, i]
+    out["best_scenario"] = pd.Series(np.asarray(names)[np.argmax(compared["owner_value"], axis=1)])
+    return out
+
+
+def _process_chunk(frame, dcf_years, parquet, keep_frame=False):
+    """
+    ワーカー側で評価とシリアライズまで済ませ、(行数, ヘッダー, 本体, 評価結果) を返す。
+    評価結果の DataFrame はレポートを書くとき（keep_frame）だけ返す。
+    """
+    out = evaluate_frame(frame, dcf_years)
+    kept = out if keep_frame else None
+    if parquet:
+        import pyarrow as pa
+
+        sink = pa.BufferOutputStream()
+        _require_pyarrow().write_table(pa.Table.from_pandas(out, preserve_index=False), sink)
+        return len(out), b"", sink.getvalue().to_pybytes(), kept
+    header = out.iloc[:0].to_csv(index=False).encode("utf-8")
+    return len(out), header, out.to_csv(header=False, index=False).encode("utf-8"), kept
+
+
+def _is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet の読み書きには pyarrow が必要です（pip install pyarrow）")
+    return pq
+
+
+def iter_chunks(path, chunksize, skip_rows=0):
+    """入力ファイルを DataFrame のチャンクとして順に読む。先頭 skip_rows 行は飛ばす。"""
+    import pandas as pd
+
+    if _is_parquet(path):
+        pq = _require_pyarrow()
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunksize):
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            frame = batch.to_pandas()
+            if skip_rows:
+                frame = frame.iloc[skip_rows:]
+                skip_rows = 0
+            yield frame
+    else:
+        # ヘッダー行（0行目）は残して、処理済みのデータ行だけ飛ばす
+        skip = (lambda i: 0 < i <= skip_rows) if skip_rows else None
+        yield from pd.read_csv(path, chunksize=chunksize, skiprows=skip)
+
+
+class CsvWriter:
+    """CSVへの追記。再開時は最後のチェックポイント位置まで切り詰める。"""
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        if offset is None:
+            self._file = open(path, "wb")
+            self._header = True
+        else:
+            self._file = open(path, "r+b")
+            self._file.truncate(offset)
+            self._file.seek(offset)
+            self._header = offset == 0
+
+    def write(self, header, body, index):
+        if self._header:
+            self._file.write(header)
+            self._header = False
+        self._file.write(body)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPartWriter:
+    """チャンクごとに part-NNNNN.parquet を書き出す。"""
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        _require_pyarrow()
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, header, body, index):
+        part = os.path.join(self.path, f"part-{index:05d}.parquet")
+        with open(part + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(part + ".tmp", part)
+        return index + 1
+
+    def close(self):
+        pass
+
+
+def _checkpoint_path(output):
+    return output.rstrip("/\\") + ".checkpoint.json"
+
+
+def _load_checkpoint(output, input_path):
+    path = _checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("input") != os.path.abspath(input_path):
+        raise SystemExit(f"チェックポイントの入力ファイルが一致しません: {checkpoint.get('input')}")
+    return checkpoint
+
+
+def _save_checkpoint(output, checkpoint):
+    path = _checkpoint_path(output)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def run(input_path, output_path, workers=None, chunksize=DEFAULT_CHUNKSIZE, resume=False,
+        dcf_years=DCF_YEARS, reports=None, report_formats=("md",), progress=sys.stderr):
+    """
+    一括評価を実行し、処理件数と所要時間を返す。
+
+    結果はチャンクの順番どおりに書き出し、書き出すたびにチェックポイントを更新する。
+    同時に処理中のチャンクは workers × 2 個までに抑え、メモリ使用量を一定に保つ。
+    reports に ZIP のパスを渡すと、企業ごとのレポートを report_formats の形式で書き込む。
+    """
+    if reports and resume:
+        raise SystemExit("--reports と --resume は同時に指定できません")
+    workers = workers or os.cpu_count() or 1
+    checkpoint = _load_checkpoint(output_path, input_path) if resume else None
+    rows_done = checkpoint["rows_done"] if checkpoint else 0
+    chunk_index = checkpoint["chunks_done"] if checkpoint else 0
+    parquet = _is_parquet(output_path)
+    writer_cls = ParquetPartWriter if parquet else CsvWriter
+    writer = writer_cls(output_path, offset=checkpoint["output_offset"] if checkpoint else None)
+    report_writer = ReportZipWriter(reports, report_formats) if reports else None
+    scenario_names = [s["name"] for s in FUNDING_SCENARIOS]
+
+    if rows_done:
+        print(f"再開: {rows_done:,}行目から", file=progress)
+
+    started_at = time.perf_counter()
+    rows_this_run = 0
+    pending = {}
+    finished = {}
+    next_to_write = chunk_index
+    max_in_flight = workers * 2
+
+    def flush_ready():
+        nonlocal next_to_write, rows_done, rows_this_run
+        while next_to_write in finished:
+            rows, header, body, frame = finished.pop(next_to_write)
+            offset = writer.write(header, body, next_to_write)
+            if report_writer is not None:
+                report_writer.write(frame, rows_done, METHODS, scenario_names)
+            next_to_write += 1
+            rows_done += rows
+            rows_this_run += rows
+            _save_checkpoint(output_path, {
+                "input": os.path.abspath(input_path),
+                "rows_done": rows_done,
+                "chunks_done": next_to_write,
+                "output_offset": offset,
+            })
+            elapsed = time.perf_counter() - started_at
+            print(f"{rows_done:,}行 完了（{rows_this_run / elapsed:,.0f}行/秒）", file=progress)
+
+    def collect(block):
+        if block:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in pending if future.done()]
+        for future in done:
+            finished[pending.pop(future)] = future.result()
+        flush_ready()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for frame in iter_chunks(input_path, chunksize, skip_rows=rows_done):
+                missing = [c for c in REQUIRED_COLUMNS if c not in frame.columns]
+                if missing:
+                    raise SystemExit(f"必須列がありません: {', '.join(missing)}")
+                while len(pending) >= max_in_flight:
+                    collect(block=True)
+                pending[pool.submit(_process_chunk, frame, dcf_years, parquet, report_writer is not None)] = chunk_index
+                chunk_index += 1
+                collect(block=False)
+            while pending:
+                collect(block=True)
+    finally:
+        writer.close()
+        if report_writer is not None:
+            report_writer.close()
+
+    elapsed = time.perf_counter() - started_at
+    rate = rows_this_run / elapsed if elapsed > 0 else 0.0
+    print(f"完了: {rows_this_run:,}行 / {elapsed:.1f}秒（{rate:,.0f}行/秒）→ {output_path}", file=progress)
+    if report_writer is not None:
+        print(f"レポート: {report_writer.reports:,}社分 → {reports}", file=progress)
+    return {"rows": rows_this_run, "total_rows": rows_done, "seconds": elapsed, "rows_per_second": rate}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m capital_app.batch",
+        description="企業リスト（CSV / Parquet）を一括で企業価値算定・シナリオ比較する",
+    )
+    parser.add_argument("input", help="入力ファイル（.csv / .parquet）")
+    parser.add_argument("-o", "--output", required=True, help="出力先（.csv ファイル / .parquet ディレクトリ）")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="ワーカープロセス数（既定：CPUコア数）")
+    parser.add_argument("-c", "--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1チャンクの行数")
+    parser.add_argument("--dcf-years", type=int, default=DCF_YEARS, help="DCF法の予測期間（5〜30年）")
+    parser.add_argument("--resume", action="store_true", help="チェックポイントから再開する")
+    parser.add_argument("--reports", help="企業ごとのレポートを書き込む ZIP ファイル")
+    parser.add_argument("--report-format", default="md",
+                        help=f"レポートの形式（カンマ区切りで複数可: {', '.join(REPORT_FORMATS)}）")
+    args = parser.parse_args(argv)
+
+    report_formats = tuple(f.strip() for f in args.report_format.split(",") if f.strip())
+    unknown = [f for f in report_formats if f not in REPORT_FORMATS]
+    if unknown:
+        parser.error(f"不明なレポート形式: {', '.join(unknown)}")
+    run(args.input, args.output, workers=args.workers, chunksize=args.chunksize,
+        resume=args.resume, dcf_years=args.dcf_years, reports=args.reports, report_formats=report_formats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+グラフの作成（WebGL への切り替え・間引き・キャッシュ）
+
+点数の多いトレースは WebGL（Scattergl）で描き、上限を超える分はサーバー側で
+間引いてから送る。折れ線は LTTB（Largest-Triangle-Three-Buckets）、散布図は
+格子ごとに1点、多数のパスはパーセンタイルの帯、等高線は格子の間引きでまとめる。
+作成した図は引数のハッシュでキャッシュし、同じ入力の再実行では作り直さない。
+
+各値は環境変数で上書きできる：
+  CAPITAL_ADVISOR_WEBGL_THRESHOLD  WebGL に切り替える1トレースあたりの点数
+  CAPITAL_ADVISOR_MAX_POINTS       1トレースあたりの点数の上限（超えると間引く）
+  CAPITAL_ADVISOR_MAX_GRID_POINTS  等高線・ヒートマップの格子点数の上限
+"""
+
+import math
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+
+from capital_core.memo import memoize
+
+WEBGL_THRESHOLD = int(os.environ.get("CAPITAL_ADVISOR_WEBGL_THRESHOLD", 1000))
+MAX_POINTS = int(os.environ.get("CAPITAL_ADVISOR_MAX_POINTS", 5000))
+MAX_GRID_POINTS = int(os.environ.get("CAPITAL_ADVISOR_MAX_GRID_POINTS", 10_000))
+
+FIGURE_CACHE_SIZE = 64
+FIGURE_CACHE_TTL = 3600
+
+
+def cached_figure(func):
+    """
+    図を作る関数を、引数のハッシュでキャッシュするデコレーター。
+
+    キャッシュした go.Figure はセッション間で共有するので、呼び出し側で書き換えないこと。
+    """
+    return memoize(maxsize=FIGURE_CACHE_SIZE, ttl=FIGURE_CACHE_TTL, name=f"figure.{func.__qualname__}")(func)
+
+
+def lttb(x, y, n_out):
+    """
+    LTTB で n_out 点を選び、そのインデックスを返す（先頭と末尾は必ず残す）。
+
+    x は昇順に並んでいること。間の点をバケットに分け、前に選んだ点と次のバケットの
+    平均点とで作る三角形の面積が最大になる点を各バケットから1つずつ選ぶ。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:max(n_out, 0)]
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)  # n_out - 2 個のバケットの境界
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # 各バケットの「次のバケット」の平均点（最後のバケットは末尾の点）
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def grid_sample(x, y, max_points):
+    """
+    散布図の間引き。点の範囲を約 max_points 個のマスに分け、各マスの最初の1点を残す。
+
+    外れ値や点の広がりは保ったまま、密集した部分だけを減らす。インデックスを昇順で返す。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+    bins = max(1, int(math.sqrt(max_points)))
+
+    def cell(v):
+        finite = v[np.isfinite(v)]
+        low, high = (finite.min(), finite.max()) if len(finite) else (0.0, 0.0)
+        scaled = (v - low) / (high - low) * (bins - 1) if high > low else np.zeros_like(v)
+        return np.nan_to_num(scaled, nan=bins).astype(np.intp)
+
+    _, first = np.unique(cell(x) * (bins + 1) + cell(y), return_index=True)
+    return np.sort(first)
+
+
+def decimate(x, y, mode="lines", max_points=None):
+    """表示する点のインデックス。折れ線は LTTB、マーカーだけなら grid_sample。"""
+    max_points = MAX_POINTS if max_points is None else max_points
+    if len(x) <= max_points:
+        return np.arange(len(x))
+    if "lines" in mode:
+        return lttb(x, y, max_points)
+    return grid_sample(x, y, max_points)
+
+
+def _take(value, index, n):
+    """点ごとの配列（長さ n）なら間引き、それ以外はそのまま返す。"""
+    if isinstance(value, dict):
+        return {k: _take(v, index, n) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)) and len(value) == n and not isinstance(value, str):
+        return np.asarray(value)[index]
+    return value
+
+
+def scatter_trace(x, y, mode="lines", max_points=None, webgl_threshold=None, **kwargs):
+    """
+    go.Scatter を作る。点数が webgl_threshold を超えれば go.Scattergl にし、
+    max_points を超えれば間引く。kwargs の点ごとの配列（customdata・marker の色など）も
+    同じ点に合わせて間引く。
+    """
+    webgl_threshold = WEBGL_THRESHOLD if webgl_threshold is None else webgl_threshold
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(x)
+    index = decimate(x, y, mode, max_points)
+    if len(index) < n:
+        x, y = x[index], y[index]
+        kwargs = {k: _take(v, index, n) for k, v in kwargs.items()}
+    trace = go.Scattergl if n > webgl_threshold else go.Scatter
+    return trace(x=x, y=y, mode=mode, **kwargs)
+
+
+def path_bands(paths, percentiles):
+    """(N, T) のパスを (len(percentiles), T) のパーセンタイルの帯にまとめる。"""
+    return np.percentile(np.asarray(paths, dtype=float), percentiles, axis=0)
+
+
+def band_traces(x, bands, percentiles, name, rgb, median_index):
+    """
+    パーセンタイルの帯（外側から順に塗る）と中央値の線のトレースを作る。
+
+    bands は (len(percentiles), T) で、percentiles は中央値を挟んで対称に並んでいること。
+    """
+    x = list(x)
+    traces = []
+    for lower in range(median_index):
+        upper = len(percentiles) - 1 - lower
+        alpha = 0.15 * (lower + 1)
+        traces.append(go.Scatter(
+            x=x + x[::-1],
+            y=np.concatenate([bands[upper], bands[lower][::-1]]),
+            fill='toself',
+            fillcolor=f'rgba({rgb}, {alpha})',
+            line=dict(width=0),
+            name=f'{name}（{percentiles[lower]}〜{percentiles[upper]}%）',
+            hoverinfo='skip'
+        ))
+    traces.append(go.Scatter(
+        x=x,
+        y=bands[median_index],
+        name=f'{name}（中央値）',
+        line=dict(color=f'rgb({rgb})', width=3),
+        mode='lines+markers'
+    ))
+    return traces
+
+
+def downsample_grid(x, y, z, max_points=None):
+    """等高線・ヒートマップの格子を、点数が max_points 以下になるよう等間隔に間引く。"""
+    max_points = MAX_GRID_POINTS if max_points is None else max_points
+    z = np.asarray(z)
+    ny, nx = z.shape
+    stride = max(1, math.ceil(math.sqrt(nx * ny / max_points)))
+    if stride == 1:
+        return x, y, z
+    return np.asarray(x)[::stride], np.asarray(y)[::stride], z[::stride, ::stride]
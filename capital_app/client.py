@@ -0,0 +1,60 @@
+"""
+プロセス共有の Anthropic クライアント
+
+HTTPコネクションプール（keep-alive）を全タブ・全セッションで使い回し、
+接続・読み取りタイムアウトとリトライ回数を設定する。リトライ時の待機は
+SDK標準の指数バックオフ（ジッター付き）で、回数は max_retries で上限を切る。
+
+各値は環境変数で上書きできる：
+  ANTHROPIC_CONNECT_TIMEOUT  接続タイムアウト（秒）
+  ANTHROPIC_READ_TIMEOUT     読み取りタイムアウト（秒、ストリーミングではチャンク間の待ち時間）
+  ANTHROPIC_MAX_RETRIES      リトライ回数
+  ANTHROPIC_MAX_CONNECTIONS  同時接続数の上限
+"""
+
+import os
+import threading
+
+CONNECT_TIMEOUT = float(os.environ.get("ANTHROPIC_CONNECT_TIMEOUT", 5.0))
+READ_TIMEOUT = float(os.environ.get("ANTHROPIC_READ_TIMEOUT", 60.0))
+MAX_RETRIES = int(os.environ.get("ANTHROPIC_MAX_RETRIES", 3))
+MAX_CONNECTIONS = int(os.environ.get("ANTHROPIC_MAX_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = 60.0
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def create_client(api_key, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                  max_retries=MAX_RETRIES, max_connections=MAX_CONNECTIONS):
+    """コネクションプールとタイムアウトを設定したクライアントを作る。"""
+    import anthropic
+
+    # SDKが使うHTTPライブラリの型をSDK経由で取得する（httpxを直接importしない）
+    limits_type = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+    timeout = anthropic.Timeout(read_timeout, connect=connect_timeout)
+    http_client = anthropic.DefaultHttpxClient(
+        timeout=timeout,
+        limits=limits_type(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+    return anthropic.Anthropic(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=timeout,
+        max_retries=max_retries,
+    )
+
+
+def get_client(api_key):
+    """APIキーごとに1つだけ作られる共有クライアントを返す。"""
+    client = _clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _clients.get(api_key)
+            if client is None:
+                client = _clients[api_key] = create_client(api_key)
+    return client
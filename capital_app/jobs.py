@@ -0,0 +1,167 @@
+"""
+AI分析のバックグラウンド実行（ジョブ）
+
+時間のかかる AI 分析を画面のスクリプトとは別のスレッドで実行し、ジョブIDで参照できるようにする。
+画面はジョブIDを st.session_state に持ち、再実行のたびに進み具合（順番待ち・受け取った文字数）を
+読むだけなので、途中でウィジェットを操作しても生成は止まらない。
+ジョブはプロセス内で共有し、終わったものも一定時間は結果を残す（生成済みの応答は AI 応答
+キャッシュにも保存されるので、期限後に同じ依頼をしてもトークンは消費しない）。
+
+各値は環境変数で上書きできる：
+  CAPITAL_ADVISOR_JOB_WORKERS    同時に実行するジョブ数の上限
+  CAPITAL_ADVISOR_JOB_RETENTION  終わったジョブの結果を残す時間（秒）
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from . import metrics
+from .admission import Cancelled
+from .llm import cached_stream
+from .prompts import TASK_SETTINGS
+
+JOB_WORKERS = int(os.environ.get("CAPITAL_ADVISOR_JOB_WORKERS", 16))
+JOB_RETENTION = float(os.environ.get("CAPITAL_ADVISOR_JOB_RETENTION", 3600))
+MAX_JOBS = 1000  # 保持するジョブ数の上限（超えたら終わったものから古い順に消す）
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class Job:
+    """
+    1件の AI 分析。status は queued（実行待ち）→ waiting（AI呼び出しの順番待ち）→ running → done /
+    failed / cancelled と進む。chunks は受け取った順のテキスト、usage はトークン使用量
+    （キャッシュ・生成中の同じ依頼から返したときは空）。
+    """
+
+    def __init__(self, task):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.status = "queued"
+        self.position = None
+        self.chunks = []
+        self.usage = {}
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self):
+        return self.cancel_event.is_set()
+
+    def text(self):
+        return "".join(self.chunks)
+
+    def elapsed(self):
+        """実行開始（まだなら登録）から終了（まだなら現在）までの秒数。"""
+        return (self.finished_at or time.time()) - (self.started_at or self.created_at)
+
+    def _on_wait(self, position):
+        self.position = position
+        self.status = "waiting" if position is not None else "running"
+
+
+class JobManager:
+    """ジョブの登録・実行・参照・中止（スレッドプールで実行する）。"""
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION, max_jobs=MAX_JOBS):
+        self.retention = retention
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+
+    def _prune(self, now):
+        """保持期間を過ぎた・上限を超えた終了済みのジョブを消す（ロック内で呼ぶ）。"""
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        excess = len(self._jobs) - self.max_jobs
+        for job in finished:
+            if job.finished_at >= now - self.retention and excess <= 0:
+                break
+            del self._jobs[job.id]
+            excess -= 1
+
+    def submit(self, task, func, *args, **kwargs):
+        """func(job, *args, **kwargs) をバックグラウンドで実行するジョブを登録して返す。"""
+        job = Job(task)
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancel_requested:
+            job.status, job.finished_at = "cancelled", time.time()
+            return
+        job.started_at = time.time()
+        job.status = "running"
+        try:
+            func(job, *args, **kwargs)
+        except Cancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = e
+            job.status = "failed"
+        else:
+            job.status = "cancelled" if job.cancel_requested and job.status != "done" else "done"
+        finally:
+            job.finished_at = time.time()
+            metrics.record(f"job.{job.task}", job.finished_at - job.started_at, status=job.status)
+
+    def submit_generation(self, client, cache, prompt, task, system=None, refresh=False):
+        """TASK_SETTINGS[task] の設定で AI の応答を生成するジョブを登録して返す。"""
+        return self.submit(task, _generate, client, cache, prompt, system=system, refresh=refresh)
+
+    def get(self, job_id):
+        """ジョブIDのジョブ（ない・期限切れなら None）。"""
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """中止を依頼する。順番待ちならすぐに、生成中なら次のチャンクを受け取った時点で止まる。"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def stats(self):
+        """状態ごとのジョブ数。"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+
+def _generate(job, client, cache, prompt, system=None, refresh=False):
+    stream = cached_stream(client, cache, prompt, **TASK_SETTINGS[job.task], system=system, task=job.task,
+                           usage=job.usage, refresh=refresh, on_wait=job._on_wait, cancel=job.cancel_event)
+    try:
+        for chunk in stream:
+            job.chunks.append(chunk)
+            if job.cancel_requested:
+                return
+        # 最後のチャンクまで受け取っていれば、中止の依頼が間に合わなくても結果を残す
+        job.status = "done"
+    finally:
+        stream.close()
+
+
+@lru_cache(maxsize=None)
+def default_manager():
+    """プロセス共有のジョブ管理。"""
+    return JobManager()
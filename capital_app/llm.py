@@ -0,0 +1,312 @@
+"""
+AI（Anthropic）呼び出しの共通処理
+
+呼び出しはプロセス共有の流量制御（admission）を通してから送る。同じ内容の依頼が
+生成中なら、新たに呼び出さずにその生成結果を一緒に受け取る。共通プレフィックス（system）は
+トークン数を数え、モデルのプロンプトキャッシュの最小長に届くときだけキャッシュを指定する。
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain
+
+from . import metrics
+from .admission import default_controller, estimate_tokens
+from .llm_cache import cache_key
+from .prompts import TASK_SETTINGS
+
+MODEL = "claude-sonnet-4-20250514"
+
+USAGE_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+# プロンプトキャッシュの最小長（トークン）。モデル名の最長の前方一致で引き、載っていないモデルには
+# キャッシュを指定しない
+CACHE_MIN_TOKENS = {
+    "claude-opus-4-5": 4096,
+    "claude-haiku-4-5": 4096,
+    "claude-opus-4": 1024,
+    "claude-sonnet-4": 1024,
+    "claude-3-7-sonnet": 1024,
+    "claude-3-5-sonnet": 1024,
+    "claude-3-opus": 1024,
+    "claude-3-5-haiku": 2048,
+    "claude-3-haiku": 2048,
+}
+
+# 数えた system のトークン数を覚えておく件数（プロフィールが変わるたびに増える）
+PREFIX_TOKENS_MAXSIZE = 256
+
+_usage_totals = {}
+_usage_lock = threading.Lock()
+
+_prefix_tokens = {}
+_prefix_lock = threading.Lock()
+
+
+def _record_usage(task, usage):
+    with _usage_lock:
+        totals = _usage_totals.setdefault(task or "other", dict.fromkeys(("calls",) + USAGE_FIELDS, 0))
+        totals["calls"] += 1
+        for field in USAGE_FIELDS:
+            totals[field] += usage.get(field, 0)
+
+
+def usage_stats():
+    """タスクごとのトークン使用量の累計（プロセス内）。"""
+    with _usage_lock:
+        return {task: dict(totals) for task, totals in _usage_totals.items()}
+
+
+def describe_usage(usage):
+    """1回分のトークン使用量を表示用の文字列にする。"""
+    if not usage:
+        return "保存済みの回答を表示（トークン消費なし）"
+    cached = usage.get("cache_read_input_tokens", 0)
+    total_input = usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0) + cached
+    return (
+        f"入力 {total_input:,} トークン（うちキャッシュ読込 {cached:,}）/ "
+        f"出力 {usage.get('output_tokens', 0):,} トークン"
+    )
+
+
+def cache_min_tokens(model):
+    """モデルのプロンプトキャッシュの最小長（トークン）。分からなければ None。"""
+    matches = [prefix for prefix in CACHE_MIN_TOKENS if model.startswith(prefix)]
+    return CACHE_MIN_TOKENS[max(matches, key=len)] if matches else None
+
+
+def _count_prefix_tokens(client, model, system):
+    """
+    system のトークン数を count_tokens で数える（同じ system はプロセス内で1回だけ）。
+    短い依頼文1つ分の数トークンを含む。数えられなければ（SDK が古い・通信エラー）None。
+    """
+    key = json.dumps([model, system], ensure_ascii=False, sort_keys=True)
+    with _prefix_lock:
+        if key in _prefix_tokens:
+            return _prefix_tokens[key]
+    try:
+        counted = client.messages.count_tokens(
+            model=model, system=system, messages=[{"role": "user", "content": "."}]
+        )
+    except Exception:
+        return None
+    with _prefix_lock:
+        if len(_prefix_tokens) >= PREFIX_TOKENS_MAXSIZE:
+            _prefix_tokens.pop(next(iter(_prefix_tokens)))
+        _prefix_tokens[key] = counted.input_tokens
+    return counted.input_tokens
+
+
+def cacheable_system(client, model, system):
+    """
+    system の最後のブロックにキャッシュ指定（cache_control）を付けて返す。
+
+    プロバイダーはモデルごとの最小長（CACHE_MIN_TOKENS）より短いプレフィックスをキャッシュしない
+    ので、数えたトークン数が最小長に届くときだけ付ける（届かない・数えられないときはそのまま）。
+    """
+    minimum = cache_min_tokens(model)
+    if minimum is None:
+        return system
+    if isinstance(system, str):
+        system = [{"type": "text", "text": system}]
+    tokens = _count_prefix_tokens(client, model, system)
+    if tokens is None or tokens < minimum:
+        return system
+    return system[:-1] + [{**system[-1], "cache_control": {"type": "ephemeral"}}]
+
+
+def stream_message(client, prompt, max_tokens, temperature, model=MODEL, system=None,
+                   task=None, usage=None, on_wait=None, controller=None, cancel=None):
+    """
+    生成されたテキストを届いた順に yield する。
+
+    system は共通プレフィックス（prompts.system_prompt）で、キャッシュできる長さなら
+    キャッシュを指定して送る（cacheable_system）。生成後、トークン使用量を
+    タスク別の累計に加え、usage（辞書）が渡されていればそこにも書き込む。
+    呼び出しは controller（既定はプロセス共有の流量制御）の順番が来てから送り、
+    待っている間は on_wait(順番) が、順番が来たら on_wait(None) が呼ばれる。
+    cancel（threading.Event）がセットされると順番待ちをやめて Cancelled を送出する。
+    """
+    params = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if system is not None:
+        params["system"] = cacheable_system(client, model, system)
+
+    controller = controller or default_controller()
+    tokens = estimate_tokens(prompt, max_tokens, system)
+    with controller.admit(task or "other", tokens, on_wait=on_wait, cancel=cancel) as ticket:
+        started_at = time.perf_counter()
+        first_token_at = None
+        with client.messages.stream(**params) as stream:
+            for text in stream.text_stream:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield text
+            final = stream.get_final_message()
+
+        counts = {field: getattr(final.usage, field, None) or 0 for field in USAGE_FIELDS}
+        ticket["used_tokens"] = sum(counts.values())
+    _record_usage(task, counts)
+    # 所要時間は最初のトークンまでの時間と合わせて記録する（表示側の待ち時間も含む）
+    metrics.record(
+        f"llm.{task or 'other'}", time.perf_counter() - started_at,
+        model=model,
+        first_token_seconds=None if first_token_at is None else first_token_at - started_at,
+        **counts,
+    )
+    if usage is not None:
+        usage.update(counts)
+
+
+class _SharedStream:
+    """生成中の応答のチャンクを、同じ依頼を待つ他の呼び出しにも順に配る。"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def __iter__(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield chunk
+
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def cached_stream(client, cache, prompt, max_tokens, temperature, model=MODEL, system=None,
+                  task=None, usage=None, refresh=False, on_wait=None, controller=None, cancel=None):
+    """
+    キャッシュがあればその応答を、なければ生成中のテキストを yield する。
+
+    最後まで生成できた応答だけをキャッシュに保存する。refresh=True のときは
+    キャッシュを読まずに再生成して上書きする。同じ依頼を別のセッションが生成中なら、
+    呼び出さずにその生成結果を受け取る。キャッシュ・生成中の依頼から返した場合 usage は空のまま。
+    """
+    key = cache_key(model, prompt, max_tokens, temperature, system=system)
+    if not refresh:
+        text = cache.get(key)
+        if text is not None:
+            yield text
+            return
+
+    with _in_flight_lock:
+        shared = _in_flight.get(key)
+        leader = shared is None
+        if leader:
+            shared = _in_flight[key] = _SharedStream()
+    if not leader:
+        metrics.record("llm.deduplicated", 0.0, task=task or "other")
+        yield from shared
+        return
+
+    try:
+        for chunk in stream_message(client, prompt, max_tokens, temperature, model=model,
+                                    system=system, task=task, usage=usage,
+                                    on_wait=on_wait, controller=controller, cancel=cancel):
+            shared.append(chunk)
+            yield chunk
+        # 次の同じ依頼がキャッシュから読めるよう、生成中の登録を外す前に保存する
+        cache.put(key, "".join(shared.chunks), model=model)
+        shared.finish()
+    except GeneratorExit:
+        shared.finish(RuntimeError("同じ内容の生成が途中で中断されました。再度お試しください"))
+        raise
+    except BaseException as e:
+        shared.finish(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def generate_text(client, cache, prompt, max_tokens, temperature, model=MODEL, system=None,
+                  task=None, usage=None, refresh=False, on_wait=None, controller=None, cancel=None):
+    """応答テキスト全体を返す（キャッシュ経由）。"""
+    return "".join(cached_stream(client, cache, prompt, max_tokens, temperature, model=model,
+                                 system=system, task=task, usage=usage, refresh=refresh,
+                                 on_wait=on_wait, controller=controller, cancel=cancel))
+
+
+# generate_all が待ち行列の順番を確かめる間隔（秒）
+WAIT_POLL_INTERVAL = 0.5
+
+
+def generate_all(client, cache, prompts, system=None, refresh=False, on_wait=None, controller=None):
+    """
+    複数タスクのプロンプトを同時に生成し、終わった順に
+    (タスク名, テキスト, トークン使用量, 例外) を yield する。
+
+    prompts は {タスク名: プロンプト}。生成設定は TASK_SETTINGS から取る。
+    on_wait(タスク名, 順番) は待ち行列の順番が変わるたびに、呼び出し元のスレッドで呼ばれる
+    （順番が来たら 順番=None）。
+    """
+    positions = {}
+    notified = {}
+    with ThreadPoolExecutor(max_workers=max(len(prompts), 1)) as pool:
+        futures = {}
+        for name, prompt in prompts.items():
+            usage = {}
+            future = pool.submit(generate_text, client, cache, prompt, system=system, task=name,
+                                 usage=usage, refresh=refresh, controller=controller,
+                                 on_wait=lambda position, name=name: positions.__setitem__(name, position),
+                                 **TASK_SETTINGS[name])
+            futures[future] = (name, usage)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=WAIT_POLL_INTERVAL if on_wait else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                name, usage = futures[future]
+                try:
+                    yield name, future.result(), usage, None
+                except Exception as e:
+                    yield name, None, usage, e
+            if on_wait is not None:
+                running = {futures[future][0] for future in pending}
+                for name, position in list(positions.items()):
+                    if name in running and notified.get(name, None) != position:
+                        notified[name] = position
+                        on_wait(name, position)
+
+
+def prefetch(chunks):
+    """
+    最初のチャンクが届くまで待ってから、残りをそのまま流すイテレータを返す。
+
+    スピナーを最初のトークンが届くまでだけ表示するために使う。
+    """
+    chunks = iter(chunks)
+    for first in chunks:
+        return chain([first], chunks)
+    return iter(())
@@ -0,0 +1,155 @@
+"""
+AI応答の永続キャッシュ（SQLite）
+
+モデル・system・プロンプト・max_tokens・temperature のハッシュをキーに応答テキストを保存する。
+有効期限（TTL）切れの削除と、容量上限を超えたときの最終参照が古い順（LRU）の削除を行う。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from functools import lru_cache
+
+DEFAULT_PATH = os.environ.get("CAPITAL_ADVISOR_LLM_CACHE", os.path.join(".cache", "llm_responses.sqlite3"))
+DEFAULT_TTL = 30 * 24 * 3600  # 30日
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 50MB
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def cache_key(model, prompt, max_tokens, temperature, system=None):
+    """リクエスト内容から決まるキャッシュキー（SHA-256）。"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "system": system,
+            "prompt": prompt,
+            "max_tokens": int(max_tokens),
+            "temperature": float(temperature),
+        },
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """内容アドレス方式のAI応答キャッシュ。"""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """1回の操作分の接続（抜けるときにコミット・ロールバックして閉じる）。"""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            yield conn
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def get(self, key):
+        """キャッシュ済みの応答テキストを返す。なければ None。"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT text, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bump(conn, "expirations")
+                row = None
+            if row is None:
+                self._bump(conn, "misses")
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._bump(conn, "hits")
+            return row[0]
+
+    def put(self, key, text, model=""):
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, text, bytes, created_at, accessed_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, text, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl is not None:
+            expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+            if expired:
+                self._bump(conn, "expirations", expired)
+        if self.max_bytes is None:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 最終参照が古い順に、容量上限を下回るまで削除する
+        evicted = 0
+        for key, size in conn.execute("SELECT key, bytes FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._bump(conn, "evictions", evicted)
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM counters")
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM responses").fetchone()
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": stored,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+        }
+
+
+@lru_cache(maxsize=None)
+def default_cache():
+    """プロセス内で共有する既定のキャッシュ。"""
+    return ResponseCache()
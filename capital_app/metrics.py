@@ -0,0 +1,141 @@
+"""
+処理時間の計測とメトリクス出力
+
+名前付きの区間（span）の所要時間と、AI呼び出しのレイテンシ・トークン数を
+プロセス全体で記録する。集計（p50 / p95 / p99）は直近の一定時間・一定件数の
+ローリングウィンドウで行い、JSONL と Prometheus のテキスト形式で出力できる。
+
+各値は環境変数で上書きできる：
+  CAPITAL_ADVISOR_METRICS_WINDOW  集計対象の時間幅（秒）
+  CAPITAL_ADVISOR_METRICS_LOG     指定するとイベントを JSONL で追記する
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+WINDOW_SECONDS = float(os.environ.get("CAPITAL_ADVISOR_METRICS_WINDOW", 15 * 60))
+WINDOW_SIZE = 1000  # 区間ごとに保持する件数の上限
+QUANTILES = (0.5, 0.95, 0.99)
+LOG_PATH = os.environ.get("CAPITAL_ADVISOR_METRICS_LOG")
+
+# イベントに付く数値項目のうち、集計で合計するもの
+SUM_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+_events = {}
+_lock = threading.Lock()
+
+
+def record(name, seconds, **fields):
+    """区間 name の所要時間（秒）を記録する。fields はトークン数などの付加情報。"""
+    event = {"name": name, "ts": time.time(), "seconds": seconds, **fields}
+    with _lock:
+        _events.setdefault(name, deque(maxlen=WINDOW_SIZE)).append(event)
+    if LOG_PATH:
+        line = json.dumps(event, ensure_ascii=False)
+        with _lock, open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    return event
+
+
+@contextmanager
+def span(name, **fields):
+    """with ブロックの所要時間を name で記録する。yield した辞書に付加情報を追加できる。"""
+    extra = dict(fields)
+    started_at = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        record(name, time.perf_counter() - started_at, **extra)
+
+
+def timed(name):
+    """関数の所要時間を name で記録するデコレーター。"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_events(window=WINDOW_SECONDS):
+    """ウィンドウ内のイベントを時刻順に返す。"""
+    cutoff = time.time() - window
+    with _lock:
+        events = [e for queue in _events.values() for e in queue if e["ts"] >= cutoff]
+    return sorted(events, key=lambda e: e["ts"])
+
+
+def _quantile(sorted_values, q):
+    """最近傍順位法のパーセンタイル。"""
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summary(window=WINDOW_SECONDS):
+    """区間ごとの件数・平均・パーセンタイル・最大（秒）と、付加情報の合計。"""
+    by_name = {}
+    for event in recent_events(window):
+        by_name.setdefault(event["name"], []).append(event)
+
+    result = {}
+    for name, events in sorted(by_name.items()):
+        durations = sorted(e["seconds"] for e in events)
+        stats = {
+            "count": len(durations),
+            "mean": sum(durations) / len(durations),
+            **{f"p{int(q * 100)}": _quantile(durations, q) for q in QUANTILES},
+            "max": durations[-1],
+            "sum": sum(durations),
+        }
+        for field in SUM_FIELDS:
+            if any(field in e for e in events):
+                stats[field] = sum(e.get(field) or 0 for e in events)
+        result[name] = stats
+    return result
+
+
+def to_jsonl(window=WINDOW_SECONDS):
+    """ウィンドウ内のイベントを JSONL 文字列にする。"""
+    return "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in recent_events(window))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(window=WINDOW_SECONDS, prefix="capital_advisor"):
+    """集計結果を Prometheus のテキスト形式にする（所要時間は summary、トークン数は gauge）。"""
+    stats = summary(window)
+    lines = [
+        f"# HELP {prefix}_span_seconds Duration of named processing stages over a rolling window.",
+        f"# TYPE {prefix}_span_seconds summary",
+    ]
+    for name, s in stats.items():
+        label = f'span="{_label(name)}"'
+        for q in QUANTILES:
+            lines.append(f'{prefix}_span_seconds{{{label},quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f"{prefix}_span_seconds_sum{{{label}}} {s['sum']:.6f}")
+        lines.append(f"{prefix}_span_seconds_count{{{label}}} {s['count']}")
+    for field in SUM_FIELDS:
+        rows = [(name, s[field]) for name, s in stats.items() if field in s]
+        if not rows:
+            continue
+        lines.append(f"# HELP {prefix}_{field} Tokens reported by the API over a rolling window.")
+        lines.append(f"# TYPE {prefix}_{field} gauge")
+        for name, value in rows:
+            lines.append(f'{prefix}_{field}{{span="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    """記録をすべて消す。"""
+    with _lock:
+        _events.clear()
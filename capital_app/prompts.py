@@ -0,0 +1,127 @@
+"""
+AIへのプロンプト（評価コメント・選択肢分析・シミュレーション解釈）
+
+3つの依頼で共通の企業プロフィールは system の固定プレフィックスにまとめ、
+タスクごとの依頼内容は user メッセージ（サフィックス）に置く。プレフィックスが
+プロンプトキャッシュの最小長に届くときは、呼び出し側（llm.stream_message）が
+キャッシュ指定（cache_control）を付けて再利用する。
+"""
+
+# タスクごとの生成設定
+TASK_SETTINGS = {
+    "valuation": {"max_tokens": 1500, "temperature": 0.5},
+    "analysis": {"max_tokens": 8000, "temperature": 0.3},
+    "interpretation": {"max_tokens": 1500, "temperature": 0.5},
+}
+
+ADVISOR_INSTRUCTIONS = """あなたは日本の企業金融・資本市場・企業評価に精通したアドバイザーです。
+日本の中小企業経営者に対して、専門用語を避けて分かりやすく、実践的に回答してください。
+
+以下は相談企業のプロフィールです。以降の依頼はすべてこの企業についてのものです。
+"""
+
+
+def company_profile(revenue, profit, growth_rate, years, employees, industry, location,
+                    rd_ratio, has_patent, is_hightech, has_export, need_money,
+                    funding_amount, accept_dilution, timeline, priority):
+    """サイドバーの入力から作る企業プロフィール（全タスク共通）。"""
+    return f"""
+# 企業情報
+- 年間売上高: {revenue}百万円
+- 経常利益: {profit}百万円（利益率: {profit/revenue*100 if revenue > 0 else 0:.1f}%）
+- 売上成長率: {growth_rate}%
+- 設立: {years}年
+- 従業員数: {employees}名
+- 業種: {industry}
+- 所在地: {location}
+- 研究開発比率: {rd_ratio}%
+- 特許保有: {'あり' if has_patent else 'なし'}
+- 高度技術企業: {'認定済' if is_hightech else '未認定'}
+- 輸出実績: {'あり' if has_export else 'なし'}
+
+# 経営者のニーズ
+- 資金調達ニーズ: {need_money}
+- 希望調達額: {funding_amount}百万円
+- 株式希薄化: {accept_dilution}
+- 希望期間: {timeline}
+- 優先事項: {', '.join(priority) if priority else '特になし'}
+"""
+
+
+def system_prompt(profile):
+    """system ブロック（共通プレフィックス）。キャッシュ指定は llm.stream_message が付ける。"""
+    return [{"type": "text", "text": ADVISOR_INSTRUCTIONS + profile}]
+
+
+def valuation_prompt(net_assets, min_value, min_method, median_value, max_value, max_method):
+    """タブ1：企業価値算定結果へのコメント依頼。"""
+    return f"""
+企業評価の専門家として、この企業の以下の算定結果について、経営者向けに分かりやすくコメントしてください。
+
+- 純資産: {net_assets}百万円
+
+算定結果:
+- 最低値: {min_value:.0f}百万円（{min_method}）
+- 中央値: {median_value:.0f}百万円
+- 最高値: {max_value:.0f}百万円（{max_method}）
+
+以下の観点でコメントしてください（各80-120文字）：
+
+1. **総合評価**: この企業価値は妥当か
+2. **推奨価格**: M&Aの場合、どの価格が現実的か
+3. **注意点**: 算定結果を解釈する上での留意点
+4. **価値向上のヒント**: 企業価値を高めるために何をすべきか
+
+簡潔に、実践的に。
+"""
+
+
+def analysis_prompt():
+    """タブ2：資本市場の選択肢分析の依頼。"""
+    return """
+この企業に対して、利用可能な資本市場の選択肢を提案してください。
+
+## 🎯 御社に最適な選択肢 TOP 3
+
+各選択肢について：
+1. 概要と適している理由
+2. 想定スケジュール
+3. 概算コスト
+4. メリット・デメリット
+5. 次のアクション
+
+を提供してください。
+
+日本市場特有の選択肢（東証グロース、日本政策金融公庫、ものづくり補助金、JAFCO等のVC、事業承継支援等）を優先的に。
+"""
+
+
+def interpretation_prompt(scenario, risk_scenario, initial, final, revenue_change, horizon=3):
+    """タブ3：シミュレーション結果の解釈の依頼。initial / final は現在・最終年（horizon 年後）の値。"""
+    return f"""
+この企業の以下のシミュレーション結果について、経営者向けに分かりやすくコメントしてください：
+
+シナリオ: {scenario}
+リスクケース: {risk_scenario}
+
+現在の状況:
+- 売上: {initial['revenue']:.0f}百万円
+- 利益: {initial['profit']:.0f}百万円
+- 企業価値: {initial['company_value']:.0f}百万円
+
+{horizon}年後の予測:
+- 売上: {final['revenue']:.0f}百万円（{revenue_change:+.1f}%）
+- 利益: {final['profit']:.0f}百万円
+- 企業価値: {final['company_value']:.0f}百万円
+- 経営者持株比率: {final['equity']:.1f}%
+- 経営者持分価値: {final['owner_value']:.0f}百万円
+
+以下の観点でコメントしてください（各50-100文字程度）：
+
+1. **全体評価**: このシナリオの妥当性
+2. **ポジティブな点**: 何が良いか
+3. **リスクと注意点**: 何に気をつけるべきか
+4. **推奨アクション**: 次に何をすべきか
+
+簡潔で実践的に。
+"""
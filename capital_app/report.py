@@ -0,0 +1,311 @@
+"""
+レポートの作成と書き出し（Markdown / CSV / JSON / Parquet）
+
+レポートは「セクション」の並びで表す。各セクションは見出しと、箇条書き（items）・
+本文（text）・表（table）のいずれかを持つ辞書：
+
+    {"title": "算定結果サマリー", "items": [("中央値", 350.0, "百万円"), ...]}
+    {"title": "手法別詳細", "table": {"columns": [...], "rows": [[...], ...]}}
+    {"title": "AIによる評価コメント", "text": "..."}
+
+書き出しはセクションごとに少しずつ行い、レポート全体の文字列を作り直さない。
+CSV / Parquet は数値の項目と表のセルだけを (section, row, column, value) の
+縦持ちの表にする。多数の企業のレポートは ReportZipWriter で ZIP に逐次書き込める。
+"""
+
+import csv
+import io
+import json
+import math
+import re
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+FORMATS = {
+    "md": ("Markdown", "text/markdown"),
+    "csv": ("CSV", "text/csv"),
+    "json": ("JSON", "application/json"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+
+DISCLAIMER = (
+    "本レポートは簡易的な算定であり、実際のM&Aや資金調達の際は、\n"
+    "専門家（公認会計士、M&Aアドバイザー等）による詳細なデューデリジェンスが必要です。"
+)
+
+NUMERIC_COLUMNS = ("section", "row", "column", "value")
+
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def parquet_available():
+    """Parquet で書き出せるか（pyarrow が入っているか）。"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def _is_finite_number(value):
+    return _is_number(value) and math.isfinite(value)
+
+
+def _format_value(value, unit=""):
+    if _is_number(value):
+        if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+            return "—"
+        return f"{value:,.0f}{unit}" if isinstance(value, (float, np.floating)) else f"{value}{unit}"
+    return f"{value}{unit}"
+
+
+def _plain(value):
+    """JSON に書ける値にする（NumPy の数値は Python の数値に、NaN は null に）。"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+# ----------------------------------------
+# レポートの組み立て
+# ----------------------------------------
+
+def valuation_sections(industry, revenue, profit, net_assets, ebitda, summary, methods, extra=()):
+    """
+    企業価値算定レポートのセクションを順に返す（タブ1・一括評価で共通）。
+
+    summary は min / median / max / mean の辞書。methods は {手法名: 企業価値} か
+    {手法名: {"value", "formula", "description", "suitable"}}。extra は末尾の注意事項の
+    前に入れるセクション（シナリオ比較など）。
+    """
+    yield {"title": "企業情報", "items": [
+        ("業種", industry, ""),
+        ("年間売上", revenue, "百万円"),
+        ("経常利益", profit, "百万円"),
+        ("純資産", net_assets, "百万円"),
+        ("EBITDA", ebitda, "百万円"),
+    ]}
+    yield {"title": "算定結果サマリー", "items": [
+        ("最低値", summary["min"], "百万円"),
+        ("中央値", summary["median"], "百万円（推奨）"),
+        ("最高値", summary["max"], "百万円"),
+        ("平均値", summary["mean"], "百万円"),
+    ]}
+    details = any(isinstance(data, dict) for data in methods.values())
+    rows = []
+    for method, data in methods.items():
+        if not isinstance(data, dict):
+            data = {"value": data}
+        row = [method, data["value"]]
+        if details:
+            row += [data.get("formula", ""), data.get("description", ""), data.get("suitable", "")]
+        rows.append(row)
+    columns = ["算定方法", "企業価値（百万円）"] + (["計算式", "説明", "適用性"] if details else [])
+    yield {"title": "手法別詳細", "table": {"columns": columns, "rows": rows}}
+    yield from extra
+    yield {"title": "推奨価格レンジ", "items": [
+        ("下限", summary["median"] * 0.8, "百万円"),
+        ("上限", summary["median"] * 1.2, "百万円"),
+    ]}
+    yield {"title": "注意事項", "text": DISCLAIMER}
+
+
+def text_sections(texts):
+    """{見出し: 本文} を本文だけのセクションにする（AI分析の書き出し用）。"""
+    for title, text in texts.items():
+        yield {"title": title, "text": text}
+
+
+# ----------------------------------------
+# 形式ごとの書き出し（文字列の断片を順に返す）
+# ----------------------------------------
+
+def iter_markdown(sections, title, created_at=None):
+    created_at = created_at or datetime.now()
+    yield f"# {title}\n"
+    for section in sections:
+        yield f"\n## {section['title']}\n\n"
+        if "items" in section:
+            for label, value, unit in section["items"]:
+                yield f"- {label}: {_format_value(value, unit)}\n"
+        if "table" in section:
+            table = section["table"]
+            yield "| " + " | ".join(table["columns"]) + " |\n"
+            yield "|" + "---|" * len(table["columns"]) + "\n"
+            for row in table["rows"]:
+                yield "| " + " | ".join(_format_value(v).replace("|", "\\|") for v in row) + " |\n"
+        if "text" in section:
+            yield section["text"].rstrip("\n") + "\n"
+    yield f"\n作成日: {created_at.strftime('%Y年%m月%d日')}\n"
+
+
+def iter_numeric_rows(sections):
+    """数値の項目と表のセルを (section, row, column, value) の行として順に返す（NaN は除く）。"""
+    for section in sections:
+        for label, value, _ in section.get("items", ()):
+            if _is_finite_number(value):
+                yield section["title"], label, "", float(value)
+        table = section.get("table")
+        if table:
+            for row in table["rows"]:
+                for column, value in zip(table["columns"][1:], row[1:]):
+                    if _is_finite_number(value):
+                        yield section["title"], str(row[0]), column, float(value)
+
+
+def iter_csv(sections, title=None, created_at=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(NUMERIC_COLUMNS)
+    for row in iter_numeric_rows(sections):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_json(sections, title, created_at=None):
+    created_at = created_at or datetime.now()
+    head = {"title": title, "created_at": created_at.isoformat(timespec="seconds")}
+    yield json.dumps(head, ensure_ascii=False)[:-1] + ', "sections": ['
+    for i, section in enumerate(sections):
+        section = dict(section)
+        if "items" in section:
+            section["items"] = [{"label": label, "value": _plain(value), "unit": unit}
+                                for label, value, unit in section["items"]]
+        if "table" in section:
+            section["table"] = {
+                "columns": section["table"]["columns"],
+                "rows": [[_plain(v) for v in row] for row in section["table"]["rows"]],
+            }
+        yield ("," if i else "") + json.dumps(section, ensure_ascii=False)
+    yield "]}\n"
+
+
+def write_parquet(sections, file):
+    """数値の縦持ちの表を Parquet で file（パスかバイナリのファイル）に書く。"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet の書き出しには pyarrow が必要です（pip install pyarrow）")
+    columns = {name: [] for name in NUMERIC_COLUMNS}
+    for row in iter_numeric_rows(sections):
+        for name, value in zip(NUMERIC_COLUMNS, row):
+            columns[name].append(value)
+    schema = pa.schema([("section", pa.string()), ("row", pa.string()), ("column", pa.string()), ("value", pa.float64())])
+    pq.write_table(pa.table(columns, schema=schema), file)
+
+
+_TEXT_WRITERS = {"md": iter_markdown, "csv": iter_csv, "json": iter_json}
+
+
+def write_report(sections, fmt, file, title="レポート", created_at=None):
+    """
+    レポートを fmt の形式でバイナリのファイル file に書き込む。
+
+    断片は WRITE_BUFFER_SIZE バイトたまるごとにまとめて書くので、
+    小さなレポートでは1回、大きなレポートでも一定のメモリで書き終わる。
+    """
+    if fmt == "parquet":
+        write_parquet(sections, file)
+        return
+    if fmt not in _TEXT_WRITERS:
+        raise ValueError(f"形式は {tuple(FORMATS)} のいずれかです: {fmt!r}")
+    pending, size = [], 0
+    for chunk in _TEXT_WRITERS[fmt](sections, title=title, created_at=created_at):
+        data = chunk.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= WRITE_BUFFER_SIZE:
+            file.write(b"".join(pending))
+            pending, size = [], 0
+    if pending:
+        file.write(b"".join(pending))
+
+
+def render(sections, fmt, title="レポート", created_at=None):
+    """レポートを bytes にする（ダウンロードボタン用）。"""
+    buffer = io.BytesIO()
+    write_report(list(sections), fmt, buffer, title=title, created_at=created_at)
+    return buffer.getvalue()
+
+
+# ----------------------------------------
+# 一括評価の結果から ZIP にまとめて書き出す
+# ----------------------------------------
+
+def _column(frame, name, default=np.nan):
+    if name in frame.columns:
+        return frame[name].to_numpy()
+    return np.full(len(frame), default, dtype=object)
+
+
+def batch_report_sections(row, methods, scenarios):
+    """一括評価の結果1行（列名 → 値の辞書）から、企業価値算定レポートのセクションを返す。"""
+    net_assets = row["total_assets"] - row["total_liabilities"]
+    comparison = {"title": "シナリオ比較（3年後の経営者持分価値）", "table": {
+        "columns": ["シナリオ", "経営者持分価値（百万円）"],
+        "rows": [[name, row[f"{name}_owner_value"]] for name in scenarios],
+    }}
+    extra = [comparison, {"title": "持分価値が最大のシナリオ", "text": str(row["best_scenario"])}]
+    return valuation_sections(
+        row["industry"], row["revenue"], row["profit"], net_assets, row["profit"] + row["depreciation"],
+        {key: row[f"valuation_{key}"] for key in ("min", "median", "max", "mean")},
+        {method: row[method] for method in methods},
+        extra=extra,
+    )
+
+
+def _entry_name(number, name):
+    if name is None or (isinstance(name, float) and math.isnan(name)):
+        return f"{number:07d}"
+    safe = re.sub(r'[\\/:*?"<>|\s]+', "_", str(name)).strip("_")[:60]
+    return f"{number:07d}_{safe}" if safe else f"{number:07d}"
+
+
+class ReportZipWriter:
+    """
+    一括評価の結果をチャンクごとに受け取り、企業ごとのレポートを ZIP に追記する。
+
+    1社分ずつ ZIP のエントリに直接書き込むので、メモリに載るのは処理中のチャンクだけ。
+    エントリ名は 行番号（と name 列があればその値）+ 形式の拡張子。
+    """
+
+    def __init__(self, path, formats=("md",), title="企業価値算定レポート"):
+        unknown = [fmt for fmt in formats if fmt not in FORMATS]
+        if unknown:
+            raise ValueError(f"形式は {tuple(FORMATS)} のいずれかです: {', '.join(unknown)}")
+        self.path = path
+        self.formats = tuple(formats)
+        self.title = title
+        self.reports = 0
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+        self._created_at = datetime.now()
+
+    def write(self, frame, first_row, methods, scenarios):
+        """評価済みのチャンク（evaluate_frame の結果）の各行のレポートを書き込む。first_row は先頭行の行番号。"""
+        names = _column(frame, "name", None)
+        industry = frame["industry"].fillna("その他").to_numpy() if "industry" in frame.columns else None
+        columns = {column: frame[column].to_numpy() for column in frame.columns}
+        for i in range(len(frame)):
+            row = {column: values[i] for column, values in columns.items()}
+            row["industry"] = industry[i] if industry is not None else "その他"
+            base = _entry_name(first_row + i, names[i])
+            for fmt in self.formats:
+                sections = batch_report_sections(row, methods, scenarios)
+                with self._zip.open(f"{base}.{fmt}", "w") as entry:
+                    write_report(sections, fmt, entry, title=self.title, created_at=self._created_at)
+            self.reports += 1
+
+    def close(self):
+        self._zip.close()
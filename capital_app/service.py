@@ -0,0 +1,544 @@
+"""
+評価サービス（JSON over HTTP）
+
+タブ1の全算定手法・DCF法の詳細・タブ3のシミュレーター・タブ4のシナリオ比較を、
+画面を使わずに HTTP の JSON API として呼び出せるようにする。
+リクエストの解析・計算・JSON への変換はプロセスプールのワーカーで行い、
+受付側のスレッドは入出力だけを受け持つ。
+
+使い方:
+    python -m capital_app.service --port 8765 --workers 4
+    curl -s localhost:8765/v1/valuation -d '{"revenue": 1000, "profit": 100, "total_assets": 800,
+        "total_liabilities": 400, "depreciation": 30, "industry": "製造業", "growth_rate": 10}'
+
+エンドポイント:
+    POST /v1/valuation   全算定手法と集計（中央値・最低・最高・平均）
+    POST /v1/dcf         DCF法の詳細（WACC・年別FCF・継続価値など）
+    POST /v1/simulation  タブ3の推移（events で資金調達の予定、steps_per_year で月次。monte_carlo を付けると
+                         パーセンタイル帯も）
+    POST /v1/comparison  タブ4の標準シナリオ比較（経営者持分価値。VC調達は funding_amount と優先株の条件
+                         preference / participating / cap / option_pool で優先分配後の受取額）
+    GET  /healthz        稼働確認
+    GET  /metrics        エンドポイントごとの件数とレイテンシ p50 / p95 / p99（?format=prometheus も可）
+
+リクエスト本体は1社分のオブジェクトか、その配列（一括）。配列なら結果も同じ順の配列で返し、
+算定・DCF・シナリオ比較は NumPy でまとめて計算する。入力の項目名は一括評価
+（capital_app.batch）の列名と同じ。受け付け中（待ち + 計算中）のリクエストが上限を
+超えると、待たせずに 503 と Retry-After を返す。
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from capital_core import (
+    DEFAULT_ROUND_TERMS,
+    FUNDING_SCENARIOS,
+    METHODS,
+    compare_funding_options,
+    monte_carlo,
+    value_companies,
+)
+from capital_core.dcf import DCF_YEARS
+from capital_core.industry import industry_table
+from capital_core.simulation import STEPS_PER_YEAR, simulate
+
+from . import metrics
+from .batch import DEFAULT_GROWTH_DECAY
+
+DEFAULT_PORT = int(os.environ.get("CAPITAL_ADVISOR_SERVICE_PORT", 8765))
+PENDING_PER_WORKER = 8  # ワーカー1つあたりの受け付け数（待ち + 計算中）の上限
+REQUEST_TIMEOUT = 30.0  # 秒
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH = 100_000  # 一括リクエストの件数の上限
+MAX_PATHS = 1_000_000  # モンテカルロの試行回数の上限
+
+# 倍率の上書き（項目名 → 業種別パラメータの列名）
+MULTIPLE_OVERRIDES = {
+    "per_multiple": "per",
+    "pbr_multiple": "pbr",
+    "ebitda_multiple": "ebitda",
+    "year_buy_multiple": "year_buy",
+}
+
+DCF_KEYS = ("beta", "cost_of_equity", "debt_ratio", "wacc", "fcf_pv", "final_year_fcf", "perpetual_growth",
+            "terminal_value", "terminal_pv", "enterprise_value", "net_debt", "equity_value")
+DCF_YEAR_KEYS = ("revenue", "fcf", "discount_factor", "pv_fcf")
+SIMULATION_KEYS = ("time", "revenue", "profit", "profit_margin", "company_value", "owner_value", "equity", "debt",
+                   "funding")
+MONTE_CARLO_OPTIONS = ("n_paths", "seed", "growth_vol", "margin_vol", "pe_vol", "growth_persistence")
+
+
+class RequestError(ValueError):
+    """リクエストの内容が正しくない（400 を返す）。"""
+
+
+# ----------------------------------------
+# 入力の読み取り
+# ----------------------------------------
+
+def _floats(items, name, default=None):
+    """各リクエストの name を数値の配列にする（null は省略と同じ）。default が None なら必須。"""
+    values = []
+    for i, item in enumerate(items):
+        value = item.get(name)
+        if value is None:
+            value = default
+        if value is None:
+            raise RequestError(f"{i}件目: {name} がありません")
+        values.append(value)
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        raise RequestError(f"{name} は数値で指定してください")
+
+
+def _codes(items, parameters):
+    return parameters.codes(
+        np.asarray([str(item.get("industry") or parameters.default) for item in items]), size=len(items)
+    )
+
+
+def _growth_paths(items, codes_growth_rate):
+    """年別成長率（growth の配列、なければ growth_rate から基本ケースの逓減）を (N, T) にする。"""
+    fallback = codes_growth_rate[:, None] * np.array(DEFAULT_GROWTH_DECAY)
+    rows = []
+    for i, item in enumerate(items):
+        growth = item.get("growth")
+        if growth is None:
+            rows.append(fallback[i])
+            continue
+        if not isinstance(growth, list) or not growth:
+            raise RequestError(f"{i}件目: growth は年別成長率（%）の配列で指定してください")
+        rows.append(growth)
+    if len({len(row) for row in rows}) > 1:
+        raise RequestError("一括リクエストでは growth の年数をそろえてください")
+    try:
+        return np.asarray(rows, dtype=float)
+    except (TypeError, ValueError):
+        raise RequestError("growth は数値の配列で指定してください")
+
+
+def _numbers(values):
+    """1次元の配列を JSON に書けるリストにする（NaN・無限大は null）。"""
+    return [v if math.isfinite(v) else None for v in np.asarray(values, dtype=float).tolist()]
+
+
+# ----------------------------------------
+# エンドポイントごとの計算（ワーカーで実行する）
+# ----------------------------------------
+
+def _value(items):
+    """value_companies を予測期間ごとにまとめて呼び、(インデックス, 結果) を順に返す。"""
+    years = _floats(items, "dcf_years", DCF_YEARS).astype(int)
+    parameters = industry_table()
+    codes = _codes(items, parameters)
+    for dcf_years in np.unique(years):
+        index = np.flatnonzero(years == dcf_years)
+        group = [items[i] for i in index]
+        overrides = {}
+        for name, column in MULTIPLE_OVERRIDES.items():
+            if any(name in item for item in group):
+                values = _floats(group, name, math.nan)
+                overrides[name] = np.where(np.isnan(values), getattr(parameters, column)[codes[index]], values)
+        try:
+            result = value_companies(
+                _floats(group, "revenue"), _floats(group, "profit"),
+                _floats(group, "total_assets"), _floats(group, "total_liabilities"),
+                _floats(group, "depreciation", 0.0),
+                industry=codes[index],
+                growth_rate=_floats(group, "growth_rate", 0.0),
+                dcf_years=int(dcf_years),
+                parameters=parameters,
+                **overrides,
+            )
+        except ValueError as e:
+            raise RequestError(str(e))
+        yield index, result
+
+
+def valuation_results(items):
+    """タブ1の全算定手法と集計。"""
+    results = [None] * len(items)
+    for index, result in _value(items):
+        # NumPy のスカラーを1つずつ取り出すと遅いので、列ごとに Python のリストにしてから組み立てる
+        methods = [_numbers(result[method]) for method in METHODS]
+        columns = {key: _numbers(result[key]) for key in ("median", "min", "max", "mean", "net_assets", "ebitda")}
+        columns["wacc"] = _numbers(result["dcf"]["wacc"])
+        count = result["count"].tolist()
+        for j, i in enumerate(index.tolist()):
+            results[i] = {
+                "methods": {method: values[j] for method, values in zip(METHODS, methods)},
+                **{key: values[j] for key, values in columns.items()},
+                "count": count[j],
+            }
+    return results
+
+
+def dcf_results(items):
+    """DCF法の詳細（タブ1の「DCF法の詳細内訳」と同じ値）。"""
+    results = [None] * len(items)
+    for index, result in _value(items):
+        dcf = result["dcf"]
+        years = dcf["years"].astype(int).tolist()
+        columns = {key: _numbers(dcf[key]) for key in DCF_KEYS}
+        rows = {key: [_numbers(row) for row in dcf[key]] for key in DCF_YEAR_KEYS}
+        for j, i in enumerate(index.tolist()):
+            results[i] = {
+                **{key: values[j] for key, values in columns.items()},
+                "years": years,
+                **{key: values[j] for key, values in rows.items()},
+            }
+    return results
+
+
+def _events(item, i):
+    """資金調達イベントの配列（simulation.run_scenarios の形式）。"""
+    events = item.get("events", [])
+    if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+        raise RequestError(f"{i}件目: events はオブジェクトの配列で指定してください")
+    return events
+
+
+def _monte_carlo_options(options, i):
+    """monte_carlo の設定を数値にして確かめる（MONTE_CARLO_OPTIONS 以外の項目は無視する）。"""
+    if not isinstance(options, dict):
+        raise RequestError(f"{i}件目: monte_carlo はオブジェクトで指定してください")
+    checked = {}
+    for key in MONTE_CARLO_OPTIONS:
+        if key not in options:
+            continue
+        value = options[key]
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            number = float(value)
+        except (TypeError, ValueError):
+            raise RequestError(f"{i}件目: monte_carlo.{key} は数値で指定してください")
+        if not math.isfinite(number) or number < 0:
+            raise RequestError(f"{i}件目: monte_carlo.{key} は0以上の数値で指定してください")
+        checked[key] = int(number) if key in ("n_paths", "seed") else number
+    if not 0 < checked.get("n_paths", 100_000) <= MAX_PATHS:
+        raise RequestError(f"{i}件目: n_paths は1〜{MAX_PATHS:,}で指定してください")
+    if checked.get("growth_persistence", 0.0) > 1:
+        raise RequestError(f"{i}件目: growth_persistence は0〜1で指定してください")
+    return checked
+
+
+def simulation_results(items):
+    """
+    タブ3の推移。events（資金調達の予定）と steps_per_year（1で年次、12で月次）を指定できる。
+    monte_carlo（オブジェクト）を付けたリクエストはパーセンタイル帯も返す（年次）。
+    """
+    parameters = industry_table()
+    codes = _codes(items, parameters)
+    revenue = _floats(items, "revenue")
+    profit = _floats(items, "profit")
+    growth = _floats(items, "growth_rate", 0.0)
+    margin_improvement = _floats(items, "margin_improvement", 1.0)
+    pe_multiple = _floats(items, "pe_multiple", math.nan)
+    pe_multiple = np.where(np.isnan(pe_multiple), parameters.per[codes], pe_multiple)
+    equity_dilution = _floats(items, "equity_dilution", 0.0)
+    interest_payment = _floats(items, "interest_payment", 0.0)
+
+    results = []
+    for i, item in enumerate(items):
+        year_growth = _growth_paths([item], growth[i:i + 1])[0]
+        events = _events(item, i)
+        steps_per_year = item.get("steps_per_year", 1)
+        if steps_per_year not in STEPS_PER_YEAR.values():
+            raise RequestError(f"{i}件目: steps_per_year は1（年次）か12（月次）で指定してください")
+        try:
+            sim = simulate(revenue[i], profit[i], year_growth, margin_improvement[i], pe_multiple[i],
+                           equity_dilution=equity_dilution[i], interest_payment=interest_payment[i],
+                           events=events, steps_per_year=steps_per_year)
+        except (KeyError, TypeError, ValueError) as e:
+            raise RequestError(f"{i}件目: events を解釈できません（{e}）")
+        result = {"years": sim["year_num"].tolist(), **{key: _numbers(sim[key]) for key in SIMULATION_KEYS}}
+        options = item.get("monte_carlo")
+        if options is not None:
+            options = _monte_carlo_options(options, i)
+            mc = monte_carlo(revenue[i], profit[i], year_growth, margin_improvement[i], pe_multiple[i],
+                             equity_dilution=equity_dilution[i], interest_payment=interest_payment[i],
+                             events=events, **options)
+            result["monte_carlo"] = {
+                "percentiles": mc["percentiles"].tolist(),
+                "n_paths": int(mc["n_paths"]),
+                "prob_owner_value_down": mc["prob_owner_value_down"],
+                **{key: [_numbers(band) for band in mc[key]] for key in ("revenue", "company_value", "owner_value")},
+            }
+        results.append(result)
+    return results
+
+
+def comparison_results(items):
+    """
+    タブ4の標準シナリオ（VC調達・銀行融資・自己資金）の比較。growth の年数ごとにまとめて計算する。
+    VC調達は funding_amount を優先株の投資額とし、条件（省略時はタブ3の既定値）で分配する。
+    """
+    parameters = industry_table()
+    codes = _codes(items, parameters)
+    revenue = _floats(items, "revenue")
+    profit = _floats(items, "profit")
+    growth_rate = _floats(items, "growth_rate", 0.0)
+    funding_amount = _floats(items, "funding_amount", 0.0)
+    pe_multiple = _floats(items, "pe_multiple", math.nan)
+    pe_multiple = np.where(np.isnan(pe_multiple), parameters.per[codes], pe_multiple)
+    terms = {
+        key: _floats(items, key, math.nan if default is None else default)
+        for key, default in DEFAULT_ROUND_TERMS.items()
+    }
+    horizons = np.array([len(item["growth"]) if isinstance(item.get("growth"), list) else -1 for item in items])
+
+    results = [None] * len(items)
+    for horizon in np.unique(horizons):
+        index = np.flatnonzero(horizons == horizon)
+        year_growth = _growth_paths([items[i] for i in index], growth_rate[index])
+        try:
+            compared = compare_funding_options(
+                revenue[index], profit[index], year_growth, pe_multiple[index],
+                funding=funding_amount[index], terms={key: values[index] for key, values in terms.items()},
+            )
+        except ValueError as e:
+            raise RequestError(str(e))
+        best = np.argmax(compared["owner_value"], axis=1).tolist()
+        columns = {key: [_numbers(row) for row in compared[key]]
+                   for key in ("final_revenue", "company_value", "equity", "owner_value")}
+        funding = funding_amount[index].tolist()
+        for j, i in enumerate(index.tolist()):
+            results[i] = {
+                "scenarios": [
+                    {
+                        "name": scenario["name"],
+                        "funding": funding[j] if scenario["funded"] else 0.0,
+                        "dilution": scenario["dilution"],
+                        **{key: values[j][s] for key, values in columns.items()},
+                    }
+                    for s, scenario in enumerate(FUNDING_SCENARIOS)
+                ],
+                "best_scenario": FUNDING_SCENARIOS[best[j]]["name"],
+            }
+    return results
+
+
+ENDPOINTS = {
+    "valuation": valuation_results,
+    "dcf": dcf_results,
+    "simulation": simulation_results,
+    "comparison": comparison_results,
+}
+
+
+def _json(value):
+    return json.dumps(value, ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+def handle(endpoint, body):
+    """
+    ワーカー側でリクエスト本体（bytes）を解析・計算し、(ステータス, 応答本体, 件数, 計算時間) を返す。
+    """
+    started_at = time.perf_counter()
+    try:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise RequestError("本体が JSON ではありません")
+        single = isinstance(payload, dict)
+        items = [payload] if single else payload
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise RequestError("本体はオブジェクトか、オブジェクトの配列で指定してください")
+        if not 0 < len(items) <= MAX_BATCH:
+            raise RequestError(f"一括リクエストは1〜{MAX_BATCH:,}件で指定してください")
+        results = ENDPOINTS[endpoint](items)
+        status, response = 200, _json(results[0] if single else results)
+    except RequestError as e:
+        items, status, response = (), 400, _json({"error": str(e)})
+    return status, response, len(items), time.perf_counter() - started_at
+
+
+def _warmup(_):
+    """ワーカーの起動時に計算パスを1度通しておく（初回リクエストの遅延を避ける）。"""
+    sample = {"revenue": 1000, "profit": 100, "total_assets": 800, "total_liabilities": 400, "depreciation": 30}
+    for endpoint in ENDPOINTS:
+        handle(endpoint, _json(sample))
+
+
+# ----------------------------------------
+# HTTP の受付
+# ----------------------------------------
+
+class ValuationService:
+    """
+    ワーカープールと受け付け数の上限（バックプレッシャー）。
+
+    受け付けたリクエストはプールの待ち行列に入り、計算が終わるまで枠を1つ使う。
+    枠がすべて埋まっていれば submit は None を返し、呼び出し側は 503 を返す。
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=REQUEST_TIMEOUT):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        self.timeout = timeout
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # 受付スレッドが動いている親プロセスからは fork せずに起動する
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        list(self._pool.map(_warmup, range(self.workers)))
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, endpoint, body):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                return None
+            self.pending += 1
+        future = self._pool.submit(handle, endpoint, body)
+        # 枠は応答を返したときではなく計算が終わったときに戻す（タイムアウト後も計算は続くため）
+        future.add_done_callback(self._release)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "max_pending": self.max_pending,
+                    "pending": self.pending, "rejected": self.rejected}
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive で接続を使い回せるようにする
+    # ヘッダーと本体を別々に書くので、Nagle と遅延 ACK の組み合わせで 40ms 待たないようにする
+    disable_nagle_algorithm = True
+    server_version = "CapitalAdvisor"
+    quiet = True
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=()):
+        self._send(status, _json({"error": message}), headers=headers)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        service = self.server.service
+        if url.path == "/healthz":
+            self._send(200, _json({"status": "ok", "industry_parameters": industry_table().version, **service.stats()}))
+        elif url.path == "/metrics":
+            if parse_qs(url.query).get("format") == ["prometheus"]:
+                self._send(200, metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            else:
+                spans = {name: s for name, s in metrics.summary().items() if name.startswith("service.")}
+                self._send(200, _json({**service.stats(), "spans": spans}))
+        else:
+            self._error(404, f"不明なパスです: {url.path}")
+
+    def do_POST(self):
+        started_at = time.perf_counter()
+        url = urlsplit(self.path)
+        endpoint = url.path.removeprefix("/v1/")
+        if endpoint not in ENDPOINTS or not url.path.startswith("/v1/"):
+            self._error(404, f"不明なパスです: {url.path}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # 本体の長さが分からないと読み終わりが決まらないので、接続ごと打ち切る
+            self.close_connection = True
+            self._error(400, "Content-Length は0以上の整数で指定してください")
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._error(413, f"本体は{MAX_BODY_BYTES // (1024 * 1024)}MBまでです")
+            return
+        body = self.rfile.read(length)
+
+        future = self.server.service.submit(endpoint, body)
+        if future is None:
+            metrics.record("service.rejected", time.perf_counter() - started_at, endpoint=endpoint)
+            self._error(503, "混み合っています。しばらくしてから再度お試しください", headers=[("Retry-After", "1")])
+            return
+        try:
+            status, response, items, compute_seconds = future.result(timeout=self.server.service.timeout)
+        except FutureTimeoutError:
+            metrics.record("service.timeout", time.perf_counter() - started_at, endpoint=endpoint)
+            self._error(504, "計算が時間内に終わりませんでした")
+            return
+        except Exception as e:
+            # 想定外の例外でも接続を切らずに 500 を返す（詳細はサーバー側のログへ）
+            metrics.record("service.error", time.perf_counter() - started_at, endpoint=endpoint)
+            print(f"{endpoint} の計算でエラー: {e!r}", file=sys.stderr)
+            self._error(500, "計算中にエラーが発生しました")
+            return
+        self._send(status, response)
+        elapsed = time.perf_counter() - started_at
+        metrics.record(f"service.{endpoint}", elapsed, status=status, items=items)
+        metrics.record(f"service.{endpoint}.compute", compute_seconds, items=items)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=None, max_pending=None, timeout=REQUEST_TIMEOUT,
+          verbose=False):
+    """サービスを起動し、Ctrl+C まで受け付ける。"""
+    service = ValuationService(workers=workers, max_pending=max_pending, timeout=timeout)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    ServiceHandler.quiet = not verbose
+    stats = service.stats()
+    print(f"評価サービス: http://{host}:{server.server_port}/ "
+          f"（ワーカー{stats['workers']}、受け付け上限{stats['max_pending']}）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m capital_app.service",
+        description="企業価値算定・シミュレーション・シナリオ比較の JSON API を起動する",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="ワーカープロセス数（既定：CPUコア数）")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help=f"受け付け数（待ち + 計算中）の上限（既定：ワーカー数 × {PENDING_PER_WORKER}）")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="1リクエストの待ち時間の上限（秒）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="アクセスログを表示する")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, workers=args.workers, max_pending=args.max_pending,
+          timeout=args.timeout, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
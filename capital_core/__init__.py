@@ -0,0 +1,51 @@
+"""
+企業価値算定・シミュレーションの計算コア（NumPy のみに依存し、Streamlit・Plotly・pandas・Anthropic は読み込まない）
+"""
+
+from .captable import build_cap_table, exit_waterfall
+from .comparison import DEFAULT_ROUND_TERMS, FUNDING_SCENARIOS, compare_funding_options, compare_scenarios
+from .dcf import compute_wacc, dcf_kernel
+from .goalseek import break_even_dilution, implied_perpetual_growth, implied_wacc, solve_bracketed
+from .industry import (
+    DEFAULT_INDUSTRY,
+    IndustryTable,
+    industry_codes,
+    industry_table,
+    load_industry_table,
+)
+from .montecarlo import PERCENTILES, monte_carlo, project_paths
+from .sensitivity import sensitivity_axes, sensitivity_surface
+from .simulation import run_scenarios
+from .sweep import sweep_frontier, sweep_scenarios, top_scenarios
+from .valuation import METHODS, value_companies
+
+__all__ = [
+    "DEFAULT_INDUSTRY",
+    "DEFAULT_ROUND_TERMS",
+    "FUNDING_SCENARIOS",
+    "IndustryTable",
+    "METHODS",
+    "PERCENTILES",
+    "break_even_dilution",
+    "build_cap_table",
+    "compare_funding_options",
+    "compare_scenarios",
+    "compute_wacc",
+    "dcf_kernel",
+    "exit_waterfall",
+    "implied_perpetual_growth",
+    "implied_wacc",
+    "industry_codes",
+    "industry_table",
+    "load_industry_table",
+    "monte_carlo",
+    "project_paths",
+    "run_scenarios",
+    "sensitivity_axes",
+    "sensitivity_surface",
+    "solve_bracketed",
+    "sweep_frontier",
+    "sweep_scenarios",
+    "top_scenarios",
+    "value_companies",
+]
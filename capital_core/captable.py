@@ -0,0 +1,171 @@
+"""
+資本政策（キャップテーブル）と売却時の分配（ウォーターフォール）
+
+調達ラウンドから株式の種類（普通株・ストックオプション・優先株）ごとの株数と条件を持つ
+キャップテーブルを作り、売却額（エグジット時の企業価値）の配列に対する株主ごとの受取額を
+一括で計算する。優先株の条件（ラウンドの辞書のキー）：
+  preference     残余財産の優先分配の倍率（投資額の何倍を先に受け取るか。0なら優先分配なし）
+  participating  参加型なら、優先分配を受けたうえで残りも普通株と一緒に按分で受け取る
+  cap            参加型の受取総額の上限（投資額の倍率。None なら上限なし）
+  seniority      優先順位（大きいほど先に受け取り、同じ値どうしは按分）。省略すると後のラウンドが優先
+  option_pool    ラウンドの前に拡大するストックオプション・プール（投資後の完全希薄化ベースの%）
+非参加型は優先分配と普通株への転換の多いほうを受け取る。ストックオプションはプール全体が
+付与・行使済みとみなして普通株と同じに扱う（完全希薄化ベース）。
+"""
+
+import numpy as np
+
+FOUNDER = "創業者"
+OPTION_POOL = "ストックオプション"
+
+# 創業時の発行済株式数（比率だけが効くので値は任意）
+FOUNDER_SHARES = 1_000_000
+
+# 優先株の条件のキー（資金調達イベントにこれがあれば、持分価値をウォーターフォールで計算する）
+ROUND_TERMS = ("preference", "participating", "cap", "seniority", "option_pool")
+
+
+def _round_dilution(round_, amount):
+    if round_.get("dilution") is not None:
+        dilution = np.asarray(round_["dilution"], dtype=float) / 100
+    elif round_.get("pre_money") is not None:
+        post_money = np.asarray(round_["pre_money"], dtype=float) + amount
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dilution = np.where(post_money > 0, amount / post_money, 0.0)
+    else:
+        raise ValueError(f"{round_.get('name', 'ラウンド')}の希薄化（dilution）かプレマネー評価額（pre_money）を指定してください")
+    if np.any(dilution < 0) or np.any(dilution >= 1):
+        raise ValueError("希薄化は0%以上100%未満で指定してください")
+    return dilution
+
+
+def build_cap_table(rounds, option_pool=0.0, founder_shares=FOUNDER_SHARES, founder=FOUNDER):
+    """
+    調達ラウンドを順に反映したキャップテーブル（株式の種類ごとの辞書のリスト）を作る。
+
+    rounds は {"name", "amount", "dilution"（投資後の持分%）または "pre_money", 優先株の条件} の並び
+    （simulation.run_scenarios の株式調達イベントをそのまま渡せる）。option_pool は創業時の
+    ストックオプション・プール（%）。amount / dilution / pre_money は配列でもよく、株数も同じ形になる。
+    """
+    if not 0 <= option_pool < 100:
+        raise ValueError("ストックオプション・プールは0%以上100%未満で指定してください")
+    pool = founder_shares * option_pool / (100 - option_pool)
+    total = founder_shares + pool
+    preferred = []
+    for i, round_ in enumerate(rounds):
+        amount = np.asarray(round_.get("amount", 0.0), dtype=float)
+        dilution = _round_dilution(round_, amount)
+        target = round_.get("option_pool")
+        if target is not None and np.any(target):
+            # 投資後のプールが target% になるよう、投資の前に新株予約権を追加する
+            target = np.asarray(target, dtype=float) / 100
+            if np.any(target < 0) or np.any(dilution + target >= 1):
+                raise ValueError("希薄化とストックオプション・プールの合計は100%未満で指定してください")
+            top_up = np.maximum((target * total - pool * (1 - dilution)) / (1 - dilution - target), 0.0)
+            pool = pool + top_up
+            total = total + top_up
+        shares = total * dilution / (1 - dilution)
+        total = total + shares
+        preference = float(round_.get("preference", 0.0))
+        cap = round_.get("cap")
+        if preference < 0 or (cap is not None and cap < preference):
+            raise ValueError("優先分配の倍率は0以上、参加の上限は優先分配の倍率以上で指定してください")
+        preferred.append({
+            "name": round_.get("name", f"ラウンド{i + 1}"),
+            "kind": "preferred",
+            "shares": shares,
+            "invested": amount,
+            "preference": preference,
+            "participating": bool(round_.get("participating", False)),
+            "cap": None if cap is None else float(cap),
+            "seniority": round_.get("seniority", i + 1),
+        })
+    classes = [{"name": founder, "kind": "common", "shares": np.asarray(founder_shares, dtype=float)}]
+    if np.any(pool > 0):
+        classes.append({"name": OPTION_POOL, "kind": "common", "shares": np.asarray(pool, dtype=float)})
+    return classes + preferred
+
+
+def _class_terms(share_class):
+    """(株数, 行使価格, 優先分配額, 参加するなら1, 受取総額の上限)"""
+    shares = np.asarray(share_class["shares"], dtype=float)
+    if share_class.get("kind", "common") == "common":
+        return shares, np.asarray(share_class.get("strike", 0.0), dtype=float), 0.0, 0.0, np.inf
+    invested = np.asarray(share_class.get("invested", 0.0), dtype=float)
+    participating = bool(share_class.get("participating", False))
+    cap = share_class.get("cap")
+    return (
+        shares, 0.0,
+        invested * share_class.get("preference", 0.0),
+        1.0 if participating else 0.0,
+        invested * cap if participating and cap is not None else np.inf,
+    )
+
+
+def _payoff(terms, price):
+    """普通株1株あたりの分配額が price のときの受取額"""
+    shares, strike, preference, participation, cap = terms
+    as_common = shares * np.maximum(price - strike, 0.0)
+    return np.maximum(np.minimum(preference + participation * as_common, cap), as_common)
+
+
+def exit_waterfall(classes, exit_values):
+    """
+    売却額ごとの株主別の受取額を一括で計算する（単位は売却額と同じ）。
+
+    普通株1株あたりの分配額 p に対する総分配額 D(p) は単調な折れ線なので、折れ点
+    （行使価格・転換・参加上限）での D を求め、売却額ごとに D(p) = 売却額 となる p を
+    区間ごとの一次式で解く。優先分配の合計に届かない売却額は、優先順位の高い順に
+    （同順位は按分で）優先分配だけを支払う。負の売却額は0とみなす。
+
+    classes の株数・投資額は exit_values と同じ形に広げられる配列でもよい。戻り値は
+    "names"（株式の種類）、"payout"（種類 × exit_values の形）、"price"（普通株1株あたり）、
+    "ownership"（完全希薄化ベースの持株比率%）。
+    """
+    exit_values = np.maximum(np.asarray(exit_values, dtype=float), 0.0)
+    terms = [_class_terms(share_class) for share_class in classes]
+
+    # 折れ点（p の昇順）と、そこでの総分配額・次の折れ点までの傾き
+    points = [np.zeros(())]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for shares, strike, preference, participation, cap in terms:
+            points += [strike, preference / shares, (cap - preference) / shares, cap / shares]
+    points = np.stack(np.broadcast_arrays(*points))
+    points = np.sort(np.where(np.isfinite(points), np.maximum(points, 0.0), 0.0), axis=0)
+    ends = np.concatenate([points, points[-1:] + 1.0])
+    totals = np.stack([sum(_payoff(t, end) for t in terms) for end in ends])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = np.diff(totals, axis=0) / np.diff(ends, axis=0)
+    slopes = np.where(np.isfinite(slopes), slopes, 0.0)
+
+    if points.ndim == 1:
+        # 折れ点が共通なら線形補間（最後の折れ点より先は最後の傾きで延ばす）
+        price = np.interp(exit_values, totals, ends)
+        beyond = exit_values > totals[-1]
+        if np.any(beyond):
+            price = np.where(beyond, ends[-1] + (exit_values - totals[-1]) / slopes[-1], price)
+    else:
+        price = np.zeros(np.broadcast_shapes(exit_values.shape, points.shape[1:]))
+        for point, total, slope in zip(points, totals, slopes):
+            inside = (exit_values >= total) & (slope > 0)
+            price = np.where(inside, point + (exit_values - total) / np.where(slope > 0, slope, 1.0), price)
+
+    # 優先分配の合計に届かない売却額は、優先順位の順に優先分配だけを支払う
+    preference_total = totals[0]
+    seniority = [share_class.get("seniority", 0) for share_class in classes]
+    payouts = []
+    for i, t in enumerate(terms):
+        preference = t[2]
+        senior = sum((u[2] for u, s in zip(terms, seniority) if s > seniority[i]), 0.0)
+        tier = sum((u[2] for u, s in zip(terms, seniority) if s == seniority[i]), 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(tier > 0, np.clip((exit_values - senior) / tier, 0.0, 1.0), 0.0)
+        payouts.append(np.where(exit_values >= preference_total, _payoff(t, price), preference * share))
+
+    shares = np.stack(np.broadcast_arrays(*[t[0] for t in terms]))
+    return {
+        "names": tuple(share_class["name"] for share_class in classes),
+        "payout": np.stack(np.broadcast_arrays(*payouts)),
+        "price": price,
+        "ownership": shares / shares.sum(axis=0) * 100,
+    }
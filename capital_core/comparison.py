@@ -0,0 +1,114 @@
+"""
+シナリオ比較（タブ4）
+
+調達方法ごとの成長率・希薄化から、最終年の企業価値と経営者の持分価値を
+シナリオ数分（必要なら企業数分も）まとめて計算する。
+"""
+
+import numpy as np
+
+from .captable import build_cap_table, exit_waterfall
+
+# タブ4の標準シナリオ（成長率は基本ケースに対する倍率）
+FUNDING_SCENARIOS = (
+    {"name": "VC調達", "dilution": 20, "growth_multiplier": 1.0, "funded": True},
+    {"name": "銀行融資", "dilution": 0, "growth_multiplier": 0.8, "funded": True},
+    {"name": "自己資金", "dilution": 0, "growth_multiplier": 0.5, "funded": False},
+)
+
+# VC調達の優先株の条件の既定値（タブ3の資本政策の既定値と同じ1倍・非参加型。cap は None で上限なし）
+DEFAULT_ROUND_TERMS = {"preference": 1.0, "participating": False, "cap": None, "option_pool": 0.0}
+
+
+def compare_scenarios(revenue, profit, growth, dilution, pe_multiple, funding=None, terms=None):
+    """
+    シナリオを一括比較する（単位：百万円・%）。
+
+    growth は (..., S, T) の年別成長率、dilution は (S,) の希薄化率。
+    revenue / profit / pe_multiple はスカラー、または先頭の次元に合わせた配列
+    （例：N社 × S シナリオなら shape (N, 1)）。
+    利益率は現在の水準のまま、企業価値 = 最終年利益 × PER で評価する。
+    terms（優先株の条件の辞書、captable.ROUND_TERMS）を渡すと、希薄化のあるシナリオは
+    funding（(S,) の調達額）を優先株の投資額として、持分価値を企業価値で売却したときの
+    ウォーターフォールの創業者の受取額で、持株比率を完全希薄化ベースで評価する。
+    """
+    growth = np.atleast_2d(np.asarray(growth, dtype=float))
+    dilution = np.asarray(dilution, dtype=float)
+    revenue = np.asarray(revenue, dtype=float)
+    profit = np.asarray(profit, dtype=float)
+
+    final_revenue = revenue * np.prod(1 + growth / 100, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(revenue > 0, profit / np.where(revenue > 0, revenue, 1.0), 0.0)
+    final_profit = final_revenue * margin
+    company_value = final_profit * pe_multiple
+    if terms is None:
+        equity = np.broadcast_to(100 - dilution, company_value.shape)
+        owner_value = company_value * (equity / 100)
+    else:
+        # 融資・自己資金のシナリオ（希薄化0）は優先株もプールも発行しない
+        issued = dilution > 0
+        round_ = {**terms, "amount": np.where(issued, np.asarray(funding, dtype=float), 0.0), "dilution": dilution}
+        if terms.get("option_pool") is not None:
+            round_["option_pool"] = np.where(issued, terms["option_pool"], 0.0)
+        waterfall = exit_waterfall(build_cap_table([round_]), company_value)
+        owner_value = waterfall["payout"][0]
+        equity = np.broadcast_to(waterfall["ownership"][0], company_value.shape)
+    return {
+        "final_revenue": final_revenue,
+        "final_profit": final_profit,
+        "company_value": company_value,
+        "equity": equity,
+        "owner_value": owner_value,
+    }
+
+
+def compare_funding_options(revenue, profit, year_growth, pe_multiple, scenarios=FUNDING_SCENARIOS,
+                            funding=None, terms=None):
+    """
+    N社それぞれについて標準シナリオ（VC調達・銀行融資・自己資金）を比較する。
+
+    year_growth は (N, T) の基本ケースの年別成長率。戻り値の各配列は (N, S)。
+    terms（優先株の条件の辞書、captable.ROUND_TERMS）を渡すと、タブ4と同じく funding（(N,) の
+    調達額）を優先株の投資額として、希薄化のあるシナリオの持分価値をウォーターフォールで評価する。
+    terms の値はスカラーか (N,) の配列（cap の None / NaN は上限なし）で、条件が同じ企業ごとに
+    まとめて計算する。参加の上限が優先分配の倍率より小さいときは優先分配の倍率にそろえる（タブ3と同じ）。
+    """
+    year_growth = np.atleast_2d(np.asarray(year_growth, dtype=float))
+    n = len(year_growth)
+    multipliers = np.array([s["growth_multiplier"] for s in scenarios], dtype=float)
+    dilution = np.array([s["dilution"] for s in scenarios], dtype=float)
+    growth = year_growth[:, None, :] * multipliers[None, :, None]  # (N, S, T)
+    revenue, profit, pe_multiple = (
+        np.broadcast_to(np.asarray(a, dtype=float), (n,))[:, None] for a in (revenue, profit, pe_multiple)
+    )
+    if terms is None:
+        return compare_scenarios(revenue, profit, growth, dilution, pe_multiple)
+
+    funded = np.array([s["funded"] for s in scenarios], dtype=float)
+    funding = np.broadcast_to(np.asarray(0.0 if funding is None else funding, dtype=float), (n,))
+    funding = funding[:, None] * funded  # (N, S)
+    keys = list(terms)
+    columns = np.column_stack([np.broadcast_to(np.asarray(terms[key], dtype=float), (n,)) for key in keys])
+    # 上限なし（NaN）どうしも同じ条件としてまとめる
+    columns = np.where(np.isnan(columns), -1.0, columns)
+    unique, inverse = np.unique(columns, axis=0, return_inverse=True)
+
+    results = {}
+    for g, row in enumerate(unique):
+        index = np.flatnonzero(inverse.ravel() == g)
+        group_terms = dict(zip(keys, row.tolist()))
+        if "participating" in group_terms:
+            group_terms["participating"] = bool(group_terms["participating"])
+        if "cap" in group_terms:
+            cap = group_terms["cap"]
+            group_terms["cap"] = None if cap < 0 else max(cap, group_terms.get("preference", 0.0))
+        compared = compare_scenarios(
+            revenue[index], profit[index], growth[index], dilution, pe_multiple[index],
+            funding=funding[index], terms=group_terms,
+        )
+        for key, values in compared.items():
+            if key not in results:
+                results[key] = np.empty((n, len(scenarios)))
+            results[key][index] = values
+    return results
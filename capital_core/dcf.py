@@ -0,0 +1,131 @@
+"""
+DCF法カーネル（企業 × 年 の行列を一括計算）
+
+予測売上・FCF・割引係数・継続価値・株式価値を、年次ループを使わず
+ブロードキャストで計算する。予測期間は5〜30年で指定できる。
+"""
+
+import numpy as np
+
+RISK_FREE_RATE = 0.5  # 日本国債利回り（%）
+MARKET_RISK_PREMIUM = 6.0  # 株式リスクプレミアム（%）
+COST_OF_DEBT = 2.0  # 負債コスト（%）
+TAX_RATE = 30  # 法人税率（%）
+
+DCF_YEARS = 5
+MIN_DCF_YEARS = 5
+MAX_DCF_YEARS = 30
+
+TERMINAL_METHODS = ("auto", "gordon", "exit")
+
+# 利益率の改善（年1%ポイント）の上限（%ポイント。5年目までで打ち止め）
+MAX_MARGIN_IMPROVEMENT = 5.0
+
+
+def compute_wacc(total_assets, total_liabilities, beta):
+    """CAPMと簿価ベースの資本構成からWACC（%）を計算する。"""
+    total_assets = np.asarray(total_assets, dtype=float)
+    total_liabilities = np.asarray(total_liabilities, dtype=float)
+    beta = np.asarray(beta, dtype=float)
+
+    cost_of_equity = RISK_FREE_RATE + beta * MARKET_RISK_PREMIUM
+    has_assets = total_assets > 0
+    # 総資産がない場合は負債比率30%とみなす
+    debt_ratio = np.where(has_assets, total_liabilities / np.where(has_assets, total_assets, 1.0), 0.3)
+    equity_ratio = 1 - debt_ratio
+    wacc = cost_of_equity * equity_ratio + COST_OF_DEBT * (1 - TAX_RATE / 100) * debt_ratio
+    return {
+        "beta": beta,
+        "cost_of_equity": cost_of_equity,
+        "debt_ratio": debt_ratio,
+        "equity_ratio": equity_ratio,
+        "wacc": wacc,
+    }
+
+
+def dcf_kernel(revenue, profit, depreciation, growth_rate, wacc, net_debt,
+               years=DCF_YEARS, perpetual_growth=None, exit_multiple=5.0,
+               terminal="auto"):
+    """
+    N社 × years年 のFCF予測と株式価値を一括計算する（単位：百万円・%）。
+
+    terminal:
+        "auto"   -- WACC > 永続成長率ならゴードン成長モデル、そうでなければExit倍率法
+        "gordon" -- ゴードン成長モデルのみ（WACC ≤ 永続成長率は NaN）
+        "exit"   -- 最終年FCF × exit_multiple
+
+    perpetual_growth を省略すると min(2.5%, 成長率 × 30%) を使う。
+    行列（revenue/fcf/discount_factor/pv_fcf）は (N, years)、それ以外は (N,)。
+    """
+    years = int(years)
+    if not MIN_DCF_YEARS <= years <= MAX_DCF_YEARS:
+        raise ValueError(f"予測期間は{MIN_DCF_YEARS}〜{MAX_DCF_YEARS}年で指定してください: {years}")
+    if terminal not in TERMINAL_METHODS:
+        raise ValueError(f"terminal は {TERMINAL_METHODS} のいずれかです: {terminal!r}")
+
+    revenue, profit, depreciation, growth_rate, wacc, net_debt, exit_multiple = (
+        np.atleast_1d(a) for a in np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in
+              (revenue, profit, depreciation, growth_rate, wacc, net_debt, exit_multiple))
+        )
+    )
+    if perpetual_growth is None:
+        perpetual_growth = np.minimum(2.5, growth_rate * 0.3)  # 成長率の30%、最大2.5%
+    else:
+        perpetual_growth = np.broadcast_to(np.asarray(perpetual_growth, dtype=float), revenue.shape)
+
+    t = np.arange(1, years + 1, dtype=float)  # (T,)
+    g = growth_rate[:, None]  # (N, 1)
+
+    # 成長率の逓減（毎年10%ずつ低下）。売上は年ごとの成長率で複利計算する
+    year_growth = g * 0.9 ** (t - 1)  # (N, T)
+    growth_factor = np.cumprod(1 + year_growth / 100, axis=1)
+
+    # 利益率は年1%ポイント改善（MAX_MARGIN_IMPROVEMENT まで）
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.where(revenue > 0, profit / np.where(revenue > 0, revenue, 1.0), 0.1)
+    improvement = np.minimum(t, MAX_MARGIN_IMPROVEMENT) / 100
+    proj_revenue = revenue[:, None] * growth_factor
+    nopat = proj_revenue * (margin[:, None] + improvement) * (1 - TAX_RATE / 100)
+
+    # FCF = NOPAT + 減価償却費 - 運転資本増加 - 設備投資
+    proj_depreciation = depreciation[:, None] * growth_factor
+    wc_change = proj_revenue * 0.02 * (year_growth / 100)
+    capex = proj_depreciation * 1.2
+    fcf = nopat + proj_depreciation - wc_change - capex
+
+    discount_factor = (1 + wacc[:, None] / 100) ** -t
+    pv_fcf = fcf * discount_factor
+    fcf_pv = pv_fcf.sum(axis=1)
+
+    # ===== ターミナルバリュー =====
+    final_fcf = fcf[:, -1]
+    spread = wacc - perpetual_growth
+    gordon_ok = spread > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gordon_tv = np.where(gordon_ok, final_fcf * (1 + perpetual_growth / 100) / (spread / 100), np.nan)
+    exit_tv = final_fcf * exit_multiple
+    if terminal == "gordon":
+        terminal_value = gordon_tv
+    elif terminal == "exit":
+        terminal_value = exit_tv
+    else:
+        terminal_value = np.where(gordon_ok, gordon_tv, exit_tv)
+    terminal_pv = terminal_value * discount_factor[:, -1]
+
+    enterprise_value = fcf_pv + terminal_pv
+    return {
+        "years": t,
+        "revenue": proj_revenue,
+        "fcf": fcf,
+        "discount_factor": discount_factor,
+        "pv_fcf": pv_fcf,
+        "fcf_pv": fcf_pv,
+        "final_year_fcf": final_fcf,
+        "perpetual_growth": perpetual_growth,
+        "terminal_value": terminal_value,
+        "terminal_pv": terminal_pv,
+        "enterprise_value": enterprise_value,
+        "net_debt": net_debt,
+        "equity_value": enterprise_value - net_debt,
+    }
@@ -0,0 +1,237 @@
+"""
+逆算（ゴールシーク）
+
+順方向の計算（入力 → 企業価値）を逆にたどり、目標の価格を正当化する
+WACC・永続成長率や、VC調達が自己資金と並ぶ希薄化率を求める。
+多数の目標値をまとめて解けるよう、根の探索は要素ごとに独立した
+区間付きニュートン法（区間を外れる・収束が遅いときは二分法）で行う。
+"""
+
+import numpy as np
+
+from .captable import build_cap_table, exit_waterfall
+
+MAX_ITERATIONS = 100
+
+# implied_wacc の探索区間の上限（%）
+MAX_WACC = 100.0
+
+
+def solve_bracketed(func, target, lower, upper, fprime=None, args=(), xtol=1e-10, ftol=1e-9,
+                    max_iter=MAX_ITERATIONS):
+    """
+    func(x, *args) = target を lower〜upper の区間で要素ごとに解く。
+
+    target / lower / upper は互いにブロードキャストできる配列。args は要素ごとの
+    追加の引数で、先頭の次元がその形にそろった配列（末尾に次元を持ってよい）。
+    反復のたびに未収束の要素だけを1次元に取り出して func(x, *args) を呼ぶので、
+    func は x と args の先頭の次元が同じ長さの配列を受け取り、x と同じ形の配列を返すこと。
+    fprime(x, *args)（導関数）を省略すると差分近似を使う（区間の外は評価しないよう、上端の近くでは後退差分）。
+    両端で func - target の符号が変わらない要素は解かず NaN を返す。
+
+    戻り値は次の配列を持つ辞書：
+      root        解（区間内に解がなければ NaN）
+      converged   収束したか
+      bracketed   区間の両端で符号が変わっていたか
+      iterations  反復回数
+      bisections  そのうち二分法に切り替えた回数
+      residual    func(root) - target
+    """
+    target, lower, upper = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (target, lower, upper)))
+    shape = target.shape
+    target, lower, upper = (a.reshape(-1) for a in (target, lower, upper))
+    args = [np.asarray(a).reshape((target.size,) + np.shape(a)[len(shape):]) for a in args]
+
+    def residual_at(x, index):
+        with np.errstate(all="ignore"):
+            return np.asarray(func(x, *(a[index] for a in args)), dtype=float) - target[index]
+
+    def slope_at(x, fx, index):
+        with np.errstate(all="ignore"):
+            if fprime is not None:
+                return np.asarray(fprime(x, *(a[index] for a in args)), dtype=float)
+            h = 1e-7 * np.maximum(1.0, np.abs(x))
+            h = np.where(x + h <= bound_upper[index], h, -h)
+            probe = np.clip(x + h, bound_lower[index], bound_upper[index])
+            return (residual_at(probe, index) - fx) / (probe - x)
+
+    bound_lower, bound_upper = np.minimum(lower, upper), np.maximum(lower, upper)
+    everything = np.arange(target.size)
+    f_lower = residual_at(lower, everything)
+    f_upper = residual_at(upper, everything)
+    bracketed = np.isfinite(f_lower) & np.isfinite(f_upper) & (np.sign(f_lower) * np.sign(f_upper) <= 0)
+    scale = ftol * np.maximum(1.0, np.abs(target))
+    x = np.full(target.size, np.nan)
+    fx = np.full(target.size, np.nan)
+    converged = np.zeros(target.size, dtype=bool)
+    iterations = np.zeros(target.size, dtype=int)
+    bisections = np.zeros(target.size, dtype=int)
+    # 端点がそのまま解のもの
+    for end, f_end in ((upper, f_upper), (lower, f_lower)):
+        hit = bracketed & (np.abs(f_end) <= scale)
+        x[hit] = end[hit]
+        fx[hit] = f_end[hit]
+        converged |= hit
+
+    # 未収束の要素だけを取り出し、区間を f(lo) < 0 < f(hi) の向きにそろえる
+    index = np.flatnonzero(bracketed & ~converged)
+    flip = f_lower[index] > 0
+    lo = np.where(flip, upper[index], lower[index])
+    hi = np.where(flip, lower[index], upper[index])
+    xi = (lo + hi) / 2
+    step = np.abs(hi - lo)
+    fi = residual_at(xi, index)
+
+    for _ in range(max_iter):
+        done = (np.abs(fi) <= scale[index]) | (np.abs(hi - lo) <= xtol * (1 + np.abs(xi)))
+        if done.any():
+            finished = index[done]
+            x[finished] = xi[done]
+            fx[finished] = fi[done]
+            converged[finished] = True
+            keep = ~done
+            index, xi, fi, lo, hi, step = (a[keep] for a in (index, xi, fi, lo, hi, step))
+        if not index.size:
+            break
+
+        # 符号が変わる区間を保つように端点を更新する
+        below = fi < 0
+        lo = np.where(below, xi, lo)
+        hi = np.where(below, hi, xi)
+
+        # ニュートン法の1歩。区間を外れる、または前回の歩幅の半分より縮まらなければ二分法
+        with np.errstate(all="ignore"):
+            newton = xi - fi / slope_at(xi, fi, index)
+        inside = np.isfinite(newton) & ((newton - lo) * (newton - hi) < 0)
+        bisect = ~(inside & (2 * np.abs(newton - xi) <= step))
+        new_x = np.where(bisect, (lo + hi) / 2, newton)
+        step = np.abs(new_x - xi)
+        xi = new_x
+        fi = residual_at(xi, index)
+        iterations[index] += 1
+        bisections[index] += bisect
+
+    # 反復の上限に達した要素は最後の値を返す
+    x[index] = xi
+    fx[index] = fi
+    return {
+        "root": np.where(bracketed, x, np.nan).reshape(shape),
+        "converged": converged.reshape(shape),
+        "bracketed": bracketed.reshape(shape),
+        "iterations": iterations.reshape(shape),
+        "bisections": bisections.reshape(shape),
+        "residual": np.where(bracketed, fx, np.nan).reshape(shape),
+    }
+
+
+def dcf_equity_value(wacc, fcf, net_debt, perpetual_growth):
+    """
+    予測FCFを固定し、WACC と永続成長率から株式価値を計算する（単位：百万円・%）。
+
+    fcf は (..., T) の予測FCF（dcf_kernel の "fcf"）、それ以外は先頭の次元に
+    ブロードキャストできる配列。継続価値はゴードン成長モデルで、WACC ≤ 永続成長率は NaN。
+    WACC を変えると予測期間FCFの現在価値も割り引き直す点が感度分析と異なる。
+    """
+    fcf = np.asarray(fcf, dtype=float)
+    w = np.asarray(wacc, dtype=float)[..., None] / 100
+    g = np.asarray(perpetual_growth, dtype=float)[..., None] / 100
+    t = np.arange(1, fcf.shape[-1] + 1, dtype=float)
+    discount = (1 + w) ** -t
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terminal = np.where(w > g, fcf[..., -1:] * (1 + g) / (w - g), np.nan)
+    value = (fcf * discount).sum(axis=-1) + (terminal * discount[..., -1:])[..., 0]
+    return value - np.asarray(net_debt, dtype=float)
+
+
+def _dcf_equity_slope(fcf, wacc, perpetual_growth):
+    """dcf_equity_value の WACC（%）についての導関数。"""
+    fcf = np.asarray(fcf, dtype=float)
+    w = np.asarray(wacc, dtype=float)[..., None] / 100
+    g = np.asarray(perpetual_growth, dtype=float)[..., None] / 100
+    years = fcf.shape[-1]
+    t = np.arange(1, years + 1, dtype=float)
+    final = fcf[..., -1:] * (1 + g)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pv_slope = -(t * fcf * (1 + w) ** -(t + 1)).sum(axis=-1, keepdims=True)
+        tv_slope = -final * (1 + w) ** -years * (1 / (w - g) ** 2 + years / ((w - g) * (1 + w)))
+    return (pv_slope + tv_slope)[..., 0] / 100
+
+
+def implied_wacc(fcf, net_debt, perpetual_growth, target, upper=MAX_WACC, **options):
+    """
+    株式価値が target になる WACC（%）を逆算する。
+
+    fcf / net_debt / perpetual_growth は dcf_kernel の結果と同じもので、target は
+    先頭の次元にブロードキャストできる配列（例：1社の複数の目標価格なら fcf (T,)、target (K,)）。
+    探索区間は 永続成長率 〜 upper。戻り値は solve_bracketed と同じ辞書。
+    """
+    fcf = np.asarray(fcf, dtype=float)
+    target = np.asarray(target, dtype=float)
+    shape = np.broadcast_shapes(fcf.shape[:-1], np.shape(net_debt), np.shape(perpetual_growth), target.shape)
+    fcf = np.broadcast_to(fcf, shape + fcf.shape[-1:])
+    net_debt = np.broadcast_to(np.asarray(net_debt, dtype=float), shape)
+    perpetual_growth = np.broadcast_to(np.asarray(perpetual_growth, dtype=float), shape)
+    lower = perpetual_growth + 1e-6
+    return solve_bracketed(
+        dcf_equity_value, np.broadcast_to(target, shape), lower, np.maximum(upper, lower),
+        fprime=lambda w, fcf, net_debt, g: _dcf_equity_slope(fcf, w, g),
+        args=(fcf, net_debt, perpetual_growth),
+        **options,
+    )
+
+
+def implied_perpetual_growth(fcf, net_debt, wacc, target):
+    """
+    株式価値が target になる永続成長率（%）を逆算する。
+
+    ゴードン成長モデルは永続成長率について解けるため、反復せずに求める。
+    必要な継続価値が0以下になる場合や、最終年FCFが0以下の場合は NaN。
+    """
+    fcf = np.asarray(fcf, dtype=float)
+    w = np.asarray(wacc, dtype=float) / 100
+    t = np.arange(1, fcf.shape[-1] + 1, dtype=float)
+    discount = (1 + w[..., None]) ** -t
+    fcf_pv = (fcf * discount).sum(axis=-1)
+    final_fcf = fcf[..., -1]
+    # 必要な継続価値（予測期間末時点）：TV = F(1+g)/(w-g) を g について解く
+    terminal_value = (np.asarray(target, dtype=float) + np.asarray(net_debt, dtype=float) - fcf_pv) / discount[..., -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g = (terminal_value * w - final_fcf) / (terminal_value + final_fcf)
+    valid = (final_fcf > 0) & (terminal_value > 0)
+    return np.where(valid, g * 100, np.nan)
+
+
+def break_even_dilution(company_value, reference_owner_value, funding=None, terms=None):
+    """
+    持分価値が reference_owner_value と等しくなる希薄化率（%）。
+
+    terms（優先株の条件の辞書、captable.ROUND_TERMS）を省略すると持分価値は企業価値 × 残る持株で、
+    企業価値は希薄化率によらないため、1 - 基準の持分価値 / 企業価値 で求まる。
+    terms を渡すと、funding を優先株の投資額として企業価値で売却したときのウォーターフォールの
+    創業者の受取額を持分価値とし、希薄化率について逆算する（受取額は希薄化率について単調減少）。
+    どちらも、希薄化なしでも基準に届かない場合と企業価値が0以下の場合は NaN、
+    どれだけ希薄化しても基準を下回らない場合は100。
+    """
+    company_value = np.asarray(company_value, dtype=float)
+    reference_owner_value = np.asarray(reference_owner_value, dtype=float)
+    if terms is None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dilution = 100 * (1 - reference_owner_value / company_value)
+        return np.where((company_value > 0) & (dilution >= 0), np.minimum(dilution, 100.0), np.nan)
+
+    def owner_value(dilution, value, amount):
+        round_ = {**terms, "amount": amount, "dilution": dilution}
+        return exit_waterfall(build_cap_table([round_]), value)["payout"][0]
+
+    company_value, reference_owner_value, funding = np.broadcast_arrays(
+        company_value, reference_owner_value, np.asarray(0.0 if funding is None else funding, dtype=float)
+    )
+    # 希薄化とストックオプション・プールの合計は100%未満
+    upper = (100 - float(terms.get("option_pool") or 0.0)) * (1 - 1e-9)
+    at_zero = owner_value(np.zeros(company_value.shape), company_value, funding)
+    at_upper = owner_value(np.full(company_value.shape, upper), company_value, funding)
+    result = solve_bracketed(
+        owner_value, reference_owner_value, 0.0, upper, args=(company_value, funding)
+    )
+    dilution = np.where(at_upper >= reference_owner_value, 100.0, result["root"])
+    return np.where((company_value > 0) & (at_zero >= reference_owner_value), dilution, np.nan)
@@ -0,0 +1,192 @@
+"""
+業種別パラメータ（標準倍率・ベータ）
+
+パラメータは版（version）付きのデータファイル（JSON または CSV）で管理し、一度だけ読み込んで
+業種コード順の配列のテーブルにする。業種名は整数コードに変換し、配列のインデックス参照で
+まとめて引く。ファイルの更新時刻が変わったら次の参照時に読み込み直すので、倍率の月次更新に
+サーバーの再起動はいらない。
+
+  CAPITAL_ADVISOR_INDUSTRY_PARAMETERS  データファイルのパス（既定は同梱の data/industry_parameters.json）
+
+JSON は {"version": ..., "default": 業種名, "industries": [{"name": ..., "per": ..., ...}, ...]}、
+CSV は name, per, pbr, ebitda, year_buy, beta の列（version 列があればその値を版とする）。
+"""
+
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "industry_parameters.json")
+PARAMETERS_PATH = os.environ.get("CAPITAL_ADVISOR_INDUSTRY_PARAMETERS", DEFAULT_PATH)
+
+# 未知の業種に使う業種（データファイルに default がなければこれ）
+DEFAULT_INDUSTRY = "その他"
+
+# 各業種のパラメータ（列名）
+PARAMETERS = ("per", "pbr", "ebitda", "year_buy", "beta")
+
+# 業種名からコードへの変換で、業種ごとの一致判定を使う業種数の上限
+COMPARE_LIMIT = 32
+
+# ファイルの更新を確かめる間隔（秒）。参照のたびに stat しないようにする
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+class IndustryTable:
+    """
+    業種別パラメータのテーブル（読み取り専用）。
+
+    names は業種名（コード順）、per / pbr / ebitda / year_buy / beta はコード順の配列。
+    cache_key は内容のハッシュで、メモ化のキーに使う（同じ内容なら版が変わらなくても同じ）。
+    """
+
+    def __init__(self, names, values, version=None, default=DEFAULT_INDUSTRY, source=None):
+        if len(set(names)) != len(names):
+            raise ValueError("業種名が重複しています")
+        if default not in names:
+            raise ValueError(f"既定の業種「{default}」がありません")
+        self.names = tuple(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.default = default
+        self.default_code = self.index[default]
+        for key in PARAMETERS:
+            column = np.asarray(values[key], dtype=float)
+            if column.shape != (len(self.names),) or not np.all(np.isfinite(column)) or np.any(column < 0):
+                raise ValueError(f"{key} は業種ごとに0以上の数値で指定してください")
+            column.flags.writeable = False
+            setattr(self, key, column)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps([self.names, default]).encode("utf-8"))
+        for key in PARAMETERS:
+            digest.update(getattr(self, key).tobytes())
+        self.cache_key = ("industry_table", digest.hexdigest())
+        self.version = version or digest.hexdigest()[:8]
+        self.source = source
+
+    def __len__(self):
+        return len(self.names)
+
+    def codes(self, industry, size=None):
+        """
+        業種名（文字列・配列）を整数コード配列に変換する。未知の業種は既定の業種扱い。
+        整数のコードはそのまま使い、範囲外（負の値・業種数以上）は既定の業種にする。
+        """
+        if isinstance(industry, str):
+            code = self.index.get(industry, self.default_code)
+            return np.full(1 if size is None else size, code, dtype=np.intp)
+
+        arr = np.asarray(industry)
+        if np.issubdtype(arr.dtype, np.integer):
+            codes = arr.astype(np.intp, copy=False).reshape(-1)
+            known = (codes >= 0) & (codes < len(self.names))
+            if not known.all():
+                codes = np.where(known, codes, self.default_code)
+        else:
+            codes = self._name_codes(arr.reshape(-1))
+        if size is not None and codes.size == 1:
+            codes = np.full(size, codes[0], dtype=np.intp)
+        return codes
+
+    def _name_codes(self, arr):
+        if len(self.names) <= COMPARE_LIMIT:
+            # 業種が少なければ、業種ごとの一致判定で埋めるほうが並べ替え（np.unique）より速い
+            codes = np.full(arr.shape[0], self.default_code, dtype=np.intp)
+            for code, name in enumerate(self.names):
+                if code != self.default_code:
+                    codes[arr == name] = code
+        else:
+            # ユニーク値だけ辞書引きして展開する
+            uniques, inverse = np.unique(arr.astype(str), return_inverse=True)
+            lookup = np.array([self.index.get(u, self.default_code) for u in uniques], dtype=np.intp)
+            codes = lookup[inverse.reshape(-1)]
+        return codes
+
+    def row(self, industry):
+        """1業種のパラメータ（辞書）。未知の業種は既定の業種の値。"""
+        code = self.index.get(industry, self.default_code)
+        return {key: float(getattr(self, key)[code]) for key in PARAMETERS}
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    rows = data["industries"]
+    return rows, data.get("version"), data.get("default", DEFAULT_INDUSTRY)
+
+
+def _read_csv(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    versions = {row.get("version") for row in rows} - {None, ""}
+    if len(versions) > 1:
+        raise ValueError("version 列の値がそろっていません")
+    return rows, versions.pop() if versions else None, DEFAULT_INDUSTRY
+
+
+def load_industry_table(path=PARAMETERS_PATH):
+    """データファイル（.json / .csv）を読んで IndustryTable を作る。形式の誤りは ValueError。"""
+    reader = _read_csv if path.lower().endswith(".csv") else _read_json
+    try:
+        rows, version, default = reader(path)
+        names = [str(row["name"]) for row in rows]
+        values = {key: [float(row[key]) for row in rows] for key in PARAMETERS}
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"業種別パラメータを読めません（{path}）: {e}") from e
+    return IndustryTable(names, values, version=version and str(version), default=default, source=path)
+
+
+class _Reloader:
+    """データファイルの更新時刻を見て、変わっていれば読み込み直す（プロセス内で共有）。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._table = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self._table is not None and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return self._table
+        with self._lock:
+            if self._table is not None and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+                return self._table
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if self._table is None or mtime != self._mtime:
+                    # 読み込めたときだけ更新時刻を覚える（失敗したら次の参照で読み直す）
+                    self._table = load_industry_table(self.path)
+                    self._mtime = mtime
+            except (OSError, ValueError) as e:
+                if self._table is None:
+                    raise
+                # 書きかけ・誤りのあるファイルでは止めず、直前のテーブルを使い続ける
+                warnings.warn(f"{e}（直前の業種別パラメータを使い続けます）", RuntimeWarning)
+            self._checked_at = now
+            return self._table
+
+
+_reloaders = {}
+_reloaders_lock = threading.Lock()
+
+
+def industry_table(path=None):
+    """現在の業種別パラメータのテーブル（ファイルが更新されていれば読み込み直したもの）。"""
+    path = path or PARAMETERS_PATH
+    reloader = _reloaders.get(path)
+    if reloader is None:
+        with _reloaders_lock:
+            reloader = _reloaders.setdefault(path, _Reloader(path))
+    return reloader.get()
+
+
+def industry_codes(industry, size=None):
+    """業種名（文字列・配列）を現在のテーブルの整数コード配列に変換する。未知の業種は既定の業種扱い。"""
+    return industry_table().codes(industry, size=size)
@@ -0,0 +1,159 @@
+"""
+計算結果のメモ化（LRU + TTL）
+
+入力を正規化したタプルをキーに、計算結果をプロセス内で共有する。
+Streamlit は操作のたびにスクリプト全体を再実行するが、モジュールは
+セッション間で共有されるため、同じ入力の再計算をここで省ける。
+
+キャッシュは名前で登録されるので、再実行のたびにデコレートし直しても
+同じキャッシュが使われる。戻り値の NumPy 配列は書き込み不可にしてから
+共有するので、あるセッションが結果を書き換えて他に影響することはない。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+
+_MISSING = object()
+
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def normalize(value):
+    """キャッシュキー用に値を正規化する（15 と 15.0 は同じキー）。"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (bool, int, float, np.number)):
+        return round(float(value), 10)
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value.astype(str) if value.dtype.kind == "O" else value)
+        digest = hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest()
+        return ("ndarray", data.shape, data.dtype.str, digest)
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if hasattr(value, "cache_key"):
+        # 業種別パラメータのテーブルなど、自身のキーを持つオブジェクト
+        return value.cache_key
+    raise TypeError(f"キャッシュキーに使えない型です: {type(value).__name__}")
+
+
+def make_key(args, kwargs):
+    return normalize(args), normalize(kwargs)
+
+
+def _freeze(value):
+    """共有する結果の配列を読み取り専用にする。"""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for v in value.values():
+            _freeze(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _freeze(v)
+    return value
+
+
+class MemoCache:
+    """スレッドセーフな LRU + TTL キャッシュ。ヒット・ミス数を数える。"""
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, stored_at = entry
+                if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                    del self._data[key]
+                    self.expirations += 1
+                else:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return _MISSING
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is _MISSING:
+            # 計算はロックの外で行う（同時ミス時に重複計算はあり得るが結果は同じ）
+            value = _freeze(compute())
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def get_cache(name, maxsize=128, ttl=None):
+    """名前付きキャッシュを取得する（なければ作成）。"""
+    with _REGISTRY_LOCK:
+        cache = _REGISTRY.get(name)
+        if cache is None:
+            cache = _REGISTRY[name] = MemoCache(maxsize=maxsize, ttl=ttl)
+        return cache
+
+
+def memoize(maxsize=128, ttl=None, name=None):
+    """
+    関数の結果を入力キーでメモ化するデコレータ。
+
+    name を省略すると関数の完全修飾名で登録する。ttl は秒。
+    """
+    def decorator(func):
+        cache = get_cache(name or f"{func.__module__}.{func.__qualname__}", maxsize, ttl)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_compute(make_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def cache_stats():
+    """登録済みキャッシュの統計を名前ごとに返す。"""
+    with _REGISTRY_LOCK:
+        caches = list(_REGISTRY.items())
+    return {name: cache.stats() for name, cache in caches}
@@ -0,0 +1,145 @@
+"""
+シミュレーターのモンテカルロ版
+
+成長率・利益率改善・PERを相関付きで同時にサンプリングし、全パスを
+(パス数 × 年数) の配列として一括で推移計算する。結果は年ごとのパーセンタイル帯で返す。
+"""
+
+import numpy as np
+
+from .simulation import run_scenarios
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# 成長率・利益率改善・PER の既定の相関（好調な年は利益率もPERも上がりやすい）
+DEFAULT_CORRELATION = (
+    (1.0, 0.4, 0.5),
+    (0.4, 1.0, 0.3),
+    (0.5, 0.3, 1.0),
+)
+
+
+def correlation_matrix(strength=1.0):
+    """既定の相関行列を強さ 0〜1 で縮小する（0で無相関）。"""
+    base = np.asarray(DEFAULT_CORRELATION, dtype=float)
+    return np.eye(3) + strength * (base - np.eye(3))
+
+
+def project_paths(revenue, profit, growth, margin_improvement, pe_multiple,
+                  equity, interest_payment=0.0):
+    """
+    パスごとの年次推移を計算する（単位：百万円・%）。
+
+    growth は (P, T) の年別成長率、margin_improvement と pe_multiple は (P,)、
+    equity は (T+1,) の各年の経営者持株比率。戻り値の各配列は (P, T+1) で、
+    列0が現在、列kがk年後。
+    """
+    growth = np.atleast_2d(np.asarray(growth, dtype=float))
+    paths, horizon = growth.shape
+    margin_improvement = np.broadcast_to(np.asarray(margin_improvement, dtype=float), (paths,))
+    pe_multiple = np.broadcast_to(np.asarray(pe_multiple, dtype=float), (paths,))
+    equity = np.broadcast_to(np.asarray(equity, dtype=float), (horizon + 1,))
+
+    current_margin = profit / revenue if revenue > 0 else 0
+    t = np.arange(1, horizon + 1, dtype=float)
+
+    out_revenue = np.empty((paths, horizon + 1))
+    out_revenue[:, 0] = revenue
+    np.cumprod(1 + growth / 100, axis=1, out=out_revenue[:, 1:])
+    out_revenue[:, 1:] *= revenue
+
+    out_profit = np.empty_like(out_revenue)
+    out_profit[:, 0] = profit
+    out_profit[:, 1:] = out_revenue[:, 1:] * (current_margin + margin_improvement[:, None] * t / 100)
+    # 銀行融資の場合は利息を引く
+    out_profit[:, 1:] -= interest_payment
+
+    # 企業価値 = 利益 × PER、経営者の持分価値 = 企業価値 × 持株比率
+    company_value = out_profit * pe_multiple[:, None]
+    owner_value = company_value * (equity / 100)
+    return {
+        "revenue": out_revenue,
+        "profit": out_profit,
+        "company_value": company_value,
+        "owner_value": owner_value,
+    }
+
+
+def sample_drivers(growth, margin_improvement, pe_multiple, n_paths, growth_vol=10.0,
+                   margin_vol=1.0, pe_vol=3.0, correlation=DEFAULT_CORRELATION,
+                   growth_persistence=0.5, seed=0):
+    """
+    成長率（年別）・利益率改善・PER を相関付き正規分布からサンプリングする。
+
+    年別の成長率ショックは、パス共通成分（相関の対象）と年ごとの独立成分を
+    growth_persistence の比率で混ぜる。成長率は -95%、PERは1倍で下限を切る。
+    """
+    growth = np.asarray(growth, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    chol = np.linalg.cholesky(np.asarray(correlation, dtype=float))
+    z = rng.standard_normal((n_paths, 3)) @ chol.T
+    idio = rng.standard_normal((n_paths, growth.shape[0]))
+
+    growth_shock = np.sqrt(growth_persistence) * z[:, :1] + np.sqrt(1 - growth_persistence) * idio
+    sampled_growth = np.maximum(growth + growth_vol * growth_shock, -95.0)
+    sampled_margin = margin_improvement + margin_vol * z[:, 1]
+    sampled_pe = np.maximum(pe_multiple + pe_vol * z[:, 2], 1.0)
+    return sampled_growth, sampled_margin, sampled_pe
+
+
+def monte_carlo(revenue, profit, growth, margin_improvement, pe_multiple,
+                equity_dilution=0, interest_payment=0.0, n_paths=100_000,
+                growth_vol=10.0, margin_vol=1.0, pe_vol=3.0,
+                correlation=DEFAULT_CORRELATION, growth_persistence=0.5,
+                seed=0, percentiles=PERCENTILES, events=()):
+    """
+    シミュレーターのモンテカルロ実行。
+
+    growth は年別の成長率（%）の平均。希薄化は1年目に発生する。events は資金調達イベント
+    （simulation.run_scenarios と同じ形式）で、指定するとパスごとに反映する
+    （希薄化を企業価値から決める株式調達では、持株比率もパスごとに変わる）。
+    戻り値の "company_value" / "owner_value" / "revenue" / "profit" は
+    shape (len(percentiles), 年数+1) のパーセンタイル帯、"*_mean" は年別平均。
+    "equity" は持株比率で、events がなければ (年数+1,)、あればパーセンタイル帯。
+    """
+    growth = np.asarray(growth, dtype=float)
+    horizon = growth.shape[0]
+
+    sampled_growth, sampled_margin, sampled_pe = sample_drivers(
+        growth, margin_improvement, pe_multiple, n_paths,
+        growth_vol=growth_vol, margin_vol=margin_vol, pe_vol=pe_vol,
+        correlation=correlation, growth_persistence=growth_persistence, seed=seed,
+    )
+
+    equity = np.full(horizon + 1, 100.0)
+    equity[1:] *= 1 - equity_dilution / 100
+
+    if events:
+        events = list(events)
+        if equity_dilution:
+            events.insert(0, {"kind": "equity", "year": 1, "dilution": equity_dilution})
+        paths = run_scenarios(revenue, profit, sampled_growth, sampled_margin, sampled_pe,
+                              events=events, interest_payment=interest_payment)
+        paths = {key: paths[key] for key in ("revenue", "profit", "company_value", "owner_value", "equity")}
+        equity = None
+    else:
+        paths = project_paths(revenue, profit, sampled_growth, sampled_margin, sampled_pe,
+                              equity, interest_payment=interest_payment)
+    # 現在の企業価値は不確実性のない想定PERで評価する
+    paths["company_value"][:, 0] = profit * pe_multiple
+    paths["owner_value"][:, 0] = profit * pe_multiple
+
+    result = {
+        "years": np.arange(horizon + 1),
+        "percentiles": np.asarray(percentiles, dtype=float),
+        "n_paths": n_paths,
+    }
+    if equity is not None:
+        result["equity"] = equity
+    for key, values in paths.items():
+        result[key] = np.percentile(values, percentiles, axis=0)
+        result[f"{key}_mean"] = values.mean(axis=0)
+    final_owner = paths["owner_value"][:, -1]
+    result["prob_owner_value_down"] = float(np.mean(final_owner < paths["owner_value"][:, 0]))
+    return result
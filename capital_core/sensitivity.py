@@ -0,0 +1,38 @@
+"""
+WACC × 永続成長率の感度分析
+
+グリッド全体をブロードキャストで一度に計算する。WACC ≤ 永続成長率の点は
+ゴードン成長モデルが成立しないため NaN（マスク）として返す。
+"""
+
+import numpy as np
+
+from .dcf import DCF_YEARS
+
+
+def sensitivity_surface(final_year_fcf, fcf_pv, net_debt, wacc_values, growth_values,
+                        years=DCF_YEARS):
+    """
+    株式価値の感度面を計算する（単位：百万円）。
+
+    予測期間FCFの現在価値（fcf_pv）は固定し、継続価値だけを各 (g, WACC) で再計算する。
+    戻り値は shape (len(growth_values), len(wacc_values)) の配列。
+    """
+    w = np.asarray(wacc_values, dtype=float)[None, :]
+    g = np.asarray(growth_values, dtype=float)[:, None]
+
+    spread = w - g
+    valid = spread > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tv = final_year_fcf * (1 + g / 100) / (spread / 100)
+        pv_tv = tv / (1 + w / 100) ** years
+    return np.where(valid, fcf_pv + pv_tv - net_debt, np.nan)
+
+
+def sensitivity_axes(wacc, perpetual_growth, resolution=200, wacc_span=3.0,
+                     growth_bounds=(0.0, 5.0)):
+    """現在のWACCを中心にした感度面の軸（WACC, 永続成長率）を作る。"""
+    wacc_values = np.linspace(wacc - wacc_span, wacc + wacc_span, resolution)
+    low, high = growth_bounds
+    growth_values = np.linspace(min(low, perpetual_growth), max(high, perpetual_growth), resolution)
+    return wacc_values, growth_values
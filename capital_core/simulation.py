@@ -0,0 +1,202 @@
+"""
+シミュレーター（タブ3）の決定論的な推移計算
+
+任意の年数を年次または月次の刻みで計算し、株式調達・融資・返済の資金調達イベントを
+時点ごとに反映する。シナリオは配列の行にまとめ、全シナリオを一度に計算する。
+"""
+
+import numpy as np
+
+from .captable import ROUND_TERMS, build_cap_table, exit_waterfall
+
+EVENT_KINDS = ("equity", "loan", "repayment")
+
+# 計算の刻み（1年あたりのステップ数）
+STEPS_PER_YEAR = {"年次": 1, "月次": 12}
+
+
+def _event_step(event, steps_per_year, steps):
+    step = int(round(float(event["year"]) * steps_per_year))
+    if not 0 <= step <= steps:
+        raise ValueError(f"資金調達イベントの時期（{event['year']}年）が期間の外です")
+    return step
+
+
+def _piecewise(segments, bounds, steps):
+    """
+    イベントの間で一定の値を (S, ステップ数+1) に広げる。segments は区間ごとの (S,) の値
+    （最初のイベントの前から順に）、bounds は各イベントのステップ（昇順）。
+    """
+    lengths = np.diff([0, *bounds, steps + 1])
+    return np.repeat(np.column_stack(segments), lengths, axis=1)
+
+
+def run_scenarios(revenue, profit, growth, margin_improvement, pe_multiple,
+                  events=(), steps_per_year=1, interest_payment=0.0):
+    """
+    S本のシナリオの推移を一括で計算する（単位：百万円・%）。
+
+    growth は (S, Y) または (Y,) の年別成長率で、Y 年分を steps_per_year（1で年次、12で月次）の
+    刻みで計算する。revenue / profit / margin_improvement / pe_multiple はスカラーか (S,)。
+    売上・利益・企業価値は各時点の年換算値で、年の区切りでは年次の計算と同じ値になる。
+
+    events は資金調達イベント（辞書）の並びで、year の早い順に処理する。
+      {"kind": "equity", "year": 1, "amount": 100, "dilution": 20}
+          株式調達。dilution（%）を省略すると、その時点の企業価値をプレマネーとして
+          amount / (企業価値 + amount) だけ希薄化する。優先株の条件（captable.ROUND_TERMS）を
+          付けたイベントがあれば、持分価値は各時点のキャップテーブルで企業価値を売却額とした
+          ウォーターフォールの創業者の受取額（0以上）、持株比率はプールを含む完全希薄化ベースになる
+      {"kind": "loan", "year": 0, "amount": 100, "rate": 2.0}
+          融資。次の時点から年利分を利益から差し引く
+      {"kind": "repayment", "year": 2, "amount": 50}
+          返済。融資の残高（と利息）を按分して減らす
+    amount / dilution / rate はスカラーか (S,)。interest_payment は毎年の利益から差し引く固定額。
+
+    戻り値の "time" は各時点の経過年数 (K+1,)、それ以外は (S, K+1) の配列
+    （revenue / profit / company_value / equity / owner_value / debt / funding（累計調達額））。
+    列0が現在。
+    """
+    growth = np.atleast_2d(np.asarray(growth, dtype=float))
+    revenue, profit, margin_improvement, pe_multiple = (
+        np.atleast_1d(np.asarray(a, dtype=float)) for a in (revenue, profit, margin_improvement, pe_multiple)
+    )
+    n = np.broadcast_shapes(growth.shape[:1], revenue.shape, profit.shape,
+                            margin_improvement.shape, pe_multiple.shape)[0]
+    growth = np.broadcast_to(growth, (n, growth.shape[1]))
+    revenue, profit, margin_improvement, pe_multiple = (
+        np.broadcast_to(a, (n,)) for a in (revenue, profit, margin_improvement, pe_multiple)
+    )
+    steps = growth.shape[1] * steps_per_year
+    time = np.arange(steps + 1) / steps_per_year
+
+    # 月次は年率の成長を各月に均等に配分する
+    factor = 1 + growth / 100
+    if steps_per_year > 1:
+        factor = np.repeat(factor ** (1 / steps_per_year), steps_per_year, axis=1)
+
+    out_revenue = np.empty((n, steps + 1))
+    out_revenue[:, 0] = revenue
+    np.cumprod(factor, axis=1, out=out_revenue[:, 1:])
+    out_revenue[:, 1:] *= revenue[:, None]
+
+    events = sorted(events, key=lambda event: float(event["year"]))
+    for event in events:
+        if event["kind"] not in EVENT_KINDS:
+            raise ValueError(f"不明な資金調達イベントです: {event['kind']}")
+    event_steps = [_event_step(event, steps_per_year, steps) for event in events]
+    amounts = [np.broadcast_to(np.asarray(event.get("amount", 0.0), dtype=float), (n,)) for event in events]
+
+    # 融資の残高と年あたりの利息は、イベントの間は一定なので区間ごとに計算して広げる
+    debt_index = [i for i, event in enumerate(events) if event["kind"] != "equity"]
+    if debt_index:
+        balance, charge = np.zeros(n), np.zeros(n)
+        balances, charges = [balance], [charge]
+        for i in debt_index:
+            if events[i]["kind"] == "loan":
+                rate = np.broadcast_to(np.asarray(events[i].get("rate", 0.0), dtype=float), (n,))
+                balance = balance + amounts[i]
+                charge = charge + amounts[i] * rate / 100
+            else:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    remaining = np.where(balance > 0, np.clip(1 - amounts[i] / balance, 0.0, 1.0), 1.0)
+                balance, charge = balance * remaining, charge * remaining
+            balances.append(balance)
+            charges.append(charge)
+        bounds = [event_steps[i] for i in debt_index]
+        debt = _piecewise(balances, bounds, steps)
+        interest = _piecewise(charges, bounds, steps)
+    else:
+        debt = interest = None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        current_margin = np.where(revenue > 0, profit / np.where(revenue > 0, revenue, 1.0), 0.0)
+    out_profit = np.empty_like(out_revenue)
+    out_profit[:, 0] = profit
+    out_profit[:, 1:] = out_revenue[:, 1:] * (current_margin[:, None] + margin_improvement[:, None] * time[1:] / 100)
+    if np.any(interest_payment):
+        out_profit[:, 1:] -= interest_payment
+    if interest is not None:
+        # 利息は前の時点の残高にかかる
+        out_profit[:, 1:] -= interest[:, :-1]
+
+    # 企業価値 = 利益 × PER、経営者の持分価値 = 企業価値 × 持株比率
+    company_value = out_profit * pe_multiple[:, None]
+    equity_index = [i for i, event in enumerate(events) if event["kind"] == "equity"]
+    if equity_index:
+        share = np.full(n, 100.0)
+        shares, dilutions = [share], []
+        for i in equity_index:
+            k = event_steps[i]
+            if events[i].get("dilution") is not None:
+                dilution = np.broadcast_to(np.asarray(events[i]["dilution"], dtype=float), (n,))
+            else:
+                post_money = np.maximum(company_value[:, k], 0.0) + amounts[i]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    dilution = np.where(post_money > 0, amounts[i] / post_money * 100, 0.0)
+            share = share * (1 - dilution / 100)
+            shares.append(share)
+            dilutions.append(dilution)
+        equity = _piecewise(shares, [event_steps[i] for i in equity_index], steps)
+    else:
+        equity = np.full((n, steps + 1), 100.0)
+
+    # 累計調達額（融資と株式調達。返済では減らさない）
+    raised = np.zeros(n)
+    totals = [raised]
+    for event, amount in zip(events, amounts):
+        if event["kind"] != "repayment":
+            raised = raised + amount
+        totals.append(raised)
+    funding = _piecewise(totals, event_steps, steps)
+    if debt is None:
+        debt = np.zeros((n, steps + 1))
+
+    owner_value = company_value * (equity / 100)
+    if any(key in events[i] for i in equity_index for key in ROUND_TERMS):
+        # ラウンドの間はキャップテーブルが変わらないので、区間ごとに売却額の配列をまとめて分配する
+        # 調達額・希薄化がシナリオ共通ならスカラーのまま渡す（折れ点が共通になり速い）
+        rounds = [events[i] if events[i].get("dilution") is not None else {**events[i], "dilution": dilution}
+                  for i, dilution in zip(equity_index, dilutions)]
+        bounds = [0] + [event_steps[i] for i in equity_index] + [steps + 1]
+        for j in range(len(rounds) + 1):
+            start, stop = bounds[j], bounds[j + 1]
+            if start == stop:
+                continue
+            waterfall = exit_waterfall(build_cap_table(rounds[:j]), company_value[:, start:stop].T)
+            owner_value[:, start:stop] = waterfall["payout"][0].T
+            equity[:, start:stop] = waterfall["ownership"][0][..., None]
+
+    return {
+        "time": time,
+        "revenue": out_revenue,
+        "profit": out_profit,
+        "company_value": company_value,
+        "equity": equity,
+        "owner_value": owner_value,
+        "debt": debt,
+        "funding": funding,
+    }
+
+
+def simulate(revenue, profit, growth, margin_improvement, pe_multiple,
+             equity_dilution=0, interest_payment=0.0, events=(), steps_per_year=1):
+    """
+    1本のシナリオの推移を計算する（単位：百万円・%）。
+
+    growth は年別の成長率。equity_dilution は1年目に発生する希薄化、interest_payment は
+    毎年の利益から差し引く利息で、events（run_scenarios と同じ形式）と併用できる。
+    戻り値の各配列は長さ ステップ数+1 で、要素0が現在。"time" は経過年数、
+    "year_num" はステップ番号（年次なら経過年数と同じ）。
+    """
+    events = list(events)
+    if equity_dilution:
+        events.insert(0, {"kind": "equity", "year": 1, "dilution": equity_dilution})
+    paths = run_scenarios(revenue, profit, growth, margin_improvement, pe_multiple,
+                          events=events, steps_per_year=steps_per_year, interest_payment=interest_payment)
+    result = {key: values if key == "time" else values[0] for key, values in paths.items()}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["profit_margin"] = np.where(
+            result["revenue"] > 0, result["profit"] / result["revenue"] * 100, 0.0
+        )
+    result["year_num"] = np.arange(result["time"].shape[0])
+    return result
@@ -0,0 +1,155 @@
+"""
+シナリオスイープ（タブ4）
+
+調達額 × 希薄化率 × 成長率の倍率 × PER の全組み合わせを一度に評価し、
+経営者の持分価値・持株比率・調達額のパレートフロンティアと上位k件を求める。
+"""
+
+import numpy as np
+
+from .captable import build_cap_table, exit_waterfall
+
+SWEEP_AXES = ("funding", "dilution", "growth_multiplier", "pe_multiple")
+
+# パレートフロンティアの目的（すべて大きいほど良い）
+FRONTIER_OBJECTIVES = ("owner_value", "equity", "funding")
+
+# 希薄化なしの調達（融資）の金利（%、タブ3の銀行融資と同じ既定値）
+DEFAULT_INTEREST_RATE = 2.0
+
+# 融資で借りられる上限（経常利益の何年分か。銀行の債務償還年数の目安）
+DEFAULT_MAX_DEBT_YEARS = 10
+
+
+def sweep_scenarios(revenue, profit, base_growth, funding, dilution, growth_multiplier, pe_multiple,
+                    interest_rate=DEFAULT_INTEREST_RATE, valuation_cap=1.0,
+                    max_debt_years=DEFAULT_MAX_DEBT_YEARS, terms=None):
+    """
+    4つの軸の全組み合わせを評価する（単位：百万円・%）。
+
+    base_growth は (T,) の基本ケースの年別成長率、各軸は1次元配列。
+    企業価値はタブ4の標準シナリオ比較（compare_scenarios）と同じく最終年利益 × PER。
+    調達額と希薄化率は次のように結びつける。
+      - 希薄化なしの調達は融資とみなし、タブ3と同じく利息を毎年の利益から差し引く。
+        借入額が経常利益の max_debt_years 年分を超える組み合わせは実現不可（feasible=False）
+      - 希薄化ありの調達は株式調達とみなし、投資家の評価額（調達額 × 残る持株 / 希薄化率）が
+        現在の企業価値（利益 × PER）の valuation_cap 倍を超える組み合わせと、調達額ゼロのものは実現不可
+    valuation_cap / max_debt_years に None を渡すと、その制約を付けない。
+    terms（優先株の条件の辞書、captable.ROUND_TERMS）を渡すと、compare_scenarios と同じく
+    株式調達の持分価値を企業価値で売却したときのウォーターフォールの創業者の受取額で、
+    持株比率を完全希薄化ベースで評価する（省略すると企業価値 × 残る持株）。
+
+    戻り値は軸の値と評価結果を、組み合わせ数 M = F×D×G×P の1次元配列に並べた辞書と、
+    元の格子の形 shape。
+    """
+    base_growth = np.asarray(base_growth, dtype=float)
+    axes = [np.asarray(a, dtype=float).ravel() for a in (funding, dilution, growth_multiplier, pe_multiple)]
+    shape = tuple(len(a) for a in axes)
+    # 各軸を (F, D, G, P) の格子に並ぶ形にする
+    funding, dilution, growth_multiplier, pe_multiple = (
+        a.reshape([-1 if i == axis else 1 for i in range(4)]) for axis, a in enumerate(axes)
+    )
+
+    margin = profit / revenue if revenue > 0 else 0.0
+    final_revenue = revenue * np.prod(1 + growth_multiplier[..., None] * base_growth / 100, axis=-1)
+    interest = np.where(dilution == 0, funding * interest_rate / 100, 0.0)
+    final_profit = final_revenue * margin - interest
+    company_value = final_profit * pe_multiple
+    if terms is None:
+        equity = 100 - dilution
+        owner_value = company_value * (equity / 100)
+    else:
+        # キャップテーブルは (F, D) の格子で作り、企業価値の (F, 1, G, P) と広げて分配する
+        issued = dilution > 0
+        round_ = {**terms, "amount": np.where(issued, funding, 0.0), "dilution": dilution}
+        if terms.get("option_pool") is not None:
+            round_["option_pool"] = np.where(issued, terms["option_pool"], 0.0)
+        waterfall = exit_waterfall(build_cap_table([round_]), company_value)
+        owner_value = waterfall["payout"][0]
+        equity = waterfall["ownership"][0]
+
+    # 調達額ゼロで株式を渡す組み合わせは意味がないので除く
+    feasible = np.broadcast_to((dilution == 0) | (funding > 0), shape).copy()
+    if max_debt_years is not None:
+        feasible &= (dilution > 0) | (funding <= max(profit, 0) * max_debt_years)
+    if valuation_cap is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pre_money = np.where(dilution > 0, funding * (100 - dilution) / dilution, 0.0)
+        feasible &= (dilution == 0) | (pre_money <= valuation_cap * profit * pe_multiple)
+
+    def flat(grid):
+        return np.broadcast_to(grid, shape).reshape(-1)
+
+    return {
+        "funding": flat(funding),
+        "dilution": flat(dilution),
+        "growth_multiplier": flat(growth_multiplier),
+        "pe_multiple": flat(pe_multiple),
+        "final_revenue": flat(final_revenue),
+        "final_profit": flat(final_profit),
+        "company_value": flat(company_value),
+        "equity": flat(equity),
+        "owner_value": flat(owner_value),
+        "feasible": flat(feasible),
+        "shape": shape,
+        "count": int(np.prod(shape)),
+    }
+
+
+def pareto_front(objectives, chunk_size=1024):
+    """
+    非劣解（どの目的でも他に負けない点）のインデックスを返す。
+
+    objectives は (M, K) の配列で、すべて大きいほど良いものとする。
+    1つ目の目的の降順に並べ、チャンク単位で既存のフロンティアとの支配関係を
+    まとめて判定する。同じ値の点は最初の1つだけを残す。
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    order = np.lexsort(objectives.T[::-1] * -1)
+    front = np.empty((0, objectives.shape[1]))
+    front_index = []
+    for start in range(0, len(order), chunk_size):
+        idx = order[start:start + chunk_size]
+        points = objectives[idx]
+        # 既存のフロンティアに支配される（すべての目的で以上）点を除く
+        if len(front):
+            dominated = (front[None, :, :] >= points[:, None, :]).all(axis=2).any(axis=1)
+            idx, points = idx[~dominated], points[~dominated]
+        # チャンク内：並び順で前にある点に支配される点を除く
+        ge = (points[None, :, :] >= points[:, None, :]).all(axis=2)  # ge[i, j]: j が i を支配
+        keep = ~np.tril(ge, k=-1).any(axis=1)
+        front = np.concatenate([front, points[keep]])
+        front_index.extend(idx[keep].tolist())
+    return np.array(front_index, dtype=np.intp)
+
+
+def sweep_frontier(result):
+    """
+    スイープ結果のパレートフロンティア（持分価値・持株比率・調達額）のインデックスを、
+    持株比率の降順で返す。
+
+    実現可能な組み合わせだけが対象。持株比率と調達額が同じ組み合わせの中では
+    持分価値が最大のものしかフロンティアに乗らないため、先に (調達額, 希薄化率) ごとに
+    絞ってから判定する。
+    """
+    f, d, g, p = result["shape"]
+    owner = np.where(result["feasible"], result["owner_value"], -np.inf).reshape(f * d, g * p)
+    best = np.argmax(owner, axis=1)
+    candidates = (np.arange(f * d) * (g * p) + best)[np.isfinite(owner.max(axis=1))]
+    objectives = np.column_stack([result[name][candidates] for name in FRONTIER_OBJECTIVES])
+    front = candidates[pareto_front(objectives)]
+    return front[np.lexsort((-result["owner_value"][front], -result["equity"][front]))]
+
+
+def top_scenarios(result, k=10, key="owner_value", min_equity=None, min_funding=None):
+    """条件を満たす実現可能な組み合わせのうち key が大きい順に k 件のインデックスを返す。"""
+    values = result[key]
+    mask = result["feasible"].copy()
+    if min_equity is not None:
+        mask &= result["equity"] >= min_equity
+    if min_funding is not None:
+        mask &= result["funding"] >= min_funding
+    candidates = np.flatnonzero(mask)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-values[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-values[candidates], kind="stable")]
@@ -0,0 +1,95 @@
+"""
+企業価値算定エンジン（複数手法・一括計算）
+
+タブ1の6手法（PER法・PBR法・EBITDA倍率法・年買法・DCF法・純資産法）を
+N社分の配列に対して一度に計算する。適用できない手法は NaN になる。
+"""
+
+import numpy as np
+
+from .dcf import DCF_YEARS, compute_wacc, dcf_kernel
+from .industry import industry_table
+
+METHODS = ("PER法", "PBR法", "EBITDA倍率法", "年買法", "DCF法（詳細版）", "純資産法")
+
+
+def _as_float(x):
+    return np.asarray(x, dtype=float)
+
+
+def _multiple(override, table, codes):
+    """倍率の指定がなければ業種別の標準倍率を使う。"""
+    if override is None:
+        return table[codes]
+    return _as_float(override)
+
+
+def value_companies(revenue, profit, total_assets, total_liabilities, depreciation,
+                    industry="その他", growth_rate=0.0, per_multiple=None,
+                    pbr_multiple=None, ebitda_multiple=None, year_buy_multiple=None,
+                    dcf_years=DCF_YEARS, parameters=None):
+    """
+    N社分の財務データから全手法の企業価値を一括算定する（単位：百万円）。
+
+    各引数はスカラーまたは長さNの配列。倍率を省略すると業種別の標準倍率を使う。
+    dcf_years はDCF法の予測期間（5〜30年）。parameters は業種別パラメータのテーブル
+    （IndustryTable。省略すると現在のテーブル）で、industry に整数コードを渡すときはそのテーブルのコード。
+    戻り値は手法名・集計値（median/min/max/mean）・DCF内訳をキーに持つ辞書で、
+    値はすべて長さNの NumPy 配列。適用外の手法は NaN。
+    """
+    revenue, profit, total_assets, total_liabilities, depreciation, growth_rate = (
+        np.atleast_1d(a) for a in np.broadcast_arrays(
+            _as_float(revenue), _as_float(profit), _as_float(total_assets),
+            _as_float(total_liabilities), _as_float(depreciation), _as_float(growth_rate),
+        )
+    )
+    n = revenue.shape[0]
+    if parameters is None:
+        parameters = industry_table()
+    codes = parameters.codes(industry, size=n)
+    if codes.shape[0] != n:
+        codes = np.broadcast_to(codes, (n,))
+
+    per = _multiple(per_multiple, parameters.per, codes)
+    pbr = _multiple(pbr_multiple, parameters.pbr, codes)
+    ebitda_mult = _multiple(ebitda_multiple, parameters.ebitda, codes)
+    year_buy = _multiple(year_buy_multiple, parameters.year_buy, codes)
+
+    net_assets = total_assets - total_liabilities
+    ebitda = profit + depreciation
+
+    capital = compute_wacc(total_assets, total_liabilities, parameters.beta[codes])
+    dcf = dcf_kernel(revenue, profit, depreciation, growth_rate, capital["wacc"],
+                     net_debt=total_liabilities * 0.5,  # 簡易的に純有利子負債 = 総負債 × 50%
+                     years=dcf_years, exit_multiple=ebitda_mult)
+    dcf.update(capital)
+
+    values = np.empty((n, len(METHODS)))
+    values[:, 0] = np.where(profit > 0, profit * per, np.nan)
+    values[:, 1] = np.where(net_assets > 0, net_assets * pbr, np.nan)
+    values[:, 2] = np.where(ebitda > 0, ebitda * ebitda_mult, np.nan)
+    values[:, 3] = net_assets + profit * year_buy
+    values[:, 4] = np.where(dcf["equity_value"] > 0, dcf["equity_value"], np.nan)
+    values[:, 5] = net_assets
+
+    # ===== 集計 =====
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    # 中央値はタブ1と同じく「昇順に並べて len//2 番目」（NaNは末尾に並ぶ）
+    ordered = np.sort(values, axis=1)
+    median = np.take_along_axis(ordered, (count // 2)[:, None], axis=1)[:, 0]
+
+    result = {method: values[:, i] for i, method in enumerate(METHODS)}
+    result.update({
+        "methods": METHODS,
+        "values": values,
+        "count": count,
+        "median": median,
+        "min": np.nanmin(values, axis=1),
+        "max": np.nanmax(values, axis=1),
+        "mean": np.nansum(values, axis=1) / count,
+        "net_assets": net_assets,
+        "ebitda": ebitda,
+        "dcf": dcf,
+    })
+    return result
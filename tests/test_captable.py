@@ -0,0 +1,71 @@
+"""キャップテーブルと売却時の分配（exit_waterfall）の既知のケース。"""
+
+import numpy as np
+import pytest
+
+from capital_core import build_cap_table, exit_waterfall
+
+
+def payouts(rounds, exit_values, option_pool=0.0):
+    result = exit_waterfall(build_cap_table(rounds, option_pool=option_pool), exit_values)
+    # どの売却額でも受取額の合計は売却額に等しい
+    assert result["payout"].sum(axis=0) == pytest.approx(np.maximum(exit_values, 0.0))
+    return result
+
+
+def test_non_participating_takes_preference_or_converts():
+    exit_values = np.array([50.0, 300.0, 500.0, 1000.0])
+    result = payouts([{"name": "A", "amount": 100, "dilution": 20, "preference": 1.0}], exit_values)
+    founder, investor = result["payout"]
+    # 20% への転換が 100 を超える（売却額 500 超）までは優先分配を受け取る
+    assert investor == pytest.approx([50, 100, 100, 200])
+    assert founder == pytest.approx([0, 200, 400, 800])
+    assert result["ownership"] == pytest.approx([80, 20])
+
+
+def test_participating_with_cap():
+    exit_values = np.array([50.0, 600.0, 1200.0, 2000.0])
+    round_ = {"name": "A", "amount": 100, "dilution": 20, "preference": 1.0, "participating": True, "cap": 3.0}
+    founder, investor = payouts([round_], exit_values)["payout"]
+    # 優先分配 100 + 残りの20%、受取総額は 300 まで。転換（20%）が 300 を超えると転換する
+    assert investor == pytest.approx([50, 200, 300, 400])
+    assert founder == pytest.approx([0, 400, 900, 1600])
+
+
+def test_two_rounds_by_seniority():
+    exit_values = np.array([150.0, 250.0, 600.0, 1000.0, 5000.0])
+    rounds = [
+        {"name": "A", "amount": 100, "dilution": 20, "preference": 1.0, "seniority": 1},
+        {"name": "B", "amount": 200, "dilution": 20, "preference": 1.0, "seniority": 2},
+    ]
+    result = payouts(rounds, exit_values)
+    founder, a, b = result["payout"]
+    assert result["ownership"] == pytest.approx([64, 16, 20])
+    # B が優先。優先分配の合計に届かない売却額は B から順に支払う
+    assert b == pytest.approx([150, 200, 200, 200, 1000])
+    assert a == pytest.approx([0, 50, 100, 160, 800])
+    assert founder == pytest.approx([0, 0, 300, 640, 3200])
+
+
+def test_same_seniority_shares_preference_pro_rata():
+    rounds = [
+        {"name": "A", "amount": 100, "dilution": 20, "preference": 1.0, "seniority": 1},
+        {"name": "B", "amount": 200, "dilution": 20, "preference": 1.0, "seniority": 1},
+    ]
+    founder, a, b = payouts(rounds, np.array([150.0]))["payout"]
+    assert (founder[0], a[0], b[0]) == pytest.approx((0, 50, 100))
+
+
+def test_array_rounds_match_scalar_rounds():
+    dilution = np.array([10.0, 20.0, 30.0])
+    amount = np.array([50.0, 100.0, 150.0])
+    exit_values = np.array([400.0, 800.0, 1600.0])
+    terms = {"preference": 1.5, "participating": True, "cap": 2.5}
+    batched = exit_waterfall(
+        build_cap_table([{"amount": amount, "dilution": dilution, **terms}], option_pool=10), exit_values
+    )
+    for i in range(3):
+        single = exit_waterfall(
+            build_cap_table([{"amount": amount[i], "dilution": dilution[i], **terms}], option_pool=10), exit_values[i]
+        )
+        assert batched["payout"][:, i] == pytest.approx(single["payout"])
@@ -0,0 +1,32 @@
+"""折れ線の間引き（lttb）。"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("plotly")
+
+from capital_app.charts import lttb  # noqa: E402
+
+
+def test_lttb_keeps_endpoints_and_order():
+    rng = np.random.default_rng(1)
+    x = np.sort(rng.uniform(0, 100, 10_000))
+    y = np.cumsum(rng.normal(size=10_000))
+    for n_out in (3, 10, 500, 9_999):
+        index = lttb(x, y, n_out)
+        assert len(index) == n_out
+        assert index[0] == 0 and index[-1] == len(x) - 1
+        assert np.all(np.diff(index) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(1000)
+    y[437] = 50.0
+    assert 437 in lttb(np.arange(1000.0), y, 20)
+
+
+def test_lttb_small_outputs():
+    x = np.arange(10.0)
+    assert lttb(x, x, 10).tolist() == list(range(10))
+    assert lttb(x, x, 50).tolist() == list(range(10))
+    assert lttb(x, x, 2).tolist() == [0, 9]
@@ -0,0 +1,70 @@
+"""逆算（solve_bracketed / implied_wacc / implied_perpetual_growth / break_even_dilution）。"""
+
+import numpy as np
+import pytest
+
+from capital_core import (
+    break_even_dilution,
+    build_cap_table,
+    dcf_kernel,
+    exit_waterfall,
+    implied_perpetual_growth,
+    implied_wacc,
+    solve_bracketed,
+)
+from capital_core.goalseek import dcf_equity_value
+
+
+def test_solve_bracketed_roots():
+    target = np.array([8.0, 27.0, 2.0, 1000.0])
+    result = solve_bracketed(lambda x: x ** 3, target, 0.0, 5.0)
+    assert result["root"][:3] == pytest.approx([2.0, 3.0, 2.0 ** (1 / 3)])
+    assert result["converged"][:3].all()
+    # 区間内に解がない要素は NaN
+    assert not result["bracketed"][3]
+    assert np.isnan(result["root"][3])
+
+
+def test_solve_bracketed_probe_stays_in_bracket():
+    def func(x):
+        assert np.all((x >= 0) & (x <= 1)), "区間の外で評価した"
+        return x ** 8
+
+    # 解が上端のすぐ内側にあると、前進差分の点が上端を越えやすい
+    root = 1 - 1e-9
+    result = solve_bracketed(func, root ** 8, 0.0, 1.0)
+    assert result["root"] == pytest.approx(root)
+
+
+def test_implied_wacc_round_trip():
+    dcf = dcf_kernel([500, 1200, 300], [50, 180, 20], [15, 40, 5], [15, 30, 5], [8.0, 9.5, 6.0], [75, 100, 20])
+    wacc = np.array([6.0, 9.0, 12.0])
+    target = dcf_equity_value(wacc, dcf["fcf"], dcf["net_debt"], dcf["perpetual_growth"])
+    result = implied_wacc(dcf["fcf"], dcf["net_debt"], dcf["perpetual_growth"], target)
+    assert result["converged"].all()
+    assert result["root"] == pytest.approx(wacc, rel=1e-8)
+
+
+def test_implied_perpetual_growth_round_trip():
+    dcf = dcf_kernel([500, 1200], [50, 180], [15, 40], [15, 30], [8.0, 9.5], [75, 100])
+    growth = np.array([1.0, 2.5])
+    target = dcf_equity_value([8.0, 9.5], dcf["fcf"], dcf["net_debt"], growth)
+    assert implied_perpetual_growth(dcf["fcf"], dcf["net_debt"], [8.0, 9.5], target) == pytest.approx(growth)
+
+
+def test_break_even_dilution_pro_rata():
+    assert break_even_dilution(1000, 600) == pytest.approx(40)
+    # 希薄化なしでも届かない・企業価値が0以下は NaN
+    assert np.isnan(break_even_dilution(1000, 1200))
+    assert np.isnan(break_even_dilution(-5, 10))
+
+
+def test_break_even_dilution_waterfall_round_trip():
+    terms = {"preference": 1.0, "participating": True, "cap": 2.0, "option_pool": 10}
+    dilution = break_even_dilution(1200, 700, funding=150, terms=terms)
+    owner = exit_waterfall(build_cap_table([{"amount": 150, "dilution": dilution, **terms}]), 1200)["payout"][0]
+    assert owner == pytest.approx(700)
+    # 優先分配を差し引くと希薄化なしでも届かない
+    assert np.isnan(break_even_dilution(1000, 950, funding=100, terms={"preference": 1.0}))
+    # 上端の近くでも例外にならない
+    assert break_even_dilution(100.0, 1e-6, funding=10, terms={"preference": 1.0}) < 100
@@ -0,0 +1,27 @@
+"""パレートフロンティア（pareto_front）と総当たりの判定との一致。"""
+
+import numpy as np
+
+from capital_core.sweep import pareto_front
+
+
+def brute_force_front(objectives):
+    """どの点にも支配されない（すべて以上で1つは大きい点がない）点の値の集合。"""
+    front = set()
+    for point in objectives:
+        dominated = np.any(np.all(objectives >= point, axis=1) & np.any(objectives > point, axis=1))
+        if not dominated:
+            front.add(tuple(point))
+    return front
+
+
+def test_pareto_front_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for size, chunk_size in ((50, 1024), (500, 64), (2000, 7)):
+        # 整数にして同じ値の点も作る
+        objectives = rng.integers(0, 20, size=(size, 3)).astype(float)
+        index = pareto_front(objectives, chunk_size=chunk_size)
+        found = [tuple(p) for p in objectives[index]]
+        # 同じ値の点は1つだけ残す
+        assert len(found) == len(set(found))
+        assert set(found) == brute_force_front(objectives)
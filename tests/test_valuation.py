@@ -0,0 +1,116 @@
+"""一括算定エンジン（value_companies / dcf_kernel）と、元のタブ1の1社ずつのループとの一致。"""
+
+import numpy as np
+import pytest
+
+from capital_core import METHODS, dcf_kernel, value_companies
+
+# 元のタブ1の業種別ベータ
+INDUSTRY_BETA = {
+    "製造業": 1.0,
+    "IT・ソフトウェア": 1.3,
+    "医療・ヘルスケア": 0.9,
+    "環境・エネルギー": 1.1,
+    "小売・サービス": 0.8,
+    "建設・不動産": 1.2,
+    "その他": 1.0,
+}
+
+
+def loop_valuation(revenue, profit, total_assets, total_liabilities, depreciation, industry, growth_rate,
+                   per_multiple, pbr_multiple, ebitda_multiple, year_buy_multiple):
+    """
+    元のタブ1の算定（1社ずつ・5年分の年次ループ）。
+
+    予測売上だけは、その年の成長率を t 乗していた式を年ごとの複利（累積）に直してある。
+    """
+    net_assets = total_assets - total_liabilities
+    ebitda = profit + depreciation
+    valuations = {}
+    if profit > 0:
+        valuations["PER法"] = profit * per_multiple
+    if net_assets > 0:
+        valuations["PBR法"] = net_assets * pbr_multiple
+    if ebitda > 0:
+        valuations["EBITDA倍率法"] = ebitda * ebitda_multiple
+    valuations["年買法"] = net_assets + profit * year_buy_multiple
+
+    cost_of_equity = 0.5 + INDUSTRY_BETA.get(industry, 1.0) * 6.0
+    if total_assets > 0:
+        debt_ratio = total_liabilities / total_assets
+        equity_ratio = 1 - debt_ratio
+    else:
+        debt_ratio = 0.3
+        equity_ratio = 0.7
+    wacc = cost_of_equity * equity_ratio + 2.0 * (1 - 30 / 100) * debt_ratio
+
+    pv_fcf_total = 0
+    growth_factor = 1.0
+    for year in range(1, 6):
+        year_growth = growth_rate * (0.9 ** (year - 1))
+        growth_factor *= 1 + year_growth / 100
+        projected_revenue = revenue * growth_factor
+        profit_margin = (profit / revenue) if revenue > 0 else 0.1
+        projected_profit = projected_revenue * (profit_margin + 0.01 * year)
+        year_nopat = projected_profit * (1 - 30 / 100)
+        year_depreciation = depreciation * growth_factor
+        year_wc_change = projected_revenue * 0.02 * (year_growth / 100)
+        year_fcf = year_nopat + year_depreciation - year_wc_change - year_depreciation * 1.2
+        pv_fcf_total += year_fcf / (1 + wacc / 100) ** year
+
+    perpetual_growth_rate = min(2.5, growth_rate * 0.3)
+    if wacc > perpetual_growth_rate:
+        terminal_value = year_fcf * (1 + perpetual_growth_rate / 100) / ((wacc - perpetual_growth_rate) / 100)
+        pv_terminal_value = terminal_value / (1 + wacc / 100) ** 5
+    else:
+        pv_terminal_value = year_fcf * ebitda_multiple / (1 + wacc / 100) ** 5
+    dcf_equity_value = pv_fcf_total + pv_terminal_value - total_liabilities * 0.5
+    if dcf_equity_value > 0:
+        valuations["DCF法（詳細版）"] = dcf_equity_value
+    valuations["純資産法"] = net_assets
+
+    values = sorted(valuations.values())
+    return valuations, wacc, values[len(values) // 2]
+
+
+COMPANIES = [
+    # revenue, profit, total_assets, total_liabilities, depreciation, industry, growth_rate
+    (500, 50, 300, 150, 15, "製造業", 15),
+    (1200, 180, 900, 200, 40, "IT・ソフトウェア", 35),
+    (80, -5, 60, 90, 3, "小売・サービス", 0),
+    (0, 0, 0, 0, 0, "その他", 5),
+    (3000, 120, 2500, 2400, 100, "建設・不動産", 60),
+    (250, 30, 200, 80, 8, "医療・ヘルスケア", 8),
+]
+
+
+def test_value_companies_matches_loop():
+    columns = list(zip(*COMPANIES))
+    multiples = dict(per_multiple=14.0, pbr_multiple=1.1, ebitda_multiple=6.0, year_buy_multiple=4.0)
+    result = value_companies(*columns[:5], industry=np.array(columns[5]), growth_rate=columns[6],
+                             dcf_years=5, **multiples)
+    for i, company in enumerate(COMPANIES):
+        expected, wacc, median = loop_valuation(*company, **multiples)
+        for method in METHODS:
+            if method in expected:
+                assert result[method][i] == pytest.approx(expected[method], rel=1e-12, abs=1e-9), method
+            else:
+                assert np.isnan(result[method][i]), method
+        assert result["dcf"]["wacc"][i] == pytest.approx(wacc, rel=1e-12)
+        assert result["median"][i] == pytest.approx(median, rel=1e-12)
+        assert result["count"][i] == len(expected)
+
+
+def test_dcf_kernel_revenue_compounds_year_by_year():
+    result = dcf_kernel(100, 10, 5, 40, 8, 0, years=30)
+    revenue = result["revenue"][0]
+    assert np.all(np.diff(revenue) > 0)
+    growth = 40 * 0.9 ** np.arange(30)
+    assert revenue == pytest.approx(100 * np.cumprod(1 + growth / 100))
+
+
+def test_dcf_kernel_rejects_out_of_range_years():
+    with pytest.raises(ValueError):
+        dcf_kernel(100, 10, 5, 10, 8, 0, years=4)
+    with pytest.raises(ValueError):
+        dcf_kernel(100, 10, 5, 10, 8, 0, years=31)